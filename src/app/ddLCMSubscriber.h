@@ -11,6 +11,7 @@
 #include <QMutexLocker>
 #include <QWaitCondition>
 #include <QTime>
+#include <QQueue>
 
 #include <lcm/lcm-cpp.hpp>
 
@@ -35,6 +36,9 @@ public:
     this->mEmitMessages = true;
     this->mNotifyAllMessages = false;
     this->mRequiredElapsedMilliseconds = 0;
+    this->mDroppedMessages = 0;
+    this->mLastMessageReceiveUtime = 0;
+    this->mDeliveredMessageReceiveUtime = 0;
     this->mTimer.start();
     this->connect(this, SIGNAL(messageReceivedInQueue(const QString&)), SLOT(onMessageInQueue(const QString&)));
   }
@@ -106,6 +110,41 @@ public:
     return this->mFPSCounter.averageFPS();
   }
 
+  // Returns the number of messages that were replaced by a newer message
+  // before the main thread received them.  Messages are only dropped when
+  // notifyAllMessagesIsEnabled() is false.
+  int getDroppedMessageCount() const
+  {
+    QMutexLocker locker(&this->mMutex);
+    return this->mDroppedMessages;
+  }
+
+  // Returns the time, in seconds since the epoch, at which the message last
+  // emitted by messageReceived() arrived on the LCM thread, or 0 if it is
+  // not known.  This is meant to be called once from each messageReceived()
+  // slot.  When notifyAllMessagesIsEnabled() is true the arrival times are
+  // queued and each call returns the next one.
+  double takeMessageReceiveTime()
+  {
+    QMutexLocker locker(&this->mMutex);
+
+    qint64 receiveUtime = 0;
+    if (this->mNotifyAllMessages)
+    {
+      if (!this->mReceiveUtimes.isEmpty())
+      {
+        receiveUtime = this->mReceiveUtimes.dequeue();
+      }
+    }
+    else
+    {
+      receiveUtime = this->mDeliveredMessageReceiveUtime;
+      this->mDeliveredMessageReceiveUtime = 0;
+    }
+
+    return receiveUtime * 1e-6;
+  }
+
   QByteArray getNextMessage(int timeout)
   {
 
@@ -117,6 +156,7 @@ public:
 
     if (msg.size())
     {
+      this->mDeliveredMessageReceiveUtime = this->mLastMessageReceiveUtime;
       return msg;
     }
 
@@ -129,6 +169,7 @@ public:
 
     msg = this->mLastMessage;
     this->mLastMessage.clear();
+    this->mDeliveredMessageReceiveUtime = this->mLastMessageReceiveUtime;
 
     return msg;
   }
@@ -166,13 +207,26 @@ protected:
 
         if (this->mNotifyAllMessages)
         {
+          this->mMutex.lock();
+          this->mReceiveUtimes.enqueue(rbuf->recv_utime);
+          while (this->mReceiveUtimes.size() > mMaxQueuedReceiveUtimes)
+          {
+            this->mReceiveUtimes.dequeue();
+          }
+          this->mMutex.unlock();
+
           emit this->messageReceived(messageBytes, QString(channel.c_str()));
         }
         else
         {
           this->mMutex.lock();
           bool doEmit = !this->mLastMessage.size();
+          if (!doEmit)
+          {
+            ++this->mDroppedMessages;
+          }
           this->mLastMessage = messageBytes;
+          this->mLastMessageReceiveUtime = rbuf->recv_utime;
           this->mMutex.unlock();
 
           if (doEmit)
@@ -187,6 +241,7 @@ protected:
     {
       this->mMutex.lock();
       this->mLastMessage = messageBytes;
+      this->mLastMessageReceiveUtime = rbuf->recv_utime;
       this->mMutex.unlock();
       this->mWaitCondition.wakeAll();
     }
@@ -196,9 +251,14 @@ protected:
   bool mEmitMessages;
   bool mNotifyAllMessages;
   int mRequiredElapsedMilliseconds;
+  int mDroppedMessages;
   mutable QMutex mMutex;
   QWaitCondition mWaitCondition;
   QByteArray mLastMessage;
+  qint64 mLastMessageReceiveUtime;
+  qint64 mDeliveredMessageReceiveUtime;
+  QQueue<qint64> mReceiveUtimes;
+  static const int mMaxQueuedReceiveUtimes = 10000;
   ddFPSCounter mFPSCounter;
   QTime mTimer;
   QString mChannel;
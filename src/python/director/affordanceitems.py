@@ -211,6 +211,7 @@ class MeshAffordanceItem(AffordanceItem):
     _meshManager = None
 
     def __init__(self, name, view):
+        self.meshAddedCallbackId = None
         AffordanceItem.__init__(self, name, vtk.vtkPolyData(), view)
         self.setProperty('Collision Enabled', False)
 
@@ -234,6 +235,13 @@ class MeshAffordanceItem(AffordanceItem):
         else:
             polyData = self.getMeshManager().get(filename)
 
+        # a mesh that is still being received replaces the placeholder
+        # when it is ready
+        if not polyData and self.getMeshManager().isPending(filename):
+            self._connectMeshAdded()
+        else:
+            self._disconnectMeshAdded()
+
         if not polyData:
             if not os.path.isabs(filename):
                 filename = os.path.join(director.getDRCBaseDir(), filename)
@@ -259,6 +267,23 @@ class MeshAffordanceItem(AffordanceItem):
 
         self.setPolyData(polyData)
 
+    def _connectMeshAdded(self):
+        if self.meshAddedCallbackId is None:
+            self.meshAddedCallbackId = self.getMeshManager().connectMeshAdded(self._onMeshAdded)
+
+    def _disconnectMeshAdded(self):
+        if self.meshAddedCallbackId is not None:
+            self.getMeshManager().disconnectMeshAdded(self.meshAddedCallbackId)
+            self.meshAddedCallbackId = None
+
+    def _onMeshAdded(self, meshId):
+        if meshId == self.getProperty('Filename'):
+            self.updateGeometryFromProperties()
+
+    def onRemoveFromObjectModel(self):
+        AffordanceItem.onRemoveFromObjectModel(self)
+        self._disconnectMeshAdded()
+
     @classmethod
     def getMeshManager(cls):
         if cls._meshManager is None:
@@ -133,15 +133,7 @@ def assimpMeshToPolyData(mesh):
 
     points = vnp.getVtkPointsFromNumpy(verts)
 
-    cells = vtk.vtkCellArray()
-
-    for i in xrange(nfaces):
-        face = faces[i]
-        tri = vtk.vtkTriangle()
-        tri.GetPointIds().SetId(0, face[0])
-        tri.GetPointIds().SetId(1, face[1])
-        tri.GetPointIds().SetId(2, face[2])
-        cells.InsertNextCell(tri)
+    cells = vnp.getVtkCellArrayFromNumpyCells(faces)
 
     polyData = vtk.vtkPolyData()
     polyData.SetPoints(points)
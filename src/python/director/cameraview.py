@@ -109,6 +109,7 @@ class ImageManager(object):
     def __init__(self):
 
         self.images = {}
+        self.imageBuffers = {}
         self.imageUtimes = {}
         self.textures = {}
         self.imageRotations180 = {}
@@ -130,23 +131,33 @@ class ImageManager(object):
 
         self.imageUtimes[name] = 0
         self.images[name] = image
+        self.imageBuffers[name] = [vtk.vtkImageData(), vtk.vtkImageData()]
         self.textures[name] = tex
         self.imageRotations180[name] = False
 
     def writeImage(self, imageName, outFile):
+        image = self.images[imageName]
+        if self.imageRotations180[imageName]:
+            image = filterUtils.rotateImage180(image)
         writer = vtk.vtkPNGWriter()
-        writer.SetInputData(self.images[imageName])
+        writer.SetInputData(image)
         writer.SetFileName(outFile)
         writer.Write()
 
     def updateImage(self, imageName):
+        '''
+        Receives a new frame, if there is one, into the back buffer of the
+        image and then swaps it to the front.  The image shares the pixels
+        of the front buffer, so the frame currently displayed is never
+        written to and is not copied.
+        '''
         imageUtime = self.queue.getCurrentImageTime(imageName)
         if imageUtime != self.imageUtimes[imageName]:
-            image = self.images[imageName]
-            self.imageUtimes[imageName] = self.queue.getImage(imageName, image)
-
-            if self.imageRotations180[imageName]:
-                self.images[imageName].ShallowCopy(filterUtils.rotateImage180(image))
+            buffers = self.imageBuffers[imageName]
+            backBuffer = buffers[0]
+            self.imageUtimes[imageName] = self.queue.getImage(imageName, backBuffer)
+            self.images[imageName].ShallowCopy(backBuffer)
+            buffers.reverse()
 
         return imageUtime
 
@@ -155,9 +166,22 @@ class ImageManager(object):
             self.updateImage(imageName)
 
     def setImageRotation180(self, imageName):
+        '''
+        Displays the image rotated by 180 degrees.  The pixels are not
+        rotated, instead the texture coordinates are flipped and image views
+        flip the image actor, see getImageRotation180().
+        '''
         assert imageName in self.images
         self.imageRotations180[imageName] = True
 
+        t = vtk.vtkTransform()
+        t.Translate(1.0, 1.0, 0.0)
+        t.Scale(-1.0, -1.0, 1.0)
+        self.textures[imageName].SetTransform(t)
+
+    def getImageRotation180(self, imageName):
+        return self.imageRotations180[imageName]
+
     def hasImage(self, imageName):
         return imageName in self.images
 
@@ -362,6 +386,9 @@ class CameraView(object):
 
         updated = False
         for imageName, lastUtime in self.updateUtimes.iteritems():
+            sphereObj = self.sphereObjects.get(imageName)
+            if sphereObj and not sphereObj.getProperty('Visible'):
+                continue
             currentUtime = self.imageManager.updateImage(imageName)
             if currentUtime != lastUtime:
                 self.updateUtimes[imageName] = currentUtime
@@ -442,7 +469,7 @@ class ImageWidget(object):
 
     def setImageName(self, imageName):
         self.imageName = imageName
-        self.flip.SetInputData(imageManager.getImage(imageName))
+        self.flip.SetInputData(self.imageManager.getImage(imageName))
 
     def setOpacity(self, opacity=1.0):
         self.imageWidget.GetRepresentation().GetImageProperty().SetOpacity(opacity)
@@ -470,6 +497,9 @@ class ImageWidget(object):
         currentUtime = self.imageManager.updateImage(self.imageName)
         if currentUtime != self.updateUtime:
             self.updateUtime = currentUtime
+
+            # a flip of axis 1 after a 180 degree rotation is a flip of axis 0
+            self.flip.SetFilteredAxis(0 if self.imageManager.getImageRotation180(self.imageName) else 1)
             self.flip.Update()
             self.view.render()
 
@@ -502,6 +532,10 @@ class CameraImageView(object):
         worldPoint = [0.0, 0.0, 0.0, 0.0]
         vtk.vtkInteractorObserver.ComputeDisplayToWorld(self.view.renderer(), displayPoint[0], displayPoint[1], 0, worldPoint)
 
+        rotation = self.imageActor.GetUserTransform()
+        if rotation:
+            worldPoint[:3] = rotation.GetLinearInverse().TransformPoint(worldPoint[:3])
+
         imageDimensions = self.getImage().GetDimensions()
 
         if 0.0 <= worldPoint[0] <= imageDimensions[0] and 0.0 <= worldPoint[1] <= imageDimensions[1] or not restrictToImageDimensions:
@@ -509,6 +543,16 @@ class CameraImageView(object):
         else:
             return None
 
+    def getImagePixelViewPoint(self, imagePixel):
+        '''
+        Returns the point in the view at which the given image pixel is
+        drawn.  This is the inverse of getImagePixel() and differs from the
+        pixel when the image actor is rotated.
+        '''
+        rotation = self.imageActor.GetUserTransform()
+        if rotation:
+            return list(rotation.TransformPoint(imagePixel))
+        return list(imagePixel)
 
     def getWorldPositionAndRay(self, imagePixel, imageUtime=None):
         '''
@@ -624,8 +668,26 @@ class CameraImageView(object):
         self.updateUtime = 0
         self.imageActor.SetInputData(self.imageManager.getImage(self.imageName))
         self.imageActor.SetVisibility(False)
+        self.imageActor.SetUserTransform(None)
         self.view.render()
 
+    def updateImageRotation(self):
+        '''
+        Rotates the image actor by 180 degrees about the image center if the
+        image manager displays the image rotated.
+        '''
+        if not self.imageManager.getImageRotation180(self.imageName):
+            self.imageActor.SetUserTransform(None)
+            return
+
+        imageWidth, imageHeight, _ = self.getImage().GetDimensions()
+        t = vtk.vtkTransform()
+        t.PostMultiply()
+        t.Translate(-(imageWidth - 1)/2.0, -(imageHeight - 1)/2.0, 0.0)
+        t.RotateZ(180)
+        t.Translate((imageWidth - 1)/2.0, (imageHeight - 1)/2.0, 0.0)
+        self.imageActor.SetUserTransform(t)
+
     def initImageColorMap(self):
 
         self.depthImageColorByRange = self.getImage().GetScalarRange()
@@ -663,6 +725,7 @@ class CameraImageView(object):
                 if self.useImageColorMap:
                     self.initImageColorMap()
 
+                self.updateImageRotation()
                 self.imageActor.SetVisibility(True)
                 self.resetCamera()
                 self.imageInitialized = True
@@ -1,16 +1,93 @@
 import director.vtkAll as vtk
 import director.vtkNumpy as vnp
+from director import transformUtils
 import drc as lcmdrc
 import maps as lcmmaps
 import numpy as np
 import time
 
+
+class DepthMap(object):
+    '''
+    A depth or height map image from the map server.  image is an array of
+    shape (height, width) that views the scalars of imageData, and transform
+    is the 4x4 numpy array that maps local coordinates to image coordinates
+    (column, row, depth).
+    '''
+
+    def __init__(self, viewId, mapId, image, transform, imageData=None):
+        self.viewId = viewId
+        self.mapId = mapId
+        self.image = image
+        self.transform = transform
+        self.imageData = imageData
+        self._points = None
+
+    def getPoints(self):
+        '''
+        Returns an array of shape (height, width, 3) with the local point of
+        each pixel, nan for pixels without a finite depth.  The points are
+        computed on the first call and reused afterwards.
+        '''
+        if self._points is None:
+            height, width = self.image.shape
+            rows, cols = np.mgrid[0:height, 0:width]
+            depth = np.where(np.isfinite(self.image), self.image, np.nan)
+            imagePoints = np.dstack((cols, rows, depth, np.ones((height, width))))
+
+            # apply the inverse transform in homogeneous coordinates so that
+            # perspective depth maps are handled as well as height maps
+            points = np.dot(imagePoints, np.linalg.inv(self.transform).T)
+            self._points = points[:,:,:3] / points[:,:,3:]
+
+        return self._points
+
+
+class DepthMapCache(object):
+    '''
+    Reads depth maps from a vtkMapServerSource and caches the newest map of
+    each view, so repeated requests for the same map id are free.  The
+    cached arrays are shared between callers and must not be modified.
+    '''
+
+    def __init__(self, source):
+        self.source = source
+        self.depthMaps = {}
+
+    def getDepthMap(self, viewId):
+
+        mapId = self.source.GetCurrentMapId(viewId)
+        if mapId < 0:
+            return None
+
+        depthMap = self.depthMaps.get(viewId)
+        if depthMap is not None and depthMap.mapId == mapId:
+            return depthMap
+
+        depthImage = vtk.vtkImageData()
+        transform = vtk.vtkTransform()
+        self.source.GetDataForMapId(viewId, mapId, depthImage, transform)
+
+        dims = depthImage.GetDimensions()
+        image = vnp.getNumpyFromVtk(depthImage, 'ImageScalars').reshape(dims[1], dims[0])
+        depthMap = DepthMap(viewId, mapId, image, transformUtils.getNumpyFromTransform(transform), depthImage)
+        self.depthMaps[viewId] = depthMap
+        return depthMap
+
+    def getDepthMapData(self, viewId):
+        depthMap = self.getDepthMap(viewId)
+        if depthMap is None:
+            return None, None
+        return depthMap.image, depthMap.transform
+
+
 class DepthImageProvider(object):
 
     def __init__(self):
 
         self.source = vtk.vtkMapServerSource()
         self.source.Start()
+        self.depthMapCache = DepthMapCache(self.source)
 
     def waitForSceneHeight(self):
         viewId = lcmmaps.data_request_t.HEIGHT_MAP_SCENE
@@ -20,20 +97,8 @@ class DepthImageProvider(object):
     def getSceneHeightData(self):
         return self.getDepthMapData(lcmmaps.data_request_t.HEIGHT_MAP_SCENE)
 
-    def getDepthMapData(self, viewId):
-
-        mapId = self.source.GetCurrentMapId(viewId)
-        if mapId < 0:
-            return None, None
-
-        depthImage = vtk.vtkImageData()
-        transform = vtk.vtkTransform()
-        # print "getting depth image for viewId {:d} mapId {:d}".format(viewId, mapId)
-        self.source.GetDataForMapId(viewId, mapId, depthImage, transform)
-
-        dims = depthImage.GetDimensions()
-        d = vnp.getNumpyFromVtk(depthImage, 'ImageScalars')
-        d = d.reshape(dims[1], dims[0])
-        t = np.array([[transform.GetMatrix().GetElement(r, c) for c in xrange(4)] for r in xrange(4)])
+    def getDepthMap(self, viewId):
+        return self.depthMapCache.getDepthMap(viewId)
 
-        return d, t
+    def getDepthMapData(self, viewId):
+        return self.depthMapCache.getDepthMapData(viewId)
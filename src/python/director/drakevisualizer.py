@@ -103,15 +103,7 @@ class Geometry(object):
         pd.GetPoints().SetData(vnp.getVtkFromNumpy(pts.copy()))
 
         assert len(faces) % 3 == 0
-        cells = vtk.vtkCellArray()
-        for i in xrange(len(faces)/3):
-            tri = vtk.vtkTriangle()
-            tri.GetPointIds().SetId(0, faces[i*3 + 0])
-            tri.GetPointIds().SetId(1, faces[i*3 + 1])
-            tri.GetPointIds().SetId(2, faces[i*3 + 2])
-            cells.InsertNextCell(tri)
-
-        pd.SetPolys(cells)
+        pd.SetPolys(vnp.getVtkCellArrayFromNumpyCells(np.reshape(faces, (-1, 3))))
         return pd
 
     @staticmethod
@@ -482,7 +474,7 @@ class DrakeVisualizer(object):
     def onPointCloud(self, msg, channel):
         pointcloudName = channel.replace('DRAKE_POINTCLOUD_', '', 1)
 
-        polyData = vnp.numpyToPolyData(np.asarray(msg.points), createVertexCells=True)
+        polyData = vnp.numpyToPolyData(np.asarray(msg.points), createVertexCells=True, copy=False)
 
         # If the user provided color channels, then use them to colorize
         # the pointcloud.
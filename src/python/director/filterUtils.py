@@ -15,6 +15,29 @@ def thresholdPoints(polyData, arrayName, thresholdRange):
     f.Update()
     return shallowCopy(f.GetOutput())
 
+def extractPoints(polyData, pointIds):
+    '''
+    Returns a new polyData with the given points and their point data, with
+    a vertex cell for each point like the output of thresholdPoints.
+    '''
+    pointIds = np.asarray(pointIds, dtype=np.int64)
+    pts = vnp.getNumpyFromVtk(polyData, 'Points')[pointIds]
+    newData = vnp.numpyToPolyData(pts, createVertexCells=True, copy=False)
+
+    pointData = polyData.GetPointData()
+    for i in xrange(pointData.GetNumberOfArrays()):
+        array = pointData.GetArray(i)
+        if array is None:
+            continue
+        vnp.addNumpyToVtk(newData, vnp.numpy_support.vtk_to_numpy(array)[pointIds], array.GetName())
+
+    for attributeType in xrange(vtk.vtkDataSetAttributes.NUM_ATTRIBUTES):
+        array = pointData.GetAbstractAttribute(attributeType)
+        if array is not None and array.GetName():
+            newData.GetPointData().SetActiveAttribute(array.GetName(), attributeType)
+
+    return newData
+
 def thresholdCells(polyData, arrayName, thresholdRange, arrayType='cells'):
 
     assert arrayType in ('points', 'cells')
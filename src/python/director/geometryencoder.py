@@ -2,6 +2,8 @@ from director import vtkAll as vtk
 from director import vtkNumpy as vnp
 from director.shallowCopy import shallowCopy
 import numpy as np
+import hashlib
+import zlib
 
 def encodePolyData(polyData):
     '''Given a vtkPolyData, returns a numpy int8 array that contains
@@ -38,3 +40,49 @@ def decodePolyData(data):
     polyData = vtk.vtkPolyData()
     vtk.vtkCommunicator.UnMarshalDataObject(charArray, polyData)
     return polyData
+
+def getContentHash(data):
+    '''Returns the sha1 hex digest of a numpy int8 array, such as the
+    result of encodePolyData.  Equal meshes have equal content hashes.'''
+    return hashlib.sha1(np.ascontiguousarray(data).tostring()).hexdigest()
+
+def compressData(data, level=6):
+    '''Compresses a numpy int8 array with zlib and returns the result as
+    a numpy int8 array.'''
+    return np.frombuffer(zlib.compress(np.ascontiguousarray(data).tostring(), level), dtype=np.int8)
+
+def decompressData(data):
+    '''Inverse of compressData.'''
+    return np.frombuffer(zlib.decompress(np.ascontiguousarray(data).tostring()), dtype=np.int8)
+
+def splitChunks(data, chunkSize):
+    '''Splits a numpy array into a list of chunks of at most chunkSize
+    elements.  An empty array gives a single empty chunk.'''
+    return [data[i:i+chunkSize] for i in xrange(0, max(len(data), 1), chunkSize)]
+
+class ChunkAssembler(object):
+    '''Collects the chunks of a chunked transfer, which may arrive out of
+    order or more than once, and reports the missing chunks so that an
+    interrupted transfer can be resumed by requesting only those.'''
+
+    def __init__(self, numChunks, size):
+        self.numChunks = numChunks
+        self.size = size
+        self.chunks = {}
+
+    def addChunk(self, index, data):
+        if 0 <= index < self.numChunks:
+            self.chunks[index] = data
+
+    def getMissingChunks(self):
+        return [i for i in xrange(self.numChunks) if i not in self.chunks]
+
+    def isComplete(self):
+        return len(self.chunks) == self.numChunks
+
+    def getData(self):
+        assert self.isComplete()
+        data = np.concatenate([self.chunks[i] for i in xrange(self.numChunks)]).astype(np.int8)
+        if len(data) != self.size:
+            raise ValueError('assembled %d bytes, expected %d' % (len(data), self.size))
+        return data
@@ -59,6 +59,9 @@ class ImageView(object):
         else:
             return None
 
+    def getImagePixelViewPoint(self, imagePixel):
+        return list(imagePixel)
+
     def resizeView(self, scale=1.0):
         image = self.getImage()
         assert image
@@ -6,10 +6,11 @@ import atexit
 import socket
 import os
 import subprocess
-import tempfile
-import imp
-import sys
-import re
+import time
+import traceback
+import bisect
+
+from director.lcmtypehistory import HistoricalLCMLoader, TypeNotFoundError
 
 class GlobalLCM(object):
 
@@ -86,7 +87,7 @@ def captureMessageCallback(channel, messageClass, callback):
     subscriber = None
     messages = []
     def handleMessage(message):
-        getGlobalLCMThread().removeSubscriber(subscriber)
+        removeSubscriber(subscriber)
         if not messages:
             messages.append(True)
             callback(message)
@@ -95,36 +96,270 @@ def captureMessageCallback(channel, messageClass, callback):
     return subscriber
 
 
-def addSubscriber(channel, messageClass=None, callback=None, historicalLoader=None, callbackNeedsChannel=False):
+class DurationHistogram(object):
+    '''
+    Counts durations in logarithmic bins of milliseconds.
+    '''
 
-    lcmThread = getGlobalLCMThread()
-    subscriber = PythonQt.dd.ddLCMSubscriber(channel, lcmThread)
+    binEdges = [0.1, 0.2, 0.5, 1.0, 2.0, 5.0, 10.0, 20.0, 50.0, 100.0, 200.0, 500.0, 1000.0]
+
+    def __init__(self):
+        self.counts = [0]*(len(self.binEdges) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.maximum = 0.0
+
+    def add(self, seconds):
+        milliseconds = seconds*1e3
+        self.counts[bisect.bisect_right(self.binEdges, milliseconds)] += 1
+        self.count += 1
+        self.total += milliseconds
+        self.maximum = max(self.maximum, milliseconds)
+
+    def getMean(self):
+        return self.total / self.count if self.count else 0.0
+
+    def getPercentile(self, percentile):
+        '''
+        Returns the upper edge of the bin that holds the given percentile, or
+        the maximum for the last bin.
+        '''
+        target = self.count*percentile/100.0
+        cumulative = 0
+        for binEdge, count in zip(self.binEdges, self.counts):
+            cumulative += count
+            if cumulative >= target:
+                return min(binEdge, self.maximum)
+        return self.maximum
+
+
+class SubscriberStatistics(object):
+    '''
+    Counters and histograms recorded by an LCMSubscription.  queueDelay is
+    the time from the arrival of a message on the LCM thread to the start of
+    the callback, droppedMessages counts messages replaced by newer ones
+    before they were delivered and throttledMessages counts messages skipped
+    by the speed limit.
+    '''
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.startTime = time.time()
+        self.messages = 0
+        self.droppedMessages = 0
+        self.throttledMessages = 0
+        self.queueDelay = DurationHistogram()
+        self.callbackTime = DurationHistogram()
+
+    def getSummary(self):
+        elapsed = max(time.time() - self.startTime, 1e-6)
+        return dict(messages=self.messages,
+                    rate=self.messages / elapsed,
+                    droppedMessages=self.droppedMessages,
+                    throttledMessages=self.throttledMessages,
+                    queueDelayMean=self.queueDelay.getMean(),
+                    queueDelay95=self.queueDelay.getPercentile(95),
+                    queueDelayMax=self.queueDelay.maximum,
+                    callbackTimeMean=self.callbackTime.getMean(),
+                    callbackTime95=self.callbackTime.getPercentile(95),
+                    callbackTimeMax=self.callbackTime.maximum,
+                    callbackLoad=self.callbackTime.total*1e-3 / elapsed)
+
+
+class ChannelDispatcher(object):
+    '''
+    Holds a single ddLCMSubscriber for a channel and fans each message out to
+    the LCMSubscriptions registered with it.  A message is decoded at most
+    once per message class, and all subscriptions with the same class receive
+    the same decoded object, so callbacks must not modify the messages they
+    receive.
+    '''
+
+    _dispatchers = {}
+
+    def __init__(self, channel, notifyAllMessages):
+        self.channel = channel
+        self.notifyAllMessages = notifyAllMessages
+        self.subscriptions = []
+        self.droppedMessageCount = 0
+
+        lcmThread = getGlobalLCMThread()
+        self.subscriber = PythonQt.dd.ddLCMSubscriber(channel, lcmThread)
+        self.subscriber.setNotifyAllMessagesEnabled(notifyAllMessages)
+        self.subscriber.connect('messageReceived(const QByteArray&, const QString&)', self.onMessage)
+        lcmThread.addSubscriber(self.subscriber)
+
+    @classmethod
+    def getDispatcher(cls, channel, notifyAllMessages):
+        key = (channel, notifyAllMessages)
+        dispatcher = cls._dispatchers.get(key)
+        if dispatcher is None:
+            dispatcher = cls(channel, notifyAllMessages)
+            cls._dispatchers[key] = dispatcher
+        return dispatcher
+
+    def addSubscription(self, subscription):
+        self.subscriptions.append(subscription)
+        subscription.dispatcher = self
+
+    def removeSubscription(self, subscription):
+        self.subscriptions.remove(subscription)
+        subscription.dispatcher = None
+        if not self.subscriptions:
+            del self._dispatchers[(self.channel, self.notifyAllMessages)]
+            _removeNativeSubscriber(self.subscriber)
+
+    def _addDroppedMessages(self, count):
+        for subscription in self.subscriptions:
+            subscription.statistics.droppedMessages += count
+
+    def onMessage(self, messageData, channel):
+
+        messageData = messageData.data()
+        receiveTime = self.subscriber.takeMessageReceiveTime() or time.time()
+
+        droppedMessageCount = self.subscriber.getDroppedMessageCount()
+        if droppedMessageCount != self.droppedMessageCount:
+            self._addDroppedMessages(droppedMessageCount - self.droppedMessageCount)
+            self.droppedMessageCount = droppedMessageCount
+
+        self.deliverMessage(messageData, channel, {}, receiveTime)
+
+    def deliverMessage(self, messageData, channel, decodedMessages, receiveTime):
+        '''
+        Calls the subscriptions with the message.  decodedMessages holds the
+        messages already decoded, the others are decoded here.
+        '''
+        for subscription in list(self.subscriptions):
+            # a callback may remove other subscriptions of this dispatcher
+            if subscription.dispatcher is not self:
+                continue
+            try:
+                subscription.handleMessage(messageData, channel, decodedMessages, receiveTime)
+            except:
+                traceback.print_exc()
+
+
+class LCMSubscription(object):
+    '''
+    The subscriber returned by addSubscriber when a message class is given.
+    It supports the ddLCMSubscriber methods used to configure message
+    delivery, applied to this subscription only.
+    '''
+
+    def __init__(self, channel, messageClass, callback, historicalLoader=None, callbackNeedsChannel=False):
+        self._channel = channel
+        self.messageClass = messageClass
+        self.callback = callback
+        self.historicalLoader = historicalLoader
+        self.callbackNeedsChannel = callbackNeedsChannel
+        self.callbackEnabled = True
+        self.requiredElapsedTime = 0.0
+        self.lastDeliveryTime = 0.0
+        self.dispatcher = None
+        self.statistics = SubscriberStatistics()
+
+    def channel(self):
+        return self._channel
+
+    def setCallbackEnabled(self, enabled):
+        self.callbackEnabled = enabled
+
+    def callbackIsEnabled(self):
+        return self.callbackEnabled
+
+    def setNotifyAllMessagesEnabled(self, enabled):
+        '''
+        Moves this subscription to the dispatcher of the channel that uses the
+        given policy, see ddLCMSubscriber::notifyAllMessagesIsEnabled().
+        '''
+        if self.dispatcher is None or self.dispatcher.notifyAllMessages == enabled:
+            return
+        self.dispatcher.removeSubscription(self)
+        ChannelDispatcher.getDispatcher(self._channel, enabled).addSubscription(self)
+
+    def notifyAllMessagesIsEnabled(self):
+        return self.dispatcher is not None and self.dispatcher.notifyAllMessages
+
+    def setSpeedLimit(self, hertz):
+        self.requiredElapsedTime = 1.0/hertz if hertz > 0.0 else 0.0
+
+    def getMessageRate(self):
+        return self.dispatcher.subscriber.getMessageRate() if self.dispatcher else 0.0
+
+    def decodeMessage(self, messageData, decodedMessages):
+        '''
+        Returns the decoded message, reusing and adding to the messages already
+        decoded for other subscriptions.  Returns None if the message could not
+        be decoded with the message class and there is no historicalLoader.
+        '''
+        messageClass = self.messageClass
+        if messageClass not in decodedMessages:
+            try:
+                decodedMessages[messageClass] = messageClass.decode(messageData)
+            except ValueError:
+                decodedMessages[messageClass] = None
+
+        msg = decodedMessages[messageClass]
+        if msg is None and self.historicalLoader is not None:
+            key = (messageClass, self.historicalLoader)
+            if key not in decodedMessages:
+                decodedMessages[key] = self.historicalLoader.decode(messageClass.__module__.split('.')[-1], messageData)
+            msg = decodedMessages[key]
+
+        return msg
+
+    def handleMessage(self, messageData, channel, decodedMessages, receiveTime):
+
+        if not self.callbackEnabled:
+            return
+
+        if self.requiredElapsedTime:
+            now = time.time()
+            if now - self.lastDeliveryTime < self.requiredElapsedTime:
+                self.statistics.throttledMessages += 1
+                return
+            self.lastDeliveryTime = now
+
+        msg = self.decodeMessage(messageData, decodedMessages)
+        if msg is None:
+            print 'error decoding message on channel:', channel
+            return
+
+        startTime = time.time()
+        self.statistics.messages += 1
+        self.statistics.queueDelay.add(max(startTime - receiveTime, 0.0))
 
-    def handleMessage(messageData, channel):
-        loadSuccessful = False
         try:
-            msg = messageClass.decode(messageData.data())
-            loadSuccessful = True
-        except ValueError:
-            if historicalLoader is not None:
-                # try:
-                    msg = historicalLoader.decode(messageClass.__module__.split('.')[-1], messageData.data())
-                    loadSuccessful = True
-                # except ValueError:
-                #     pass
-        if loadSuccessful:
-            if callbackNeedsChannel:
-                callback(msg, channel=channel)
+            if self.callbackNeedsChannel:
+                self.callback(msg, channel=channel)
             else:
-                callback(msg)
-        else:
-            print 'error decoding message on channel:', channel
+                self.callback(msg)
+        finally:
+            self.statistics.callbackTime.add(time.time() - startTime)
+
+
+def addSubscriber(channel, messageClass=None, callback=None, historicalLoader=None, callbackNeedsChannel=False):
+    '''
+    Subscribes to a channel.  If messageClass and callback are given, the
+    callback receives decoded messages and the returned LCMSubscription shares
+    a single native subscription with all other subscriptions of the channel.
+    Otherwise a ddLCMSubscriber is returned that calls the callback with the
+    raw message data, or that has its callback disabled so that messages can
+    be read with getNextMessage().
+    '''
+    if callback is not None and messageClass is not None:
+        subscription = LCMSubscription(channel, messageClass, callback, historicalLoader, callbackNeedsChannel)
+        ChannelDispatcher.getDispatcher(channel, False).addSubscription(subscription)
+        return subscription
+
+    lcmThread = getGlobalLCMThread()
+    subscriber = PythonQt.dd.ddLCMSubscriber(channel, lcmThread)
 
     if callback is not None:
-        if messageClass is not None:
-            subscriber.connect('messageReceived(const QByteArray&, const QString&)', handleMessage)
-        else:
-            subscriber.connect('messageReceived(const QByteArray&, const QString&)', callback)
+        subscriber.connect('messageReceived(const QByteArray&, const QString&)', callback)
     else:
         subscriber.setCallbackEnabled(False)
 
@@ -132,13 +367,57 @@ def addSubscriber(channel, messageClass=None, callback=None, historicalLoader=No
     return subscriber
 
 
-def removeSubscriber(subscriber):
+def _removeNativeSubscriber(subscriber):
     lcmThread = getGlobalLCMThread()
     lcmThread.removeSubscriber(subscriber)
     if subscriber.parent() == lcmThread:
         subscriber.setParent(None)
 
 
+def removeSubscriber(subscriber):
+    if isinstance(subscriber, LCMSubscription):
+        if subscriber.dispatcher is not None:
+            subscriber.dispatcher.removeSubscription(subscriber)
+    else:
+        _removeNativeSubscriber(subscriber)
+
+
+def getSubscriptions():
+    '''
+    Returns the LCMSubscriptions of all channels.
+    '''
+    return [subscription for dispatcher in ChannelDispatcher._dispatchers.values() for subscription in dispatcher.subscriptions]
+
+
+def getCallbackName(callback):
+    name = getattr(callback, '__name__', None) or type(callback).__name__
+    owner = getattr(callback, 'im_self', None)
+    if owner is not None:
+        name = '%s.%s' % (type(owner).__name__, name)
+    return name
+
+
+def getSubscriberStatistics():
+    '''
+    Returns a list of dicts with the channel, callback name, message type and
+    statistics summary of each LCMSubscription.  Durations are in
+    milliseconds.
+    '''
+    results = []
+    for subscription in getSubscriptions():
+        summary = subscription.statistics.getSummary()
+        summary.update(channel=subscription.channel(),
+                       callback=getCallbackName(subscription.callback),
+                       messageType=subscription.messageClass.__name__)
+        results.append(summary)
+    return results
+
+
+def resetSubscriberStatistics():
+    for subscription in getSubscriptions():
+        subscription.statistics.reset()
+
+
 def getNextMessage(subscriber, messageClass=None, timeout=0):
 
     messageData = subscriber.getNextMessage(timeout).data()
@@ -250,198 +529,6 @@ class LogPlayerCommander(object):
         self.sendCommand('FORWARD5')
 
 
-class TypeNotFoundError(Exception):
-    pass
-
-class HistoricalLCMLoader(object):
-    """
-    A helper class which can be added to a call to addSubscriber in order to allow the subscriber to decode messages which were generated with an older version of the LCM type definitions.
-    """
-    def __init__(self, package_name, lcmtypes_path, repo_path):
-        self.package_name = package_name
-        self.lcmtypes_path = lcmtypes_path
-        self.repo_path = repo_path
-        self.type_cache = {}
-        self._mru_shas_cache = {}
-        self._initialized = False
-        self._build_dir = None
-        self._tmpdir = None
-        self._source_dir = None
-
-    @property
-    def build_dir(self):
-        if self._build_dir is None:
-            self._build_dir = os.path.join(self.tmpdir, 'build')
-            if not os.path.exists(self._build_dir):
-                os.mkdir(self._build_dir)
-        return self._build_dir
-
-    @property
-    def source_dir(self):
-        if self._source_dir is None:
-            self._source_dir = os.path.join(self.tmpdir, 'source')
-            if not os.path.exists(self._source_dir):
-                os.mkdir(self._source_dir)
-        return self._source_dir
-
-    @property
-    def tmpdir(self):
-        if self._tmpdir is None:
-            self._tmpdir = os.path.join(tempfile.gettempdir(), 'temporary_lcmtypes')
-            if not os.path.exists(self._tmpdir):
-                os.mkdir(self._tmpdir)
-        return self._tmpdir
-
-    def buildTypeAtSHA(self, type_name, sha):
-        """
-        Build the python source files for the given type and revision. We rename the python module from its default (which is just the LCM package name) to [packagename][sha] to prevent namespace conflicts.
-        """
-        source_files = self.getOrCreateSourceFiles(type_name, sha, recursive=True)
-        sha_source_dir = os.path.dirname(source_files[0])
-        sha_build_dir = os.path.join(self.build_dir, sha)
-        if not os.path.exists(sha_build_dir):
-            os.makedirs(sha_build_dir)
-        final_pkg_dir = os.path.join(sha_build_dir, self.package_name + str(sha))
-        if not os.path.exists(final_pkg_dir):
-            os.makedirs(final_pkg_dir)
-        subprocess.check_call("lcm-gen --lazy -p --ppath {build:s} {source:s}".format(
-                                      build=sha_build_dir,
-                                      source=os.path.join(sha_source_dir, '*')),
-                              shell=True)
-        build_files = [f for f in os.listdir(os.path.join(sha_build_dir, self.package_name))
-                       if f.endswith('.py')]
-        build_type_names = [t.replace('.py', '') for t in build_files]
-        for f in build_files:
-            subprocess.check_call(r"perl -ne 's/{pkg:s}(?=\.({type_list:s}[^a-zA-Z0-9_]))/{pkg:s}{sha:s}/g; print;' < {infile:s} > {outfile:s}".format(
-                    pkg=self.package_name,
-                    type_list = '|'.join(build_type_names),
-                    sha=sha,
-                    infile=os.path.join(sha_build_dir, self.package_name, f),
-                    outfile=os.path.join(final_pkg_dir, f)),
-                                      shell=True)
-
-    def getOrCreateBuildFile(self, type_name, sha):
-        fname = type_name + '.py'
-        target = os.path.join(self.build_dir, sha, self.package_name + str(sha), fname)
-        if not os.path.exists(target):
-            self.buildTypeAtSHA(type_name, sha)
-        return target
-
-    def getOrCreateSourceFiles(self, type_name, sha, recursive=False):
-        """
-        Find the LCM source files for the given type at the given revision, pulling them out of the git history as needed. Also finds the source files for the children of that type if recursive=True.
-        """
-        fname = self.package_name + '_' + type_name + '.lcm'
-        source_dir = os.path.join(self.source_dir, sha)
-        if not os.path.exists(source_dir):
-            os.makedirs(source_dir)
-        targets = [os.path.join(self.source_dir, sha, fname)]
-        if not os.path.exists(targets[0]):
-            try:
-                subprocess.check_call("git -C {base:s} show {sha:s}:{typepath:s} > {fpath:s}".format(
-                                        base=self.repo_path, sha=sha,
-                                        typepath=os.path.join(self.lcmtypes_path, fname),
-                                        fpath=targets[0]),
-                                     shell=True)
-            except subprocess.CalledProcessError:
-                raise TypeNotFoundError("The target LCMtype cannot be found at this revision")
-        if recursive:
-            for child in self.getChildTypes(type_name, sha):
-                targets.extend(self.getOrCreateSourceFiles(child, sha, recursive=True))
-        return targets
-
-    def getChildTypes(self, type_name, sha):
-        """
-        Find the children of a given type by parsing the output of lcm-gen -d
-        """
-        source_file = self.getOrCreateSourceFiles(type_name, sha)[0]
-        children = []
-        debug_data = subprocess.check_output("lcm-gen -d {fpath:s}".format(fpath=source_file),
-                                             shell=True)
-        debug_lines = debug_data.split('\n')
-        for line in debug_lines:
-            line = line.lstrip()
-            match = re.match(r"{pkg:s}\.(?P<childname>[^\s]+)".format(pkg=self.package_name), line)
-            if match:
-                child = (match.groupdict()['childname'])
-                if child != type_name:
-                    children.append(child)
-        return children
-
-    def getSHAsForType(self, type_name):
-        """
-        Find the git SHAs for all revisions to a particular type
-        """
-        relative_type_path = os.path.join(self.lcmtypes_path, "{package_name:s}_{type_name:s}.lcm".format(
-            package_name=self.package_name, type_name=type_name))
-        cdata = subprocess.check_output("git --no-pager -C {0:s} log --pretty=oneline {1:s}".format(
-            self.repo_path, relative_type_path), shell=True)
-        shas = [c[:40] for c in cdata.split('\n') if len(c) >= 40]
-        return shas
-
-    def getSHAsForTypeAndChildren(self, type_name, processed=None):
-        """
-        Find the git SHAs for all revisions to a type *and* all of its children
-        """
-        shas = set([])
-        if processed is None:
-            processed = set([])
-
-        shas.update(self.getSHAsForType(type_name))
-        child_shas = set([])
-        for sha in shas:
-            try:
-                for child in self.getChildTypes(type_name, sha):
-                    if (child, sha) not in processed:
-                        processed.add((child, sha))
-                        child_shas.update(self.getSHAsForTypeAndChildren(child, processed))
-
-            except TypeNotFoundError:
-                continue
-        shas.update(child_shas)
-        return shas
-
-    def getTypeAtSHA(self, type_name, sha):
-        """
-        Get the python class for a given LCM type at a given revision, building it as necessary
-        """
-        if not (type_name, sha) in self.type_cache:
-            build_file = self.getOrCreateBuildFile(type_name, sha)
-            build_dir = os.path.join(self.build_dir, sha)
-            path = sys.path[:]
-            sys.path.insert(0, build_dir)
-            module = imp.load_source(type_name, build_file)
-            sys.path = path
-            self.type_cache[(type_name, sha)] = module.__dict__[type_name]
-
-        return self.type_cache[(type_name, sha)]
-
-    def decode(self, type_name, msg_data):
-        """
-        Try to decode an LCM message using its historical definitions. Uses a MRU (most recently used) queue of commit SHAs to try to ensure that repeated calls for messages of the same type are fast
-        """
-        if not self._initialized:
-            print "Warning: Possible out-of-date LCM message received. I will now try to decode the message using older versions of the type definition. This will be slow the first time it happens."
-            self._initialized = True
-        i = 0
-        if not type_name in self._mru_shas_cache:
-            self._mru_shas_cache[type_name] = list(self.getSHAsForTypeAndChildren(type_name))
-        for i, sha in enumerate(self._mru_shas_cache[type_name]):
-            try:
-                msg_class = self.getTypeAtSHA(type_name, sha)
-            except TypeNotFoundError:
-                continue
-            try:
-                # print "Trying to decode using definition of type from commit {sha:s}".format(sha=sha[:8])
-                msg_obj = msg_class.decode(msg_data)
-            except ValueError as e:
-                continue
-            self._mru_shas_cache[type_name].pop(i)
-            self._mru_shas_cache[type_name].insert(0, sha)
-            return msg_obj
-        raise ValueError("Unable to decode message data with any available type definitions.")
-
-
 class LCMLoggerManager(object):
     '''
     This class provides some convenient methods for managing instances of
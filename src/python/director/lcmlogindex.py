@@ -0,0 +1,287 @@
+import os
+import json
+import struct
+import tempfile
+import numpy as np
+
+
+# lcm event log record header: sync word, event number, timestamp,
+# channel length, data length.  The channel name and data follow.
+EVENT_HEADER = struct.Struct('>IqqII')
+EVENT_SYNC_WORD = 0xEDA1DA01
+
+INDEX_VERSION = 1
+
+indexDtype = np.dtype([('timestamp', '<i8'), ('filepos', '<i8'), ('channel', '<i4')])
+
+
+def getIndexFilenames(filename):
+    return filename + '.ddidx.npy', filename + '.ddidx.json'
+
+
+def readEventHeader(f, fileSize):
+    '''
+    Reads the event header at the current file position and returns
+    (timestamp, channel, dataLength), leaving the file positioned at the
+    start of the event data.  Returns None at the end of the file or if
+    the event at the current position is incomplete, which happens for
+    logs that are still being written.
+    '''
+    filepos = f.tell()
+    header = f.read(EVENT_HEADER.size)
+    if len(header) < EVENT_HEADER.size:
+        return None
+
+    sync, eventNumber, timestamp, channelLength, dataLength = EVENT_HEADER.unpack(header)
+    if sync != EVENT_SYNC_WORD:
+        raise IOError('bad sync word in lcm log at offset %d' % filepos)
+
+    if filepos + EVENT_HEADER.size + channelLength + dataLength > fileSize:
+        return None
+
+    channel = f.read(channelLength)
+    return timestamp, channel, dataLength
+
+
+def getChannelEventIndices(channelIndex, numChannels):
+    '''
+    Given the channel id of each event, returns a list with the sorted event
+    indices of each channel id.
+    '''
+    order = np.argsort(channelIndex, kind='mergesort')
+    splits = np.searchsorted(channelIndex[order], np.arange(1, numChannels))
+    return np.split(order, splits)
+
+
+def writeFileAtomic(filename, writeFunction):
+    fd, tempFilename = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(filename)), prefix='.ddidx')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            writeFunction(f)
+        os.rename(tempFilename, filename)
+    except:
+        os.remove(tempFilename)
+        raise
+
+
+class LcmLogIndex(object):
+    '''
+    An index of the events in an lcm log file: timestamp, file offset and
+    channel id for each event.  The index is built by scanning only the
+    event headers and is saved next to the log file as a sidecar so that
+    later opens can memory map it instead of rescanning the log.  If the
+    log has grown since the index was saved, only the new events are scanned.
+    '''
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.indexFilename, self.metaFilename = getIndexFilenames(filename)
+        self.events = np.zeros(0, dtype=indexDtype)
+        self.channels = []
+        self.channelIds = {}
+        self.scannedOffset = 0
+        self.loadedFromCache = False
+        self._channelEventIndices = None
+        self._buffer = None
+
+    @property
+    def timestamps(self):
+        return self.events['timestamp']
+
+    @property
+    def filePositions(self):
+        return self.events['filepos']
+
+    @property
+    def channelIndex(self):
+        return self.events['channel']
+
+    def getNumberOfEvents(self):
+        return len(self.events)
+
+    def getChannelId(self, channel):
+        channelId = self.channelIds.get(channel)
+        if channelId is None:
+            channelId = len(self.channels)
+            self.channels.append(channel)
+            self.channelIds[channel] = channelId
+        return channelId
+
+    def getChannelEventIndices(self, channel):
+        '''
+        Returns the sorted indices of the events on the given channel.
+        '''
+        if self._channelEventIndices is None:
+            self._channelEventIndices = getChannelEventIndices(self.channelIndex, len(self.channels))
+        channelId = self.channelIds.get(channel)
+        if channelId is None:
+            return np.zeros(0, dtype=np.int64)
+        return self._channelEventIndices[channelId]
+
+    def load(self, progressFunction=None, save=True):
+        '''
+        Loads the sidecar index if it is valid for the log file, then scans
+        any events that were appended since it was written, and saves the
+        index if save is true.
+        '''
+        self.loadedFromCache = self._loadCache()
+        if not self.loadedFromCache:
+            self.events = np.zeros(0, dtype=indexDtype)
+            self.channels = []
+            self.channelIds = {}
+            self.scannedOffset = 0
+            self._buffer = None
+
+        if self.scannedOffset < os.path.getsize(self.filename):
+            self.update(progressFunction, save=save)
+        return self
+
+    def _loadCache(self):
+
+        if not (os.path.isfile(self.indexFilename) and os.path.isfile(self.metaFilename)):
+            return False
+
+        try:
+            meta = json.load(open(self.metaFilename, 'r'))
+        except ValueError:
+            return False
+
+        if meta.get('version') != INDEX_VERSION:
+            return False
+
+        stat = os.stat(self.filename)
+        unchanged = (stat.st_size == meta['logSize'] and stat.st_mtime == meta['logMtime'])
+        grown = stat.st_size > meta['logSize']
+
+        if not (unchanged or grown):
+            return False
+
+        events = np.load(self.indexFilename, mmap_mode='r')
+        if len(events) != meta['numEvents']:
+            return False
+
+        channels = [str(channel) for channel in meta['channels']]
+        if grown and len(events) and not self._checkEvent(events[-1], channels):
+            return False
+
+        self.events = events
+        self._buffer = None
+        self.channels = channels
+        self.channelIds = dict((channel, i) for i, channel in enumerate(self.channels))
+        self.scannedOffset = meta['scannedOffset']
+        self._channelEventIndices = None
+        return True
+
+    def _checkEvent(self, event, channels):
+        '''
+        Returns true if the log still contains the given indexed event.  This
+        guards against reusing an index after the log file was replaced.
+        '''
+        with open(self.filename, 'rb') as f:
+            f.seek(int(event['filepos']))
+            header = readEventHeader(f, os.path.getsize(self.filename))
+        return (header is not None and header[0] == event['timestamp']
+                and header[1] == channels[event['channel']])
+
+    def update(self, progressFunction=None, save=True):
+        '''
+        Scans events from the last scanned offset to the end of the log file
+        and saves the index if save is true.  If progressFunction is given it
+        is called with the elapsed log time in seconds, and the scan stops
+        early if it returns False.  Returns the number of new events.
+        '''
+        fileSize = os.path.getsize(self.filename)
+        firstTimestamp = self.events['timestamp'][0] if len(self.events) else None
+        nextProgressTime = 0.0
+
+        timestamps = []
+        filePositions = []
+        channelIndex = []
+
+        with open(self.filename, 'rb') as f:
+            f.seek(self.scannedOffset)
+
+            while True:
+
+                filepos = f.tell()
+                header = readEventHeader(f, fileSize)
+                if header is None:
+                    break
+
+                timestamp, channel, dataLength = header
+                f.seek(dataLength, os.SEEK_CUR)
+
+                if firstTimestamp is None:
+                    firstTimestamp = timestamp
+
+                if progressFunction:
+                    progressTime = (timestamp - firstTimestamp)*1e-6
+                    if progressTime >= nextProgressTime:
+                        nextProgressTime += 1.0
+                        if not progressFunction(progressTime):
+                            break
+
+                timestamps.append(timestamp)
+                filePositions.append(filepos)
+                channelIndex.append(self.getChannelId(channel))
+                self.scannedOffset = f.tell()
+
+        newEvents = np.zeros(len(timestamps), dtype=indexDtype)
+        newEvents['timestamp'] = timestamps
+        newEvents['filepos'] = filePositions
+        newEvents['channel'] = channelIndex
+
+        if len(newEvents):
+            self._appendEvents(newEvents)
+            self._channelEventIndices = None
+
+        if save:
+            self.save()
+        return len(newEvents)
+
+    def _appendEvents(self, newEvents):
+        '''
+        Appends to the events array.  The events are stored in a buffer that
+        grows by doubling, so repeated updates of a log that is still being
+        written don't copy the whole index each time.  Arrays previously
+        returned by the index are views of the events and stay valid.
+        '''
+        numEvents = len(self.events)
+        newSize = numEvents + len(newEvents)
+
+        if self._buffer is None or newSize > len(self._buffer):
+            capacity = len(self._buffer) if self._buffer is not None else 1024
+            while capacity < newSize:
+                capacity *= 2
+            buffer = np.zeros(capacity, dtype=indexDtype)
+            buffer[:numEvents] = self.events
+            self._buffer = buffer
+
+        self._buffer[numEvents:newSize] = newEvents
+        self.events = self._buffer[:newSize]
+
+    def save(self):
+        '''
+        Writes the sidecar files.  The index is written to a temporary file
+        and renamed into place so that an existing memory map of the previous
+        index stays valid.  Failure to write, for example because the log
+        directory is read only, is not an error.
+        '''
+        stat = os.stat(self.filename)
+        meta = dict(version=INDEX_VERSION,
+                    logSize=stat.st_size,
+                    logMtime=stat.st_mtime,
+                    scannedOffset=self.scannedOffset,
+                    numEvents=len(self.events),
+                    channels=self.channels)
+
+        try:
+            writeFileAtomic(self.indexFilename, lambda f: np.save(f, np.asarray(self.events)))
+            writeFileAtomic(self.metaFilename, lambda f: json.dump(meta, f))
+        except (IOError, OSError):
+            return False
+        return True
+
+
+def loadLogIndex(filename, progressFunction=None, save=True):
+    return LcmLogIndex(filename).load(progressFunction, save=save)
@@ -1,12 +1,130 @@
 from director import lcmUtils
+from director import lcmlogindex
 from director.timercallback import TimerCallback
 from director.qtutils import BlockSignals
 
+import re
+import collections
+import threading
 import lcm
 import numpy as np
 from PythonQt import QtCore, QtGui
 
 
+class LcmLogReaderThread(object):
+    '''
+    Reads log events on a background thread into a bounded buffer, staying
+    up to prefetchTime seconds ahead of the playback position, so that
+    playback on the gui thread does not block on disk reads.  Events are
+    read in the order of an event index sequence, which is set with seek().
+    '''
+
+    def __init__(self, filename, prefetchTime=2.0, maxBufferedEvents=10000):
+        self.filename = filename
+        self.prefetchTime = prefetchTime
+        self.maxBufferedEvents = maxBufferedEvents
+        self.condition = threading.Condition()
+        self.buffer = collections.deque()
+        self.timestamps = np.array([])
+        self.filePositions = []
+        self.sequence = []
+        self.readPosition = 0
+        self.playTimestamp = 0
+        self.generation = 0
+        self.underruns = 0
+        self.eventsRead = 0
+        self.shouldStop = False
+        self.thread = None
+
+    def start(self):
+        self.shouldStop = False
+        self.thread = threading.Thread(target=self.mainLoop)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        with self.condition:
+            self.shouldStop = True
+            self.condition.notify_all()
+        self.thread.join()
+
+    def seek(self, timestamps, filePositions, sequence, position):
+        '''
+        Flushes the buffer and restarts reading at sequence[position].
+        The sequence is a list of event indices into timestamps and
+        filePositions.
+        '''
+        with self.condition:
+            self.generation += 1
+            self.buffer.clear()
+            self.timestamps = timestamps
+            self.filePositions = filePositions
+            self.sequence = sequence
+            self.readPosition = position
+            if position < len(sequence):
+                self.playTimestamp = timestamps[sequence[position]]
+            self.condition.notify_all()
+
+    def popEvent(self, eventIndex):
+        '''
+        Returns the event with the given index if it has been read, or None
+        if the reader has fallen behind playback, which is counted as a
+        buffer underrun.
+        '''
+        with self.condition:
+            while self.buffer and self.buffer[0][0] < eventIndex:
+                self.buffer.popleft()
+
+            if not self.buffer or self.buffer[0][0] != eventIndex:
+                self.underruns += 1
+                return None
+
+            self.playTimestamp = self.timestamps[eventIndex]
+            self.condition.notify_all()
+            return self.buffer.popleft()[1]
+
+    def getStatistics(self):
+        with self.condition:
+            return dict(underruns=self.underruns,
+                        eventsRead=self.eventsRead,
+                        bufferedEvents=len(self.buffer))
+
+    def _needsRead(self):
+        if self.readPosition >= len(self.sequence) or len(self.buffer) >= self.maxBufferedEvents:
+            return False
+        nextTimestamp = self.timestamps[self.sequence[self.readPosition]]
+        return nextTimestamp <= self.playTimestamp + self.prefetchTime*1e6
+
+    def mainLoop(self):
+
+        log = lcm.EventLog(self.filename, 'r')
+
+        while True:
+
+            with self.condition:
+                while not (self.shouldStop or self._needsRead()):
+                    self.condition.wait()
+                if self.shouldStop:
+                    break
+
+                generation = self.generation
+                eventIndex = self.sequence[self.readPosition]
+                filepos = self.filePositions[eventIndex]
+
+            if log.tell() != filepos:
+                log.seek(int(filepos))
+            event = log.read_next_event()
+
+            with self.condition:
+                if generation != self.generation:
+                    continue
+                self.buffer.append((eventIndex, event))
+                self.readPosition += 1
+                self.eventsRead += 1
+
+        log.close()
+
+
 class LcmLogPlayer(object):
 
     def __init__(self, lcmHandle=None):
@@ -19,6 +137,17 @@ class LcmLogPlayer(object):
         self.timer = TimerCallback()
         self.timestamps = np.array([])
         self.timestampOffset = 0.0
+        self.logIndex = None
+        self.channels = []
+        self.channelIndex = np.zeros(0, dtype=int)
+        self.channelIncludePatterns = []
+        self.channelExcludePatterns = []
+        self.channelMaxRates = {}
+        self.playbackIndices = None
+        self.nextPlaybackIndex = 0
+        self.nextEventIndex = 0
+        self.filename = None
+        self.readerThread = None
 
     def findEventIndex(self, timestampRequest):
         requestIndex = self.timestamps.searchsorted(timestampRequest)
@@ -26,12 +155,140 @@ class LcmLogPlayer(object):
             requestIndex = len(self.timestamps)-1
         return requestIndex
 
+    def setChannelFilter(self, include=None, exclude=None):
+        '''
+        Restricts playback to channels that fully match one of the include
+        regular expressions, if any are given, and none of the exclude
+        regular expressions.
+        '''
+        self.channelIncludePatterns = list(include or [])
+        self.channelExcludePatterns = list(exclude or [])
+        self.updatePlaybackIndices()
+
+    def setChannelMaxRate(self, channelPattern, maxRate):
+        '''
+        Decimates playback of channels that fully match the given regular
+        expression to at most maxRate messages per second.  Pass None as
+        maxRate to remove the limit.
+        '''
+        if maxRate is None:
+            self.channelMaxRates.pop(channelPattern, None)
+        else:
+            self.channelMaxRates[channelPattern] = maxRate
+        self.updatePlaybackIndices()
+
+    def isChannelEnabled(self, channel):
+        matches = lambda patterns: any(re.match('(?:%s)$' % pattern, channel) for pattern in patterns)
+        if self.channelIncludePatterns and not matches(self.channelIncludePatterns):
+            return False
+        return not matches(self.channelExcludePatterns)
+
+    def getChannelMaxRate(self, channel):
+        rates = [rate for pattern, rate in self.channelMaxRates.iteritems() if re.match('(?:%s)$' % pattern, channel)]
+        return min(rates) if rates else None
+
+    def getChannelEventIndices(self, channel):
+        if self.logIndex:
+            return self.logIndex.getChannelEventIndices(channel)
+        return np.flatnonzero(self.channelIndex == self.channels.index(channel))
+
+    def updatePlaybackIndices(self):
+        '''
+        Computes the indices of the events to publish during playback from
+        the per-channel event indices, so that events on excluded channels
+        are never read from the log file.
+        '''
+        if not (self.channelIncludePatterns or self.channelExcludePatterns or self.channelMaxRates):
+            self.playbackIndices = None
+        else:
+            playbackIndices = []
+            for channel in self.channels:
+                if not self.isChannelEnabled(channel):
+                    continue
+                indices = self.getChannelEventIndices(channel)
+                maxRate = self.getChannelMaxRate(channel)
+                if maxRate:
+                    # keep the first event in each 1/maxRate second time bin
+                    bins = np.floor(self.timestamps[indices] * (maxRate*1e-6))
+                    indices = indices[np.unique(bins, return_index=True)[1]]
+                playbackIndices.append(indices)
+            self.playbackIndices = np.sort(np.concatenate(playbackIndices)) if playbackIndices else np.zeros(0, dtype=int)
+
+        self._setNextEventIndex(self.nextEventIndex)
+        self._seekReaderThread()
+
+    def setPrefetchEnabled(self, enabled, prefetchTime=2.0, maxBufferedEvents=10000):
+        '''
+        When enabled, log events are read ahead of playback on a background
+        thread instead of being read on the gui thread during playback.
+        '''
+        if self.readerThread:
+            self.readerThread.stop()
+            self.readerThread = None
+
+        if enabled:
+            self.readerThread = LcmLogReaderThread(self.filename, prefetchTime, maxBufferedEvents)
+            self.readerThread.start()
+            self._seekReaderThread()
+
+    def getPrefetchStatistics(self):
+        return self.readerThread.getStatistics() if self.readerThread else {}
+
+    def _seekReaderThread(self):
+        if not self.readerThread:
+            return
+        sequence = xrange(len(self.timestamps)) if self.playbackIndices is None else self.playbackIndices
+        self.readerThread.seek(self.timestamps, self.filePositions, sequence, self._getSequencePosition())
+
+    def _getSequencePosition(self):
+        return self.nextEventIndex if self.playbackIndices is None else self.nextPlaybackIndex
+
+    def _setNextEventIndex(self, eventIndex):
+        '''
+        Sets the next event to publish to the first event at or after the
+        given event index that passes the channel filters.
+        '''
+        if self.playbackIndices is None:
+            self.nextEventIndex = eventIndex
+        else:
+            self.nextPlaybackIndex = self.playbackIndices.searchsorted(eventIndex)
+            self._updateNextEventIndex()
+
+    def _stepEventIndex(self):
+        if self.playbackIndices is None:
+            self.nextEventIndex += 1
+        else:
+            self.nextPlaybackIndex += 1
+            self._updateNextEventIndex()
+
+    def _updateNextEventIndex(self):
+        if self.nextPlaybackIndex < len(self.playbackIndices):
+            self.nextEventIndex = self.playbackIndices[self.nextPlaybackIndex]
+        else:
+            self.nextEventIndex = len(self.timestamps)
+
+    def _readEvent(self, eventIndex):
+        filepos = self.filePositions[eventIndex]
+        if self.log.tell() != filepos:
+            self.log.seek(int(filepos))
+        return self.log.read_next_event()
+
+    def _setPlayPosition(self, playTime):
+        self._setNextEventIndex(self.findEventIndex(playTime*1e6))
+        if self.nextEventIndex < len(self.timestamps):
+            self.log.seek(int(self.filePositions[self.nextEventIndex]))
+
     def resetPlayPosition(self, playTime):
-        self.nextEventIndex = self.findEventIndex(playTime*1e6)
-        filepos = self.filePositions[self.nextEventIndex]
-        self.log.seek(filepos)
+        self._setPlayPosition(playTime)
+        self._seekReaderThread()
 
-    def advanceTime(self, playLength, onFrame=None):
+    def advanceTime(self, playLength, onFrame=None, readSynchronously=False):
+        '''
+        Publishes the events of the next playLength seconds.  With prefetch
+        enabled the events are taken from the reader thread, and publishing
+        stops at an event it has not read yet, to continue on the next call.
+        If readSynchronously is True the events are read here instead.
+        '''
 
         numEvents = len(self.timestamps)
         if self.nextEventIndex >= numEvents:
@@ -44,8 +301,15 @@ class LcmLogPlayer(object):
 
         while good:
 
-            event = self.log.read_next_event()
-            self.nextEventIndex += 1
+            if self.readerThread and not readSynchronously:
+                event = self.readerThread.popEvent(self.nextEventIndex)
+                if event is None:
+                    # wait for the reader thread to catch up, the underrun
+                    # is counted by the reader
+                    return
+            else:
+                event = self._readEvent(self.nextEventIndex)
+            self._stepEventIndex()
 
             self.lcmHandle.publish(event.channel, event.data)
 
@@ -55,8 +319,14 @@ class LcmLogPlayer(object):
                 onFrame(self.timestamps[self.nextEventIndex] / 1.e6)
 
     def skipToTime(self, timeRequest, playLength=0.0):
-        self.resetPlayPosition(timeRequest)
-        self.advanceTime(playLength)
+        '''
+        Publishes the events at the requested time.  They are read here
+        rather than waited for, and the reader thread, if prefetch is
+        enabled, restarts after them.
+        '''
+        self._setPlayPosition(timeRequest)
+        self.advanceTime(playLength, readSynchronously=True)
+        self._seekReaderThread()
 
     def getEndTime(self):
         assert len(self.timestamps)
@@ -69,7 +339,7 @@ class LcmLogPlayer(object):
 
         self.resetPlayPosition(startTime)
 
-        startTimestamp = self.timestamps[self.nextEventIndex]
+        startTimestamp = self.timestamps[self.findEventIndex(startTime*1e6)]
         endTimestamp = startTimestamp + playLength*1e6
 
         def onTick():
@@ -90,11 +360,34 @@ class LcmLogPlayer(object):
         self.timer.start()
 
     def readLog(self, filename, eventTimeFunction=None, progressFunction=None):
-        log = lcm.EventLog(filename, 'r')
-        self.log = log
+
+        readerThread = self.readerThread
+        self.setPrefetchEnabled(False)
+
+        self.log = lcm.EventLog(filename, 'r')
+        self.filename = filename
+
+        if eventTimeFunction is None:
+            self.readLogIndex(filename, progressFunction)
+        else:
+            self.readLogEvents(eventTimeFunction, progressFunction)
+
+        if readerThread:
+            self.setPrefetchEnabled(True, readerThread.prefetchTime, readerThread.maxBufferedEvents)
+
+    def readLogEvents(self, eventTimeFunction, progressFunction=None):
+        '''
+        Reads event timestamps by reading every event in the log, for use
+        when timestamps are computed from the message data.
+        '''
+        log = self.log
+        log.seek(0)
+        self.logIndex = None
 
         timestamps = []
         filePositions = []
+        channelIds = {}
+        channelIndex = []
         offsetIsDefined = False
         timestampOffset = 0
         lastEventTimestamp = 0
@@ -131,10 +424,38 @@ class LcmLogPlayer(object):
 
             filePositions.append(filepos)
             timestamps.append(timestamp)
+            channelIndex.append(channelIds.setdefault(event.channel, len(channelIds)))
 
         self.filePositions = filePositions
         self.timestamps = np.array(timestamps)
         self.timestampOffset = timestampOffset
+        self.channels = sorted(channelIds, key=channelIds.get)
+        self.channelIndex = np.array(channelIndex, dtype=int)
+        self.updatePlaybackIndices()
+
+    def readLogIndex(self, filename, progressFunction=None):
+        '''
+        Reads event timestamps and file positions from the sidecar index of
+        the log file, scanning only the events that are not yet indexed.
+        '''
+        self.logIndex = lcmlogindex.loadLogIndex(filename, progressFunction)
+        self.updateFromLogIndex()
+
+    def updateLogIndex(self):
+        '''
+        Indexes events appended to a log that is still being written.
+        '''
+        if self.logIndex.update():
+            self.updateFromLogIndex()
+
+    def updateFromLogIndex(self):
+        rawTimestamps = self.logIndex.timestamps
+        self.timestampOffset = rawTimestamps[0] if len(rawTimestamps) else 0
+        self.timestamps = rawTimestamps - self.timestampOffset
+        self.filePositions = self.logIndex.filePositions
+        self.channels = self.logIndex.channels
+        self.channelIndex = self.logIndex.channelIndex
+        self.updatePlaybackIndices()
 
 
 class LcmLogPlayerGui(object):
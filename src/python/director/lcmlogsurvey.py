@@ -0,0 +1,205 @@
+'''
+Summarizes many lcm log files in parallel.
+
+Each log is scanned in a worker process using only the event headers and
+the 8 byte type fingerprint at the start of each channel's message data,
+no messages are decoded.  The per-log summaries are saved to a JSON file
+and reused on the next survey for logs whose size and mtime are unchanged.
+Index sidecar files (see lcmlogindex) are used when they exist next to a
+log, and are only written with --write-index.
+
+Usage:
+
+    python -m director.lcmlogsurvey [-j processes] [-o summary.json] [--write-index] lcmlog...
+'''
+
+import os
+import sys
+import json
+import binascii
+import argparse
+import multiprocessing
+import numpy as np
+
+from director import lcmlogindex
+
+
+SUMMARY_VERSION = 1
+
+
+def readFingerprint(f, filepos):
+    f.seek(filepos)
+    header = f.read(lcmlogindex.EVENT_HEADER.size)
+    channelLength = lcmlogindex.EVENT_HEADER.unpack(header)[3]
+    f.seek(channelLength, os.SEEK_CUR)
+    return binascii.hexlify(f.read(8))
+
+
+def surveyLog(filename, writeIndex=False):
+    '''
+    Returns a dict summarizing the log: event count, time range and a dict
+    of per channel counts, bytes, time ranges, rates and type fingerprints.
+    The fingerprints are read from the first and last event of each channel,
+    so a channel that changes type during the log lists both types.  An
+    existing index sidecar of the log is used, and the index is saved next
+    to the log only if writeIndex is true.
+    '''
+    index = lcmlogindex.loadLogIndex(filename, save=writeIndex)
+    stat = os.stat(filename)
+
+    timestamps = np.asarray(index.timestamps)
+    filePositions = np.asarray(index.filePositions)
+    channelIndex = np.asarray(index.channelIndex)
+    numChannels = len(index.channels)
+
+    # the data size of each event is the distance to the next event minus
+    # the header and channel name
+    channelLengths = np.array([len(channel) for channel in index.channels], dtype=np.int64)
+    eventEnds = np.append(filePositions[1:], index.scannedOffset)
+    dataSizes = eventEnds - filePositions - lcmlogindex.EVENT_HEADER.size - channelLengths[channelIndex]
+
+    counts = np.bincount(channelIndex, minlength=numChannels)
+    channelBytes = np.bincount(channelIndex, weights=dataSizes, minlength=numChannels)
+
+    channels = {}
+    with open(filename, 'rb') as f:
+        for channelId, eventIndices in enumerate(lcmlogindex.getChannelEventIndices(channelIndex, numChannels)):
+            if not len(eventIndices):
+                continue
+            startTime = timestamps[eventIndices[0]]
+            endTime = timestamps[eventIndices[-1]]
+            duration = (endTime - startTime)*1e-6
+            fingerprints = sorted(set(readFingerprint(f, filePositions[i]) for i in (eventIndices[0], eventIndices[-1])))
+            channels[index.channels[channelId]] = dict(
+                count=int(counts[channelId]),
+                bytes=int(channelBytes[channelId]),
+                startTime=int(startTime),
+                endTime=int(endTime),
+                rate=(counts[channelId] - 1)/duration if duration > 0 else 0.0,
+                fingerprints=fingerprints)
+
+    return dict(filename=os.path.abspath(filename),
+                size=stat.st_size,
+                mtime=stat.st_mtime,
+                numEvents=index.getNumberOfEvents(),
+                startTime=int(timestamps[0]) if len(timestamps) else None,
+                endTime=int(timestamps[-1]) if len(timestamps) else None,
+                channels=channels)
+
+
+def _surveyLogWorker(args):
+    filename, writeIndex = args
+    try:
+        return surveyLog(filename, writeIndex), None
+    except (IOError, OSError) as e:
+        return None, '%s: %s' % (filename, e)
+
+
+def loadSummary(summaryFilename):
+    try:
+        summary = json.load(open(summaryFilename, 'r'))
+    except (IOError, ValueError):
+        return {}
+    return summary['logs'] if summary.get('version') == SUMMARY_VERSION else {}
+
+
+def saveSummary(logs, summaryFilename):
+    data = dict(version=SUMMARY_VERSION, logs=logs)
+    lcmlogindex.writeFileAtomic(summaryFilename, lambda f: json.dump(data, f, indent=1, sort_keys=True))
+
+
+def surveyLogs(filenames, summaryFilename=None, processes=None, writeIndex=False):
+    '''
+    Surveys the log files in a process pool and returns a dict of log
+    filename to summary.  If summaryFilename is given, summaries saved there
+    are reused for logs whose size and mtime are unchanged, and the updated
+    summaries are written back.  Logs that are missing or can't be read are
+    reported and skipped.  If writeIndex is true the index sidecar of each
+    scanned log is saved next to it, see surveyLog.
+    '''
+    logs = loadSummary(summaryFilename) if summaryFilename else {}
+    filenames = [os.path.abspath(filename) for filename in filenames]
+
+    existing = []
+    toScan = []
+    for filename in filenames:
+        try:
+            stat = os.stat(filename)
+        except OSError as e:
+            print 'skipping missing log', '%s: %s' % (filename, e)
+            continue
+        existing.append(filename)
+        summary = logs.get(filename)
+        if not summary or summary['size'] != stat.st_size or summary['mtime'] != stat.st_mtime:
+            toScan.append(filename)
+
+    if toScan:
+        args = [(filename, writeIndex) for filename in toScan]
+        if processes == 1 or len(toScan) == 1:
+            results = [_surveyLogWorker(arg) for arg in args]
+        else:
+            pool = multiprocessing.Pool(processes)
+            try:
+                results = pool.map(_surveyLogWorker, args, chunksize=1)
+            finally:
+                pool.close()
+                pool.join()
+
+        for summary, error in results:
+            if error:
+                print 'failed to survey', error
+            else:
+                logs[summary['filename']] = summary
+
+        if summaryFilename:
+            saveSummary(logs, summaryFilename)
+
+    return dict((filename, logs[filename]) for filename in existing if filename in logs)
+
+
+def getTypeName(fingerprint):
+    '''
+    Returns the full type name for a hex fingerprint if the lcm type can be
+    found by lcmspy, otherwise returns the fingerprint.
+    '''
+    from director import lcmspy
+    msgType = lcmspy.getMessageClass(binascii.unhexlify(fingerprint))
+    return lcmspy.getMessageTypeFullName(msgType) if msgType else fingerprint
+
+
+def printSurvey(logs, typeNames=True):
+
+    for filename in sorted(logs.keys()):
+        summary = logs[filename]
+        duration = (summary['endTime'] - summary['startTime'])*1e-6 if summary['numEvents'] else 0.0
+        print '-----------------------'
+        print 'log:', filename
+        print 'size: %.2f MB   events: %d   duration: %.1f s' % (summary['size']/(1024.0**2), summary['numEvents'], duration)
+        print '  %-40s %10s %10s %12s  %s' % ('channel', 'messages', 'rate (hz)', 'MB', 'type')
+        for channel in sorted(summary['channels'].keys()):
+            stats = summary['channels'][channel]
+            types = [getTypeName(fingerprint) if typeNames else fingerprint for fingerprint in stats['fingerprints']]
+            print '  %-40s %10d %10.2f %12.3f  %s' % (channel, stats['count'], stats['rate'], stats['bytes']/(1024.0**2), ', '.join(types))
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Summarize lcm log files in parallel.')
+    parser.add_argument('logs', nargs='+', help='lcm log files')
+    parser.add_argument('-j', '--processes', type=int, default=None, help='number of worker processes, defaults to the number of cpus')
+    parser.add_argument('-o', '--summary', default=None, help='json file to read and write the log summaries')
+    parser.add_argument('--no-type-names', action='store_true', help='print type fingerprints instead of type names')
+    parser.add_argument('--write-index', action='store_true', help='save the index sidecar files of the scanned logs next to them')
+    args = parser.parse_args()
+
+    logs = surveyLogs(args.logs, args.summary, args.processes, args.write_index)
+
+    if not args.no_type_names:
+        from director import lcmspy
+        lcmspy.findLCMModulesInSysPath()
+
+    printSurvey(logs, typeNames=not args.no_type_names)
+
+
+if __name__ == '__main__':
+    main()
@@ -18,15 +18,38 @@ if USE_LCM:
     from director import lcmUtils
 
 
+def encodeValue(value):
+    return json.dumps(value, cls=numpyjsoncoder.NumpyEncoder, sort_keys=True)
+
+
 class LCMObjectCollection(object):
+    '''
+    A collection of descriptions shared between processes over an lcm
+    channel.
+
+    Each description has a version, a (counter, collectionId) pair that is
+    incremented by the collection that modifies the description, and the
+    newest version of a description wins.  An update of a description that
+    peers already have is published as a delta of the values that changed
+    since the version last published or received.  A peer whose version
+    does not match the base version of a delta requests the description
+    with an echo request.  Echo requests carry the versions of the
+    requester, and the responses contain only the descriptions for which
+    the responder has a newer version.
+    '''
 
     DESCRIPTION_UPDATED_SIGNAL = 'DESCRIPTION_UPDATED_SIGNAL'
     DESCRIPTION_REMOVED_SIGNAL = 'DESCRIPTION_REMOVED_SIGNAL'
 
+    maxSentCommands = 1000
+
     def __init__(self, channel):
         self.collection = OrderedDict()
+        self.versions = {}
+        self.encodedValues = {}
+        self.publishedValues = {}
         self.collectionId = newUUID()
-        self.sentCommands = set()
+        self.sentCommands = OrderedDict()
         self.sentRequest = None
         self.channel = channel
         self.callbacks = callbacks.CallbackRegistry([self.DESCRIPTION_UPDATED_SIGNAL,
@@ -63,15 +86,70 @@ class LCMObjectCollection(object):
     def getDescription(self, descriptionId):
         return self.collection[descriptionId]
 
+    def getVersion(self, descriptionId):
+        return self.versions.get(descriptionId)
+
     def updateDescription(self, desc, publish=True, notify=True):
-        self.collection[self.getDescriptionId(desc)] = desc
+        descriptionId = self.getDescriptionId(desc)
+        encodedValues = dict((key, encodeValue(value)) for key, value in desc.iteritems())
+
+        if encodedValues != self.encodedValues.get(descriptionId):
+            version = self.versions.get(descriptionId)
+            self.versions[descriptionId] = ((version[0] if version else 0) + 1, self.collectionId)
+            self.encodedValues[descriptionId] = encodedValues
+
+        self.collection[descriptionId] = desc
         self._modified()
         if publish and USE_LCM:
-            msg = self._newCommandMessage('update', description=desc)
-            lcmUtils.publish(self.channel, msg)
+            self._publishUpdate(descriptionId)
 
         if notify:
-            self.callbacks.process(self.DESCRIPTION_UPDATED_SIGNAL, self, self.getDescriptionId(desc))
+            self.callbacks.process(self.DESCRIPTION_UPDATED_SIGNAL, self, descriptionId)
+
+    def _publishUpdate(self, descriptionId):
+        '''
+        Publishes the description if its version has not been published or
+        received, as a delta if the peers have an earlier version.
+        '''
+        version = self.versions[descriptionId]
+        encodedValues = self.encodedValues[descriptionId]
+        published = self.publishedValues.get(descriptionId)
+        if published and published[0] == version:
+            return
+
+        desc = self.collection[descriptionId]
+        if published is None:
+            msg = self._newCommandMessage('update', description=desc, version=version)
+        else:
+            baseVersion, baseValues = published
+            changes = dict((key, desc[key]) for key, value in encodedValues.iteritems() if baseValues.get(key) != value)
+            removedKeys = [key for key in baseValues if key not in encodedValues]
+            msg = self._newCommandMessage('update_delta', descriptionId=descriptionId, baseVersion=baseVersion,
+                                          version=version, changes=changes, removedKeys=removedKeys)
+
+        self.publishedValues[descriptionId] = (version, encodedValues)
+        lcmUtils.publish(self.channel, msg)
+
+    def _isNewerVersion(self, descriptionId, version):
+        return descriptionId not in self.collection or version > self.versions.get(descriptionId)
+
+    def _receiveDescription(self, desc, version=None):
+        '''
+        Stores a description received from a peer.  Descriptions from peers
+        that don't send versions are stored as local updates.
+        '''
+        if version is None:
+            self.updateDescription(desc, publish=False)
+            return
+
+        descriptionId = self.getDescriptionId(desc)
+        encodedValues = dict((key, encodeValue(value)) for key, value in desc.iteritems())
+        self.collection[descriptionId] = desc
+        self.versions[descriptionId] = version
+        self.encodedValues[descriptionId] = encodedValues
+        self.publishedValues[descriptionId] = (version, encodedValues)
+        self._modified()
+        self.callbacks.process(self.DESCRIPTION_UPDATED_SIGNAL, self, descriptionId)
 
     def removeDescription(self, descriptionId, publish=True, notify=True):
 
@@ -81,6 +159,9 @@ class LCMObjectCollection(object):
         except KeyError:
             pass
 
+        for versionState in (self.versions, self.encodedValues, self.publishedValues):
+            versionState.pop(descriptionId, None)
+
         if publish and USE_LCM:
             msg = self._newCommandMessage('remove', descriptionId=descriptionId,)
             lcmUtils.publish(self.channel, msg)
@@ -88,16 +169,39 @@ class LCMObjectCollection(object):
         if notify:
             self.callbacks.process(self.DESCRIPTION_REMOVED_SIGNAL, self, descriptionId)
 
-    def sendEchoRequest(self):
+    def sendEchoRequest(self, descriptionIds=None):
+        '''
+        Requests the descriptions for which peers have a newer version, or
+        only the given descriptions if descriptionIds is not None.
+        '''
         self.sentRequest = newUUID()
-        msg = self._newCommandMessage('echo_request', requestId=self.sentRequest)
+        versions = dict((descriptionId, version) for descriptionId, version in self.versions.iteritems()
+                        if descriptionIds is None or descriptionId in descriptionIds)
+        msg = self._newCommandMessage('echo_request', requestId=self.sentRequest, versions=versions, descriptionIds=descriptionIds)
         lcmUtils.publish(self.channel, msg)
 
 
-    def sendEchoResponse(self, requestId=None):
+    def sendEchoResponse(self, requestId=None, versions=None, descriptionIds=None):
+        '''
+        Sends the descriptions that are newer than the given versions of the
+        requester.  If versions is None all descriptions are sent.
+        '''
         if requestId is None:
             requestId = newUUID()
-        msg = self._newCommandMessage('echo_response', requestId=requestId, descriptions=self.collection)
+
+        descriptions = OrderedDict()
+        for descriptionId, desc in self.collection.iteritems():
+            if descriptionIds is not None and descriptionId not in descriptionIds:
+                continue
+            requesterVersion = versions.get(descriptionId) if versions is not None else None
+            if requesterVersion is None or tuple(requesterVersion) < self.versions.get(descriptionId):
+                descriptions[descriptionId] = desc
+
+        if versions is not None and not descriptions:
+            return
+
+        responseVersions = dict((descriptionId, self.versions.get(descriptionId)) for descriptionId in descriptions)
+        msg = self._newCommandMessage('echo_response', requestId=requestId, descriptions=descriptions, versions=responseVersions)
         lcmUtils.publish(self.channel, msg)
 
     def handleEchoResponse(self, data):
@@ -105,15 +209,46 @@ class LCMObjectCollection(object):
         #    return
 
         self.sentRequest = None
-        for desc in data['descriptions'].values():
-            self.updateDescription(desc, publish=False)
+        versions = data.get('versions', {})
+        for descriptionId, desc in data['descriptions'].iteritems():
+            version = versions.get(descriptionId)
+            if version is None:
+                self._receiveDescription(desc)
+            elif self._isNewerVersion(descriptionId, tuple(version)):
+                self._receiveDescription(desc, tuple(version))
+
+    def handleUpdate(self, data):
+        desc = data['description']
+        version = data.get('version')
+        if version is None:
+            self._receiveDescription(desc)
+        elif self._isNewerVersion(self.getDescriptionId(desc), tuple(version)):
+            self._receiveDescription(desc, tuple(version))
+
+    def handleUpdateDelta(self, data):
+        descriptionId = data['descriptionId']
+        version = tuple(data['version'])
+        if not self._isNewerVersion(descriptionId, version):
+            return
+
+        if descriptionId not in self.collection or self.versions.get(descriptionId) != tuple(data['baseVersion']):
+            self.sendEchoRequest([descriptionId])
+            return
+
+        desc = dict(self.collection[descriptionId])
+        desc.update(data['changes'])
+        for key in data['removedKeys']:
+            desc.pop(key, None)
+        self._receiveDescription(desc, version)
 
     def _modified(self):
         self.mtime = getUtime()
 
     def _newCommandMessage(self, commandName, **commandArgs):
         commandId = newUUID()
-        self.sentCommands.add(commandId)
+        self.sentCommands[commandId] = True
+        while len(self.sentCommands) > self.maxSentCommands:
+            self.sentCommands.popitem(last=False)
         commandArgs['commandId'] = commandId
         commandArgs['collectionId'] = self.collectionId
         commandArgs['command'] = commandName
@@ -127,21 +262,22 @@ class LCMObjectCollection(object):
         data = numpyjsoncoder.decode(msg.value)
 
         commandId = data['commandId']
-        if commandId in self.sentCommands:
-            self.sentCommands.remove(commandId)
+        if self.sentCommands.pop(commandId, None):
             return
 
         command = data['command']
 
         if command == 'update':
-            desc = data['description']
-            self.updateDescription(desc, publish=False)
+            self.handleUpdate(data)
+
+        elif command == 'update_delta':
+            self.handleUpdateDelta(data)
 
         elif command == 'remove':
             self.removeDescription(data['descriptionId'], publish=False)
 
         elif command == 'echo_request':
-            self.sendEchoResponse(data['requestId'])
+            self.sendEchoResponse(data['requestId'], data.get('versions'), data.get('descriptionIds'))
 
         elif command == 'echo_response':
             self.handleEchoResponse(data)
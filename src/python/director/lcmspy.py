@@ -1,15 +1,38 @@
 import os
 import sys
 import glob
+import json
+import binascii
 import lcm
 import time
 import math
 import random
+import select
+import threading
+from collections import deque
 
 
 messageTypes = {}
 messageTypeToModule = {}
 
+# fingerprint -> (searchDir, moduleName) of the lcm types that are listed in
+# the manifest but have not been imported yet
+messageManifest = {}
+loadedModules = {}
+
+# the manifest file and search dirs of the last findLCMModulesInSysPath, to
+# rescan when a fingerprint is not in the manifest, and the fingerprints
+# that were still unknown after a rescan
+manifestSearch = {}
+unknownFingerprints = set()
+
+# guards the type tables and the manifest, which are updated by lazy imports
+# in getMessageClass from any thread that decodes messages
+typesLock = threading.RLock()
+
+MANIFEST_VERSION = 2
+manifestFilename = os.path.expanduser('~/.director/lcmspy_manifest.json')
+
 def loadMessageTypes(typesDict, typesModule, verbose=False):
 
     originalSize = len(typesDict)
@@ -22,26 +45,185 @@ def loadMessageTypes(typesDict, typesModule, verbose=False):
         print 'loaded %d lcm message types from: %s' % (len(typesDict) - originalSize, typesModule.__name__)
 
 
-def findLCMModules(searchDir):
-
+def findLCMPackages(searchDir):
+    '''
+    Returns the names of the lcm type packages in the given directory.
+    '''
+    packageNames = []
     initFiles = glob.glob(os.path.join(searchDir, '*/__init__.py'))
     for initFile in initFiles:
         if open(initFile, 'r').readline() == '"""LCM package __init__.py file\n':
-            moduleDir = os.path.dirname(initFile)
-            moduleName = os.path.basename(moduleDir)
-            #print 'loading module:', moduleName
+            moduleName = os.path.basename(os.path.dirname(initFile))
             if moduleName == 'bot_procman':
                 continue
+            packageNames.append(moduleName)
+    return packageNames
+
 
-            sys.path.insert(0, os.path.dirname(moduleDir))
-            module = __import__(moduleName)
-            sys.path.pop(0)
+def loadLCMModule(searchDir, moduleName):
+    with typesLock:
+        module = loadedModules.get((searchDir, moduleName))
+        if module is None:
+            #print 'loading module:', moduleName
+            sys.path.insert(0, searchDir)
+            try:
+                module = __import__(moduleName)
+            finally:
+                sys.path.pop(0)
             loadMessageTypes(messageTypes, module)
+            loadedModules[(searchDir, moduleName)] = module
+        return module
+
+
+def reloadLCMModule(searchDir, moduleName):
+    '''
+    Imports the package again after its type modules were regenerated, and
+    replaces the types of the previous import.
+    '''
+    with typesLock:
+        module = loadedModules.pop((searchDir, moduleName), None)
+        if module is not None:
+            for fingerprint, cls in messageTypes.items():
+                if messageTypeToModule.get(cls) is module:
+                    del messageTypes[fingerprint]
+                    del messageTypeToModule[cls]
+        for name in sys.modules.keys():
+            if name == moduleName or name.startswith(moduleName + '.'):
+                del sys.modules[name]
+        return loadLCMModule(searchDir, moduleName)
+
+
+def findLCMModules(searchDir):
+    for moduleName in findLCMPackages(searchDir):
+        loadLCMModule(searchDir, moduleName)
+
+
+def getPackageMtimes(searchDir, moduleName):
+    '''
+    Returns a dict of the mtimes of the package directory and of each of its
+    python files, so that a type regenerated in place changes the result.
+    '''
+    moduleDir = os.path.join(searchDir, moduleName)
+    mtimes = {'': os.path.getmtime(moduleDir)}
+    for filename in glob.glob(os.path.join(moduleDir, '*.py')):
+        mtimes[os.path.basename(filename)] = os.path.getmtime(filename)
+    return mtimes
+
+
+def loadManifest(filename):
+    try:
+        manifest = json.load(open(filename, 'r'))
+    except (IOError, ValueError):
+        return None
+    return manifest if manifest.get('version') == MANIFEST_VERSION else None
+
+
+def saveManifest(manifest, filename):
+    '''
+    Writes the manifest.  Failure to write is not an error, the manifest
+    is rebuilt on the next startup.
+    '''
+    try:
+        if not os.path.isdir(os.path.dirname(filename)):
+            os.makedirs(os.path.dirname(filename))
+        tempFilename = filename + '.%d.tmp' % os.getpid()
+        json.dump(manifest, open(tempFilename, 'w'))
+        os.rename(tempFilename, filename)
+    except (IOError, OSError):
+        pass
 
 
-def findLCMModulesInSysPath():
-    for searchDir in sys.path:
-        findLCMModules(searchDir)
+def updateManifest(manifest, searchDirs):
+    '''
+    Returns a manifest of the lcm type packages in searchDirs that maps the
+    fingerprint of each type to its package, and whether the manifest was
+    modified.  Entries of the given manifest are reused while the mtimes of
+    the search directory and of the package files are unchanged.  Only
+    packages that are new or modified are imported to read their
+    fingerprints.
+    '''
+    oldDirs = manifest['searchDirs'] if manifest else {}
+    newDirs = {}
+    modified = manifest is None
+
+    for searchDir in searchDirs:
+
+        searchDir = os.path.abspath(searchDir or os.curdir)
+        if searchDir in newDirs or not os.path.isdir(searchDir):
+            continue
+
+        dirMtime = os.path.getmtime(searchDir)
+        oldEntry = oldDirs.get(searchDir, dict(mtime=None, packages={}))
+
+        if oldEntry['mtime'] == dirMtime:
+            packageNames = oldEntry['packages'].keys()
+        else:
+            packageNames = findLCMPackages(searchDir)
+            modified = True
+
+        packages = {}
+        for moduleName in packageNames:
+
+            try:
+                mtimes = getPackageMtimes(searchDir, moduleName)
+            except OSError:
+                modified = True
+                continue
+
+            package = oldEntry['packages'].get(moduleName)
+            if package is None or package['mtimes'] != mtimes:
+                module = reloadLCMModule(searchDir, moduleName) if package else loadLCMModule(searchDir, moduleName)
+                types = dict((binascii.hexlify(fingerprint), cls.__name__) for fingerprint, cls in messageTypes.iteritems()
+                             if messageTypeToModule[cls] is module)
+                package = dict(mtimes=mtimes, types=types)
+                modified = True
+
+            packages[moduleName] = package
+
+        newDirs[searchDir] = dict(mtime=dirMtime, packages=packages)
+
+    modified = modified or set(newDirs.keys()) != set(oldDirs.keys())
+    return dict(version=MANIFEST_VERSION, searchDirs=newDirs), modified
+
+
+def findLCMModulesInSysPath(useManifest=True, filename=None):
+    '''
+    Finds the lcm type packages on sys.path.  With useManifest, the packages
+    are not imported.  Instead, a manifest of type fingerprints is read from
+    disk, or built once if it is missing or out of date, and each package is
+    imported by getMessageClass when one of its fingerprints is first seen.
+    '''
+    if not useManifest:
+        for searchDir in sys.path:
+            findLCMModules(searchDir)
+        return
+
+    filename = filename or manifestFilename
+    searchDirs = list(sys.path)
+    with typesLock:
+        manifestSearch.update(filename=filename, searchDirs=searchDirs, manifest=loadManifest(filename))
+        unknownFingerprints.clear()
+        updateMessageManifest()
+
+
+def updateMessageManifest():
+    '''
+    Updates the manifest of the last findLCMModulesInSysPath and adds its
+    types that are not imported yet to messageManifest.  The caller must
+    hold typesLock.
+    '''
+    filename, searchDirs = manifestSearch['filename'], manifestSearch['searchDirs']
+    manifest, modified = updateManifest(manifestSearch['manifest'], searchDirs)
+    manifestSearch['manifest'] = manifest
+    if modified:
+        saveManifest(manifest, filename)
+
+    for searchDir in [os.path.abspath(searchDir or os.curdir) for searchDir in searchDirs]:
+        for moduleName, package in manifest['searchDirs'].get(searchDir, dict(packages={}))['packages'].iteritems():
+            for fingerprint in package['types']:
+                fingerprint = binascii.unhexlify(fingerprint)
+                if fingerprint not in messageTypes:
+                    messageManifest.setdefault(fingerprint, (searchDir, moduleName))
 
 
 def getUtime():
@@ -56,11 +238,38 @@ def decodeMessage(messageBytes):
     return cls.decode(messageBytes) if cls is not None else None
 
 def getMessageClass(messageBytes):
-    return messageTypes.get(messageBytes[:8])
+    fingerprint = messageBytes[:8]
+    cls = messageTypes.get(fingerprint)
+    if cls is not None:
+        return cls
+
+    with typesLock:
+        cls = messageTypes.get(fingerprint)
+        if cls is None and fingerprint not in messageManifest and manifestSearch and fingerprint not in unknownFingerprints:
+            # the type may have been generated since the manifest was read,
+            # rescan the modified packages once for this fingerprint
+            unknownFingerprints.add(fingerprint)
+            updateMessageManifest()
+            cls = messageTypes.get(fingerprint)
+        if cls is None and fingerprint in messageManifest:
+            searchDir, moduleName = messageManifest.pop(fingerprint)
+            try:
+                loadLCMModule(searchDir, moduleName)
+            except ImportError as e:
+                print 'failed to import lcm types module %s: %s' % (moduleName, e)
+            cls = messageTypes.get(fingerprint)
+        return cls
+
+
+def isMessageType(value):
+    return hasattr(value, '_get_packed_fingerprint')
 
 
 def getModuleNameForMessageType(msgType):
-    return messageTypeToModule[msgType].__name__
+    # types that were imported as dependencies of a lazily loaded package
+    # are not in messageTypeToModule
+    module = messageTypeToModule.get(msgType)
+    return module.__name__ if module else msgType.__module__.split('.')[0]
 
 
 def getMessageTypeFullName(msgType):
@@ -111,7 +320,7 @@ def getArrayFieldInfo(value):
     elif isinstance(value, (list, tuple)):
         arrayType, messageType = getArrayFieldInfo(value)
         return 'array[%d] of ' % len(value) + arrayType, messageType
-    elif type(value) in messageTypeToModule:
+    elif isMessageType(value):
         return getMessageFullName(value), value
     else:
         return 'unknown', None
@@ -139,7 +348,7 @@ def printMessageFields(msg, indent=''):
             print ': array[%d] of ' % len(value) + arrayType
             printMessageFields(messageValue, indent + '  ')
 
-        elif type(value) in messageTypeToModule:
+        elif isMessageType(value):
             print ':', getMessageFullName(value)
             printMessageFields(value, indent + '  ')
         else:
@@ -159,6 +368,171 @@ def printLCMCatalog():
         printMessageFields(lcmCatalog[channel], indent='  ')
 
 
+class ChannelStatistics(object):
+    '''
+    Message statistics of one channel, computed from message sizes and
+    arrival times only.  Keeps totals, the messages received in a sliding
+    time window, and histograms of message size and inter-arrival time with
+    power of two bins: bin i counts sizes in bytes, or intervals in
+    microseconds, in the range [2**(i-1), 2**i).
+    '''
+
+    def __init__(self, channel, windowDuration):
+        self.channel = channel
+        self.windowDuration = windowDuration
+        self.window = deque()
+        self.windowBytes = 0
+        self.messages = 0
+        self.bytes = 0
+        self.minSize = None
+        self.maxSize = 0
+        self.firstTime = None
+        self.lastTime = None
+        self.intervalSum = 0.0
+        self.intervalSquaredSum = 0.0
+        self.sizeHistogram = [0]*33
+        self.intervalHistogram = [0]*64
+
+    def add(self, timestamp, size):
+
+        if self.lastTime is not None:
+            interval = max(timestamp - self.lastTime, 0.0)
+            self.intervalSum += interval
+            self.intervalSquaredSum += interval*interval
+            self.intervalHistogram[min(int(interval*1e6).bit_length(), 63)] += 1
+        else:
+            self.firstTime = timestamp
+
+        self.lastTime = timestamp
+        self.messages += 1
+        self.bytes += size
+        self.minSize = size if self.minSize is None else min(self.minSize, size)
+        self.maxSize = max(self.maxSize, size)
+        self.sizeHistogram[min(size.bit_length(), 32)] += 1
+
+        self.window.append((timestamp, size))
+        self.windowBytes += size
+        self.trimWindow(timestamp)
+
+    def trimWindow(self, now):
+        startTime = now - self.windowDuration
+        while self.window and self.window[0][0] < startTime:
+            self.windowBytes -= self.window.popleft()[1]
+
+    def getStatistics(self, now):
+
+        self.trimWindow(now)
+        windowDuration = min(self.windowDuration, now - self.firstTime) if self.messages > 1 else 0.0
+        numIntervals = self.messages - 1
+        meanInterval = self.intervalSum / numIntervals if numIntervals else 0.0
+        intervalVariance = self.intervalSquaredSum / numIntervals - meanInterval**2 if numIntervals else 0.0
+
+        return dict(channel=self.channel,
+                    messages=self.messages,
+                    bytes=self.bytes,
+                    windowMessages=len(self.window),
+                    windowBytes=self.windowBytes,
+                    rate=len(self.window) / windowDuration if windowDuration > 0 else 0.0,
+                    byteRate=self.windowBytes / windowDuration if windowDuration > 0 else 0.0,
+                    meanSize=self.bytes / float(self.messages),
+                    minSize=self.minSize,
+                    maxSize=self.maxSize,
+                    meanInterval=meanInterval,
+                    jitter=math.sqrt(max(intervalVariance, 0.0)),
+                    sizeHistogram=list(self.sizeHistogram),
+                    intervalHistogram=list(self.intervalHistogram))
+
+
+class LCMStatisticsCollector(object):
+    '''
+    Collects ChannelStatistics for all channels.  Messages are not decoded,
+    so onMessage is cheap enough to call for every message on the thread
+    that handles lcm.  Statistics can be queried from any thread.
+
+    Timestamps are in seconds.  For live traffic they default to the time
+    of arrival, for log files pass the event timestamps.
+    '''
+
+    def __init__(self, windowDuration=5.0):
+        self.windowDuration = windowDuration
+        self.channels = {}
+        self.lastTimestamp = None
+        self.lock = threading.Lock()
+
+    def onMessage(self, channel, messageBytes, timestamp=None):
+        if timestamp is None:
+            timestamp = time.time()
+        with self.lock:
+            stats = self.channels.get(channel)
+            if stats is None:
+                stats = ChannelStatistics(channel, self.windowDuration)
+                self.channels[channel] = stats
+            stats.add(timestamp, len(messageBytes))
+            self.lastTimestamp = timestamp
+
+    def getChannels(self):
+        with self.lock:
+            return sorted(self.channels.keys())
+
+    def getStatistics(self, channel, now=None):
+        '''
+        Returns a dict of statistics for the channel.  The sliding window ends
+        at now, which defaults to the time of the last message received on
+        any channel.
+        '''
+        with self.lock:
+            return self.channels[channel].getStatistics(now if now is not None else self.lastTimestamp)
+
+    def getAllStatistics(self, now=None):
+        return [self.getStatistics(channel, now) for channel in self.getChannels()]
+
+    def reset(self):
+        with self.lock:
+            self.channels = {}
+            self.lastTimestamp = None
+
+    def printStatistics(self, now=None):
+
+        print '%-40s %10s %10s %12s %12s %12s' % ('channel', 'messages', 'rate (hz)', 'kB/s', 'mean size', 'jitter (ms)')
+        for stats in self.getAllStatistics(now):
+            print '%-40s %10d %10.2f %12.2f %12.1f %12.3f' % (stats['channel'], stats['messages'], stats['rate'],
+                    stats['byteRate']/1024.0, stats['meanSize'], stats['jitter']*1e3)
+
+
+class LCMStatisticsThread(object):
+    '''
+    Feeds an LCMStatisticsCollector from a background thread that handles
+    its own lcm instance, so statistics are collected off the GUI thread.
+    '''
+
+    def __init__(self, collector=None, lcmUrl=None, channelRegex='.+'):
+        self.collector = collector or LCMStatisticsCollector()
+        self.lc = lcm.LCM(lcmUrl) if lcmUrl else lcm.LCM()
+        self.sub = self.lc.subscribe(channelRegex, self.collector.onMessage)
+        self.thread = None
+
+    def start(self):
+        self.shouldStop = False
+        self.thread = threading.Thread(target=self.mainLoop)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop(self):
+        self.shouldStop = True
+        self.thread.join()
+        self.lc.unsubscribe(self.sub)
+
+    def mainLoop(self):
+        poll = select.poll()
+        poll.register(self.lc.fileno())
+        while not self.shouldStop:
+            if poll.poll(100):
+                self.lc.handle()
+
+
+lcmStatistics = LCMStatisticsCollector()
+
+
 def printLogFileDescription(filename):
 
     log = lcm.EventLog(filename, 'r')
@@ -167,17 +541,21 @@ def printLogFileDescription(filename):
     print 'log file size: %.2f MB' % (log.size()/(1024.0**2))
 
     for event in log:
+        lcmStatistics.onMessage(event.channel, event.data, event.timestamp*1e-6)
         onLCMMessage(event.channel, event.data)
 
     log.close()
 
     printLCMCatalog()
+    print
+    lcmStatistics.printStatistics()
 
 
 def spyLCMTraffic():
 
     lc = lcm.LCM()
     lc.subscribe('.+', onLCMMessage)
+    lc.subscribe('.+', lcmStatistics.onMessage)
 
     try:
         while True:
@@ -188,13 +566,19 @@ def spyLCMTraffic():
     print
     print
     printLCMCatalog()
+    print
+    lcmStatistics.printStatistics(time.time())
 
 
 def main():
 
     findLCMModulesInSysPath()
 
-    if len(sys.argv) > 1:
+    if len(sys.argv) > 2:
+        # several logs are summarized in parallel from their event headers
+        from director import lcmlogsurvey
+        lcmlogsurvey.printSurvey(lcmlogsurvey.surveyLogs(sys.argv[1:]))
+    elif len(sys.argv) > 1:
         filename = sys.argv[1]
         printLogFileDescription(filename)
     else:
@@ -0,0 +1,86 @@
+from director import applogic as app
+from director import lcmUtils
+from director.timercallback import TimerCallback
+
+from PythonQt import QtCore, QtGui
+
+
+class SubscriberStatisticsPanel(object):
+    '''
+    A table of the message counts, queue delays and callback times of the
+    lcm subscriptions, sorted by the total time spent in the callbacks.
+    The table is refreshed once per second while the panel is visible.
+    '''
+
+    columns = [
+        ('Channel', 'channel', '%s'),
+        ('Callback', 'callback', '%s'),
+        ('Messages', 'messages', '%d'),
+        ('Rate (hz)', 'rate', '%.1f'),
+        ('Dropped', 'droppedMessages', '%d'),
+        ('Throttled', 'throttledMessages', '%d'),
+        ('Delay mean (ms)', 'queueDelayMean', '%.2f'),
+        ('Delay p95 (ms)', 'queueDelay95', '%.2f'),
+        ('Delay max (ms)', 'queueDelayMax', '%.2f'),
+        ('Callback mean (ms)', 'callbackTimeMean', '%.2f'),
+        ('Callback p95 (ms)', 'callbackTime95', '%.2f'),
+        ('Callback max (ms)', 'callbackTimeMax', '%.2f'),
+        ('Load (%)', 'callbackLoad', '%.1f'),
+        ]
+
+    def __init__(self):
+
+        self.widget = QtGui.QWidget()
+        self.widget.setWindowTitle('LCM Subscribers')
+
+        self.table = QtGui.QTableWidget()
+        self.table.setColumnCount(len(self.columns))
+        self.table.setHorizontalHeaderLabels([column[0] for column in self.columns])
+        self.table.verticalHeader().hide()
+        self.table.setEditTriggers(QtGui.QAbstractItemView.NoEditTriggers)
+
+        resetButton = QtGui.QPushButton('Reset')
+        resetButton.connect('clicked()', self.onReset)
+
+        l = QtGui.QVBoxLayout(self.widget)
+        l.addWidget(self.table)
+        l.addWidget(resetButton)
+
+        self.timer = TimerCallback(targetFps=1, callback=self.onTimer)
+        self.timer.start()
+
+    def onTimer(self):
+        if self.widget.isVisible():
+            self.updateTable()
+
+    def onReset(self):
+        lcmUtils.resetSubscriberStatistics()
+        self.updateTable()
+
+    def updateTable(self):
+
+        rows = lcmUtils.getSubscriberStatistics()
+        rows.sort(key=lambda row: row['callbackLoad'], reverse=True)
+
+        self.table.setRowCount(len(rows))
+        for i, row in enumerate(rows):
+            row['callbackLoad'] *= 100.0
+            for j, (title, key, fmt) in enumerate(self.columns):
+                item = QtGui.QTableWidgetItem(fmt % row[key])
+                if j > 1:
+                    item.setTextAlignment(QtCore.Qt.AlignRight | QtCore.Qt.AlignVCenter)
+                self.table.setItem(i, j, item)
+
+        self.table.resizeColumnsToContents()
+
+
+def init():
+
+    global panel
+    global dock
+
+    panel = SubscriberStatisticsPanel()
+    dock = app.addWidgetToDock(panel.widget, action=None)
+    dock.hide()
+
+    return panel
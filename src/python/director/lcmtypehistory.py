@@ -0,0 +1,390 @@
+'''
+Decodes lcm messages that were encoded with older revisions of the lcm type
+definitions in a git repository.
+
+The python modules generated for each historical revision of a type are
+kept in a cache directory, keyed by the type name and a hash of the git
+blobs of the type and its child types, so revisions of the repository that
+didn't change a type share one build.  An index saved in the cache directory
+maps the 8 byte fingerprint at the start of a message to the build of its
+type, and a message with a known fingerprint is decoded without running git
+or lcm-gen.  The index also records the newest revision of each prebuilt
+type, so that a type changed after it was prebuilt is built again.
+
+The builds for every revision of a set of types can be made up front:
+
+    python -m director.lcmtypehistory --repo $DRC_BASE footstep_plan_t ...
+'''
+
+import os
+import sys
+import re
+import imp
+import json
+import hashlib
+import binascii
+import argparse
+import threading
+import subprocess
+
+from director import lcmlogindex
+
+
+INDEX_VERSION = 2
+
+
+def getDefaultCacheDir():
+    return os.path.join(os.path.expanduser('~'), '.cache', 'director', 'lcmtypes')
+
+
+def getBlobHash(data):
+    '''
+    Returns the git blob SHA of the data.
+    '''
+    return hashlib.sha1('blob %d\0' % len(data) + data).hexdigest()
+
+
+class TypeNotFoundError(Exception):
+    pass
+
+
+class HistoricalLCMLoader(object):
+    """
+    A helper class which can be added to a call to addSubscriber in order to allow the subscriber to decode messages which were generated with an older version of the LCM type definitions.
+    """
+    def __init__(self, package_name, lcmtypes_path, repo_path, cache_dir=None):
+        self.package_name = package_name
+        self.lcmtypes_path = lcmtypes_path
+        self.repo_path = repo_path
+        self.cache_dir = os.path.join(cache_dir or getDefaultCacheDir(), package_name)
+        self.type_cache = {}
+        self._mru_shas_cache = {}
+        self._initialized = False
+        self._build_dir = None
+        self._source_dir = None
+        self._index = None
+        self._stale_warnings = set()
+        self._lock = threading.RLock()
+
+    @property
+    def build_dir(self):
+        if self._build_dir is None:
+            self._build_dir = os.path.join(self.cache_dir, 'build')
+            if not os.path.exists(self._build_dir):
+                os.makedirs(self._build_dir)
+        return self._build_dir
+
+    @property
+    def source_dir(self):
+        if self._source_dir is None:
+            self._source_dir = os.path.join(self.cache_dir, 'source')
+            if not os.path.exists(self._source_dir):
+                os.makedirs(self._source_dir)
+        return self._source_dir
+
+    @property
+    def index_file(self):
+        return os.path.join(self.cache_dir, 'index.json')
+
+    @property
+    def index(self):
+        """
+        The type index: for each type name, the build key of each known
+        fingerprint and of each commit SHA seen, and for each type whose
+        revisions have all been built by prebuild(), the newest commit SHA of
+        the type at that time.
+        """
+        if self._index is None:
+            self._index = self.loadIndex()
+        return self._index
+
+    def loadIndex(self):
+        try:
+            index = json.load(open(self.index_file, 'r'))
+        except (IOError, ValueError):
+            index = {}
+        if index.get('version') != INDEX_VERSION:
+            index = dict(version=INDEX_VERSION, fingerprints={}, commits={}, prebuilt={})
+        return index
+
+    def saveIndex(self):
+        """
+        Merges the index into the index file, so that types added by other
+        processes sharing the cache directory are kept.
+        """
+        index = self.loadIndex()
+        for section in ('fingerprints', 'commits'):
+            for type_name, entries in self.index[section].iteritems():
+                index[section].setdefault(type_name, {}).update(entries)
+        index['prebuilt'].update(self.index['prebuilt'])
+        self._index = index
+
+        if not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir)
+        lcmlogindex.writeFileAtomic(self.index_file, lambda f: json.dump(index, f, indent=1, sort_keys=True))
+
+    def getBuildKey(self, type_name, sha):
+        """
+        Returns the key of the build of the given type at the given revision, a hash of the git blob SHAs of the type and its children.
+        """
+        commits = self.index['commits'].setdefault(type_name, {})
+        if sha not in commits:
+            source_files = self.getOrCreateSourceFiles(type_name, sha, recursive=True)
+            blobs = sorted(set('%s %s' % (os.path.basename(f), getBlobHash(open(f, 'rb').read())) for f in source_files))
+            commits[sha] = hashlib.sha1('\n'.join(blobs)).hexdigest()
+        return commits[sha]
+
+    def getBuildDir(self, type_name, key):
+        return os.path.join(self.build_dir, type_name, key)
+
+    def getBuildFile(self, type_name, key):
+        return os.path.join(self.getBuildDir(type_name, key), self.package_name + key, type_name + '.py')
+
+    def buildTypeAtSHA(self, type_name, sha):
+        """
+        Build the python source files for the given type and revision. We rename the python module from its default (which is just the LCM package name) to [packagename][key] to prevent namespace conflicts.
+        """
+        key = self.getBuildKey(type_name, sha)
+        source_files = self.getOrCreateSourceFiles(type_name, sha, recursive=True)
+        sha_build_dir = self.getBuildDir(type_name, key)
+        if not os.path.exists(sha_build_dir):
+            os.makedirs(sha_build_dir)
+        final_pkg_dir = os.path.join(sha_build_dir, self.package_name + key)
+        if not os.path.exists(final_pkg_dir):
+            os.makedirs(final_pkg_dir)
+        subprocess.check_call("lcm-gen --lazy -p --ppath {build:s} {sources:s}".format(
+                                      build=sha_build_dir,
+                                      sources=' '.join(sorted(set(source_files)))),
+                              shell=True)
+        build_files = [f for f in os.listdir(os.path.join(sha_build_dir, self.package_name))
+                       if f.endswith('.py')]
+        build_type_names = [t.replace('.py', '') for t in build_files]
+        for f in build_files:
+            subprocess.check_call(r"perl -ne 's/{pkg:s}(?=\.({type_list:s}[^a-zA-Z0-9_]))/{pkg:s}{key:s}/g; print;' < {infile:s} > {outfile:s}".format(
+                    pkg=self.package_name,
+                    type_list = '|'.join(build_type_names),
+                    key=key,
+                    infile=os.path.join(sha_build_dir, self.package_name, f),
+                    outfile=os.path.join(final_pkg_dir, f)),
+                                      shell=True)
+
+    def getOrCreateBuildFile(self, type_name, sha):
+        target = self.getBuildFile(type_name, self.getBuildKey(type_name, sha))
+        if not os.path.exists(target):
+            self.buildTypeAtSHA(type_name, sha)
+        return target
+
+    def getOrCreateSourceFiles(self, type_name, sha, recursive=False):
+        """
+        Find the LCM source files for the given type at the given revision, pulling them out of the git history as needed. Also finds the source files for the children of that type if recursive=True.
+        """
+        fname = self.package_name + '_' + type_name + '.lcm'
+        source_dir = os.path.join(self.source_dir, sha)
+        if not os.path.exists(source_dir):
+            os.makedirs(source_dir)
+        targets = [os.path.join(self.source_dir, sha, fname)]
+        if not os.path.exists(targets[0]):
+            try:
+                subprocess.check_call("git -C {base:s} show {sha:s}:{typepath:s} > {fpath:s}".format(
+                                        base=self.repo_path, sha=sha,
+                                        typepath=os.path.join(self.lcmtypes_path, fname),
+                                        fpath=targets[0]),
+                                     shell=True)
+            except subprocess.CalledProcessError:
+                os.remove(targets[0])
+                raise TypeNotFoundError("The target LCMtype cannot be found at this revision")
+        if recursive:
+            for child in self.getChildTypes(type_name, sha):
+                targets.extend(self.getOrCreateSourceFiles(child, sha, recursive=True))
+        return targets
+
+    def getChildTypes(self, type_name, sha):
+        """
+        Find the children of a given type by parsing the output of lcm-gen -d
+        """
+        source_file = self.getOrCreateSourceFiles(type_name, sha)[0]
+        children = []
+        debug_data = subprocess.check_output("lcm-gen -d {fpath:s}".format(fpath=source_file),
+                                             shell=True)
+        debug_lines = debug_data.split('\n')
+        for line in debug_lines:
+            line = line.lstrip()
+            match = re.match(r"{pkg:s}\.(?P<childname>[^\s]+)".format(pkg=self.package_name), line)
+            if match:
+                child = (match.groupdict()['childname'])
+                if child != type_name:
+                    children.append(child)
+        return children
+
+    def getSHAsForType(self, type_name):
+        """
+        Find the git SHAs for all revisions to a particular type
+        """
+        relative_type_path = os.path.join(self.lcmtypes_path, "{package_name:s}_{type_name:s}.lcm".format(
+            package_name=self.package_name, type_name=type_name))
+        cdata = subprocess.check_output("git --no-pager -C {0:s} log --pretty=oneline {1:s}".format(
+            self.repo_path, relative_type_path), shell=True)
+        shas = [c[:40] for c in cdata.split('\n') if len(c) >= 40]
+        return shas
+
+    def getSHAsForTypeAndChildren(self, type_name, processed=None):
+        """
+        Find the git SHAs for all revisions to a type *and* all of its children
+        """
+        shas = set([])
+        if processed is None:
+            processed = set([])
+
+        shas.update(self.getSHAsForType(type_name))
+        child_shas = set([])
+        for sha in shas:
+            try:
+                for child in self.getChildTypes(type_name, sha):
+                    if (child, sha) not in processed:
+                        processed.add((child, sha))
+                        child_shas.update(self.getSHAsForTypeAndChildren(child, processed))
+
+            except TypeNotFoundError:
+                continue
+        shas.update(child_shas)
+        return shas
+
+    def getTypeForKey(self, type_name, key):
+        """
+        Get the python class of a build, which must exist in the cache directory
+        """
+        if not (type_name, key) in self.type_cache:
+            build_file = self.getBuildFile(type_name, key)
+            path = sys.path[:]
+            sys.path.insert(0, self.getBuildDir(type_name, key))
+            try:
+                module = imp.load_source(type_name, build_file)
+            finally:
+                sys.path = path
+            self.type_cache[(type_name, key)] = module.__dict__[type_name]
+
+        return self.type_cache[(type_name, key)]
+
+    def getTypeAtSHA(self, type_name, sha):
+        """
+        Get the python class for a given LCM type at a given revision, building it as necessary, and add its fingerprint to the index
+        """
+        self.getOrCreateBuildFile(type_name, sha)
+        key = self.getBuildKey(type_name, sha)
+        msg_class = self.getTypeForKey(type_name, key)
+        fingerprint = binascii.hexlify(msg_class._get_packed_fingerprint())
+        self.index['fingerprints'].setdefault(type_name, {})[fingerprint] = key
+        return msg_class
+
+    def getIndexedType(self, type_name, msg_data):
+        """
+        Returns the python class whose fingerprint matches the message data if it is in the index, otherwise None
+        """
+        key = self.index['fingerprints'].get(type_name, {}).get(binascii.hexlify(msg_data[:8]))
+        if key is None or not os.path.exists(self.getBuildFile(type_name, key)):
+            return None
+        return self.getTypeForKey(type_name, key)
+
+    def prebuild(self, type_names):
+        """
+        Build every historical revision of the given types and their children, and save the index so that later decodes of these types don't need git or lcm-gen. Returns a dict of type name to the number of distinct builds.
+        """
+        with self._lock:
+            builds = {}
+            for type_name in type_names:
+                shas = self.getSHAsForType(type_name)
+                newest_sha = shas[0] if shas else None
+                keys = set()
+                for sha in self.getSHAsForTypeAndChildren(type_name):
+                    try:
+                        self.getTypeAtSHA(type_name, sha)
+                    except TypeNotFoundError:
+                        continue
+                    except subprocess.CalledProcessError as e:
+                        print 'failed to build {type_name:s} at {sha:s}: {error:s}'.format(type_name=type_name, sha=sha, error=e)
+                        continue
+                    keys.add(self.getBuildKey(type_name, sha))
+                builds[type_name] = len(keys)
+                self.index['prebuilt'][type_name] = newest_sha
+                self._stale_warnings.discard(type_name)
+                self.saveIndex()
+            return builds
+
+    def isPrebuiltCurrent(self, type_name):
+        """
+        Returns True if the type was prebuilt and has no newer revision than the one it was prebuilt at. This runs git, so it is not called by decode.
+        """
+        if type_name not in self.index['prebuilt']:
+            return False
+        shas = self.getSHAsForType(type_name)
+        return not shas or shas[0] == self.index['prebuilt'][type_name]
+
+    def decode(self, type_name, msg_data):
+        """
+        Try to decode an LCM message using its historical definitions. The fingerprint index is tried first, and an unknown fingerprint of a prebuilt type fails without running git or lcm-gen; the prebuild may be stale, and is rebuilt by prebuild() or the command line of this module. If the type has not been prebuilt, uses a MRU (most recently used) queue of commit SHAs to try to ensure that repeated calls for messages of the same type are fast
+        """
+        with self._lock:
+            msg_class = self.getIndexedType(type_name, msg_data)
+            if msg_class is not None:
+                return msg_class.decode(msg_data)
+            if type_name in self.index['prebuilt']:
+                if type_name not in self._stale_warnings:
+                    print "Warning: no prebuilt definition of {type_name:s} matches a received message, the prebuild may be stale. Run python -m director.lcmtypehistory --package {package:s} {type_name:s} to rebuild it.".format(type_name=type_name, package=self.package_name)
+                    self._stale_warnings.add(type_name)
+                raise ValueError("Unable to decode message data, its fingerprint does not match any prebuilt type definition.")
+
+            if not self._initialized:
+                print "Warning: Possible out-of-date LCM message received. I will now try to decode the message using older versions of the type definition. This will be slow the first time it happens."
+                self._initialized = True
+            i = 0
+            if not type_name in self._mru_shas_cache:
+                self._mru_shas_cache[type_name] = list(self.getSHAsForTypeAndChildren(type_name))
+            for i, sha in enumerate(self._mru_shas_cache[type_name]):
+                try:
+                    msg_class = self.getTypeAtSHA(type_name, sha)
+                except TypeNotFoundError:
+                    continue
+                try:
+                    # print "Trying to decode using definition of type from commit {sha:s}".format(sha=sha[:8])
+                    msg_obj = msg_class.decode(msg_data)
+                except ValueError as e:
+                    continue
+                self._mru_shas_cache[type_name].pop(i)
+                self._mru_shas_cache[type_name].insert(0, sha)
+                self.saveIndex()
+                return msg_obj
+            self.saveIndex()
+            raise ValueError("Unable to decode message data with any available type definitions.")
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Build the python modules of every historical revision of lcm types.')
+    parser.add_argument('types', nargs='+', help='lcm type names, without the package')
+    parser.add_argument('--package', default='drc', help='lcm package name')
+    parser.add_argument('--lcmtypes-path', default='software/drc_lcmtypes/lcmtypes', help='directory of the lcm files relative to the repository')
+    parser.add_argument('--repo', default=os.getenv('DRC_BASE'), help='git repository, defaults to $DRC_BASE')
+    parser.add_argument('--cache-dir', default=None, help='cache directory, defaults to %s' % getDefaultCacheDir())
+    parser.add_argument('--check', action='store_true', help='only report the types whose prebuild is missing or stale')
+    args = parser.parse_args()
+
+    if not args.repo:
+        parser.error('no repository given and DRC_BASE is not set')
+
+    loader = HistoricalLCMLoader(args.package, args.lcmtypes_path, args.repo, args.cache_dir)
+
+    if args.check:
+        staleTypes = [type_name for type_name in args.types if not loader.isPrebuiltCurrent(type_name)]
+        for type_name in staleTypes:
+            print '%-40s stale' % type_name
+        sys.exit(1 if staleTypes else 0)
+
+    builds = loader.prebuild(args.types)
+
+    for type_name in args.types:
+        print '%-40s %d revisions' % (type_name, builds[type_name])
+    print 'cache:', loader.cache_dir
+
+
+if __name__ == '__main__':
+    main()
@@ -1,18 +1,79 @@
 from director import lcmobjectcollection
 from director import geometryencoder
 from director import ioUtils
+from director import callbacks
+from director.thirdparty import numpyjsoncoder
+from director.timercallback import TimerCallback
+from director.utime import getUtime
 from director.uuidutil import newUUID
+import numpy as np
+import random
+import time
 import os
 
+if lcmobjectcollection.USE_LCM:
+    import bot_core as lcmbotcore
+    from director import lcmUtils
+
 
 class MeshManager(object):
+    '''
+    Shares meshes between peers.  The mesh collection only carries a small
+    description of each mesh with its content hash.  The mesh data itself is
+    compressed and sent in chunks on a separate data channel, only when a
+    peer that doesn't hold the mesh requests the chunks it is missing, so an
+    interrupted transfer resumes where it stopped.  The peer that published
+    a mesh answers requests for it at once, other peers that hold the mesh
+    answer after a random backoff unless the requested chunks are sent by
+    another peer first.  Mesh data is cached by content hash in memory and
+    in the cache directory, so a mesh that a peer already holds is never
+    transferred or decoded again.
+
+    Peers running the older mesh manager read the mesh from a 'data' value
+    of the description.  Set includeInlineData to publish it for them.
+    '''
+
+    MESH_ADDED_SIGNAL = 'MESH_ADDED_SIGNAL'
 
     def __init__(self):
         self.meshes = {}
+        self.meshHashes = {}
+        self.hashToMeshId = {}
+        self.meshData = {}
+        self.pendingTransfers = {}
+        self.pendingMeshIds = {}
         self.cacheDirectory = '/tmp'
         self.cacheDataType = 'stl'
+        self.chunkSize = 32*1024
+        self.compressionLevel = 6
+        self.resumeInterval = 1.0
+        self.maxResumeRequests = 10
+        self.answerBackoff = 0.5
+        self.pendingAnswers = {}
+        self.senderId = newUUID()
+        self.includeInlineData = False
+        self.callbacks = callbacks.CallbackRegistry([self.MESH_ADDED_SIGNAL])
         self.collection = lcmobjectcollection.LCMObjectCollection(channel='MESH_COLLECTION_COMMAND')
         self.collection.connectDescriptionUpdated(self._onDescriptionUpdated)
+        self.dataChannel = 'MESH_COLLECTION_DATA'
+        self.resumeTimer = TimerCallback(callback=self._onResumeTimer)
+        self.answerTimer = TimerCallback(callback=self._onAnswerTimer)
+        self.sub = None
+
+        if lcmobjectcollection.USE_LCM:
+            self.sub = lcmUtils.addSubscriber(self.dataChannel, messageClass=lcmbotcore.system_status_t, callback=self._onDataMessage)
+            self.sub.setNotifyAllMessagesEnabled(True)
+
+    def close(self):
+        '''
+        Stops receiving and answering mesh data.
+        '''
+        if self.sub:
+            lcmUtils.removeSubscriber(self.sub)
+            self.sub = None
+        self.resumeTimer.singleShotTimer.stop()
+        self.answerTimer.singleShotTimer.stop()
+        self.pendingAnswers.clear()
 
     def add(self, polyData, publish=True):
         meshId = newUUID()
@@ -24,6 +85,23 @@ class MeshManager(object):
     def get(self, meshId):
         return self.meshes.get(meshId)
 
+    def isPending(self, meshId):
+        '''
+        Returns True if the mesh is described but its data is still being
+        transferred.
+        '''
+        return any(meshId in meshIds for meshIds in self.pendingMeshIds.itervalues())
+
+    def connectMeshAdded(self, func):
+        '''
+        Connects func(meshId) to be called when a mesh received from a peer
+        is ready.
+        '''
+        return self.callbacks.connect(self.MESH_ADDED_SIGNAL, func)
+
+    def disconnectMeshAdded(self, callbackId):
+        self.callbacks.disconnect(callbackId)
+
     def getFilesystemFilename(self, meshId):
         if meshId in self.meshes:
             filename = os.path.join(self.cacheDirectory, '%s.%s' % (meshId, self.cacheDataType))
@@ -32,14 +110,233 @@ class MeshManager(object):
             return filename
         return None
 
+    def getCacheFilename(self, contentHash):
+        return os.path.join(self.cacheDirectory, '%s.ddmesh' % contentHash)
+
+    def getMissingChunks(self, contentHash):
+        transfer = self.pendingTransfers.get(contentHash)
+        return transfer.getMissingChunks() if transfer else []
+
+    def _addMesh(self, meshId, contentHash, polyData):
+        self.meshes[meshId] = polyData
+        self.meshHashes[meshId] = contentHash
+        self.hashToMeshId.setdefault(contentHash, meshId)
+        self.callbacks.process(self.MESH_ADDED_SIGNAL, meshId)
+
+    def _storeMeshData(self, contentHash, data):
+        '''
+        Keeps the compressed mesh data to answer chunk requests and writes it
+        to the cache directory.  Failure to write the cache file is not an error.
+        '''
+        self.meshData[contentHash] = data
+        filename = self.getCacheFilename(contentHash)
+        if os.path.isfile(filename):
+            return
+        try:
+            with open(filename, 'wb') as f:
+                f.write(data.tostring())
+        except (IOError, OSError):
+            pass
+
+    def _loadMeshData(self, contentHash):
+        '''
+        Returns the compressed mesh data for the given content hash from
+        memory or from the cache directory, or None if it is not cached.
+        '''
+        if contentHash in self.meshData:
+            return self.meshData[contentHash]
+
+        filename = self.getCacheFilename(contentHash)
+        if not os.path.isfile(filename):
+            return None
+
+        data = np.fromfile(filename, dtype=np.int8)
+        try:
+            valid = geometryencoder.getContentHash(geometryencoder.decompressData(data)) == contentHash
+        except Exception:
+            valid = False
+        if not valid:
+            return None
+
+        self.meshData[contentHash] = data
+        return data
+
     def _publishMesh(self, meshId):
         polyData = self.meshes[meshId]
-        self.collection.updateDescription(dict(uuid=meshId, data=geometryencoder.encodePolyData(polyData)), notify=False)
+        encoded = geometryencoder.encodePolyData(polyData)
+        contentHash = geometryencoder.getContentHash(encoded)
+        self.meshHashes[meshId] = contentHash
+        self.hashToMeshId.setdefault(contentHash, meshId)
+
+        data = self._loadMeshData(contentHash)
+        if data is None:
+            data = geometryencoder.compressData(encoded, self.compressionLevel)
+            self._storeMeshData(contentHash, data)
+
+        numChunks = len(geometryencoder.splitChunks(data, self.chunkSize))
+        desc = dict(uuid=meshId, contentHash=contentHash, encoding='zlib', size=len(data), numChunks=numChunks, senderId=self.senderId)
+        if self.includeInlineData:
+            desc['data'] = encoded
+        self.collection.updateDescription(desc, notify=False)
 
     def _onDescriptionUpdated(self, collection, descriptionId):
         desc = collection.getDescription(descriptionId)
         meshId = desc['uuid']
-        if meshId not in self.meshes:
+        if meshId in self.meshes:
+            return
+
+        # descriptions from peers that send the uncompressed mesh inline
+        if 'data' in desc:
             polyData = geometryencoder.decodePolyData(desc['data'])
-            self.meshes[meshId] = polyData
-            #print 'decoded polydata with %d points' % polyData.GetNumberOfPoints()
+            self._addMesh(meshId, geometryencoder.getContentHash(desc['data']), polyData)
+            return
+
+        contentHash = desc['contentHash']
+        if contentHash in self.hashToMeshId:
+            self._addMesh(meshId, contentHash, self.meshes[self.hashToMeshId[contentHash]])
+            return
+
+        data = self._loadMeshData(contentHash)
+        if data is not None:
+            self._decodeMesh([meshId], contentHash, data)
+            return
+
+        self.pendingMeshIds.setdefault(contentHash, set()).add(meshId)
+        newTransfer = contentHash not in self.pendingTransfers
+        transfer = self._getTransfer(contentHash, desc['numChunks'], desc['size'])
+        transfer.sourceId = desc.get('senderId')
+        if newTransfer:
+            self._requestMissingChunks(contentHash, transfer)
+        self._scheduleResume()
+
+    def _getTransfer(self, contentHash, numChunks, size):
+        transfer = self.pendingTransfers.get(contentHash)
+        if transfer is None:
+            transfer = geometryencoder.ChunkAssembler(numChunks, size)
+            transfer.resumeRequests = 0
+            transfer.sourceId = None
+            self.pendingTransfers[contentHash] = transfer
+        return transfer
+
+    def _decodeMesh(self, meshIds, contentHash, data):
+        polyData = geometryencoder.decodePolyData(geometryencoder.decompressData(data))
+        for meshId in meshIds:
+            self._addMesh(meshId, contentHash, polyData)
+        #print 'decoded polydata with %d points' % polyData.GetNumberOfPoints()
+
+    def handleChunk(self, data):
+        contentHash = data['contentHash']
+        if contentHash in self.meshData or contentHash in self.hashToMeshId:
+            return
+
+        transfer = self._getTransfer(contentHash, data['numChunks'], data['size'])
+        transfer.addChunk(data['index'], data['data'])
+        transfer.resumeRequests = 0
+        if not transfer.isComplete():
+            # chunks are still arriving, so wait a full interval from this
+            # one before requesting the missing chunks
+            self.resumeTimer.singleShot(self.resumeInterval)
+            return
+
+        del self.pendingTransfers[contentHash]
+        meshData = transfer.getData()
+        if geometryencoder.getContentHash(geometryencoder.decompressData(meshData)) != contentHash:
+            return
+
+        self._storeMeshData(contentHash, meshData)
+        meshIds = self.pendingMeshIds.pop(contentHash, set())
+        if meshIds:
+            self._decodeMesh(meshIds, contentHash, meshData)
+
+    def handleChunkRequest(self, data):
+        contentHash = data['contentHash']
+        if self._loadMeshData(contentHash) is None:
+            return
+
+        if data.get('sourceId') == self.senderId:
+            self._publishChunks(contentHash, data['chunks'])
+            return
+
+        deadline, chunks = self.pendingAnswers.get(contentHash, (None, set()))
+        if deadline is None:
+            deadline = time.time() + random.uniform(0.5, 1.0)*self.answerBackoff
+        chunks.update(data['chunks'])
+        self.pendingAnswers[contentHash] = (deadline, chunks)
+        self._scheduleAnswers()
+
+    def _onChunkSent(self, contentHash, index):
+        '''
+        Drops a chunk from the pending answers once another peer sent it.
+        '''
+        if contentHash in self.pendingAnswers:
+            self.pendingAnswers[contentHash][1].discard(index)
+
+    def _scheduleAnswers(self):
+        if self.pendingAnswers:
+            nextDeadline = min(deadline for deadline, chunks in self.pendingAnswers.values())
+            self.answerTimer.singleShot(max(nextDeadline - time.time(), 0.0))
+
+    def _onAnswerTimer(self):
+        now = time.time()
+        for contentHash, (deadline, chunks) in self.pendingAnswers.items():
+            if deadline <= now:
+                del self.pendingAnswers[contentHash]
+                if chunks:
+                    self._publishChunks(contentHash, sorted(chunks))
+        self._scheduleAnswers()
+
+    def _scheduleResume(self):
+        if self.pendingTransfers and not self.resumeTimer.singleShotTimer.isActive():
+            self.resumeTimer.singleShot(self.resumeInterval)
+
+    def _onResumeTimer(self):
+        '''
+        Requests the missing chunks of pending transfers.  A transfer is
+        dropped after maxResumeRequests unanswered requests, it is started
+        again when the mesh description is received again.
+        '''
+        for contentHash, transfer in self.pendingTransfers.items():
+            if transfer.resumeRequests >= self.maxResumeRequests:
+                del self.pendingTransfers[contentHash]
+                self.pendingMeshIds.pop(contentHash, None)
+                continue
+            self._requestMissingChunks(contentHash, transfer)
+
+        self._scheduleResume()
+
+    def _requestMissingChunks(self, contentHash, transfer):
+        transfer.resumeRequests += 1
+        self._publishDataMessage('request', contentHash=contentHash, chunks=transfer.getMissingChunks(), sourceId=transfer.sourceId)
+
+    def _publishChunks(self, contentHash, chunkIndices):
+        data = self.meshData[contentHash]
+        chunks = geometryencoder.splitChunks(data, self.chunkSize)
+        for index in chunkIndices:
+            if 0 <= index < len(chunks):
+                self._publishDataMessage('chunk', contentHash=contentHash, index=index,
+                                         numChunks=len(chunks), size=len(data), data=chunks[index])
+
+    def _publishDataMessage(self, commandName, **commandArgs):
+        if not lcmobjectcollection.USE_LCM:
+            return
+        commandArgs['senderId'] = self.senderId
+        commandArgs['command'] = commandName
+        msg = lcmbotcore.system_status_t()
+        msg.value = numpyjsoncoder.encode(commandArgs)
+        msg.utime = getUtime()
+        lcmUtils.publish(self.dataChannel, msg)
+
+    def _onDataMessage(self, msg):
+
+        data = numpyjsoncoder.decode(msg.value)
+        if data['senderId'] == self.senderId:
+            return
+
+        command = data['command']
+
+        if command == 'chunk':
+            self._onChunkSent(data['contentHash'], data['index'])
+            self.handleChunk(data)
+
+        elif command == 'request':
+            self.handleChunkRequest(data)
@@ -2,6 +2,9 @@ import os
 import sys
 import vtk
 import math
+import time
+import threading
+from collections import OrderedDict
 import PythonQt
 from PythonQt import QtCore, QtGui
 import director.objectmodel as om
@@ -14,6 +17,9 @@ import vtkDRCFiltersPython as drc
 from director.debugVis import DebugData
 import director.visualization as vis
 from director import vtkNumpy as vnp
+from director.pointcloudbuffer import RollingPointBuffer
+from director import pointcloudlod
+from director.depthimageprovider import DepthMapCache
 import numpy as np
 
 import drc as lcmdrc
@@ -43,6 +49,8 @@ class MultisenseItem(om.ObjectModelItem):
                          attributes=om.PropertyAttributes(decimals=0, minimum=0.0, maximum=60.0, singleStep=1, hidden=False))
         self.addProperty('Number of Scan Lines', model.numberOfScanLines,
                          attributes=om.PropertyAttributes(decimals=0, minimum=0, maximum=100, singleStep=1, hidden=False))
+        self.addProperty('Rolling Window', model.rollingWindowDuration,
+                         attributes=om.PropertyAttributes(decimals=1, minimum=0.0, maximum=30.0, singleStep=0.5, hidden=False))
         self.addProperty('Visible', model.visible)
         self.addProperty('Point Size', model.pointSize,
                          attributes=om.PropertyAttributes(decimals=0, minimum=1, maximum=20, singleStep=1, hidden=False))
@@ -82,6 +90,9 @@ class MultisenseItem(om.ObjectModelItem):
             self.model.numberOfScanLines = self.getProperty(propertyName)
             self.model.initScanLines()
 
+        elif propertyName == 'Rolling Window':
+            self.model.setRollingWindowDuration(self.getProperty(propertyName))
+
         elif propertyName in ('Min Range', 'Max Range'):
             self.model.reader.SetDistanceRange(self.getProperty('Min Range'), self.getProperty('Max Range'))
             self.model.showRevolution(self.model.displayedRevolution)
@@ -286,6 +297,12 @@ class MultiSenseSource(TimerCallback):
         self.visible = True
         self.initScanLines()
 
+        self.rollingWindowDuration = 0.0
+        self.rollingWindowPointsPerSecond = 60000
+        self.rollingBuffer = None
+        self.lastBufferedScanLine = -1
+        self.scanLinePolyData = vtk.vtkPolyData()
+
         self.revPolyData = vtk.vtkPolyData()
         self.polyDataObj = vis.PolyDataItem('Multisense Sweep', self.revPolyData, view)
         self.polyDataObj.actor.SetPickable(1)
@@ -315,22 +332,56 @@ class MultiSenseSource(TimerCallback):
     def getScanToLocal(self):
         return None
 
+    def setRollingWindowDuration(self, duration):
+        '''
+        Sets the length in seconds of the rolling window of scan lines shown
+        in place of full revolutions.  A duration of 0 shows revolutions.
+        '''
+        self.rollingWindowDuration = duration
+
+        if not duration:
+            self.rollingBuffer = None
+            self.polyDataObj.setPolyData(self.revPolyData)
+            self.displayedRevolution = -1
+            return
+
+        capacity = int(duration*self.rollingWindowPointsPerSecond)
+        if self.rollingBuffer and self.rollingBuffer.capacity >= capacity:
+            self.rollingBuffer.setWindowDuration(duration)
+            return
+
+        self.rollingBuffer = RollingPointBuffer(capacity, duration)
+        self.lastBufferedScanLine = self.reader.GetCurrentScanLine() - 1 if self.reader else -1
+        self.polyDataObj.setPolyData(self.rollingBuffer.polyData)
+
+    def getPointCloud(self):
+        '''
+        Returns the currently displayed sweep, either the last revolution or
+        a copy of the rolling window.
+        '''
+        if self.rollingBuffer:
+            return self.rollingBuffer.getWindowPolyData()
+        return self.revPolyData
+
     def showRevolution(self, revId):
 
         self.reader.GetDataForRevolution(revId, self.revPolyData)
         self.displayedRevolution = revId
-
-        if self.showRevolutionCallback:
-            self.showRevolutionCallback()
-        if self.colorizeCallback and self.polyDataObj.getPropertyEnumValue('Color By') == 'rgb':
-            self.colorizeCallback()
+        self._onRevolutionShown()
 
         self.polyDataObj._updateColorByProperty()
         self.polyDataObj._updateColorBy()
+        self.polyDataObj._updateLevelOfDetail()
 
         if self.polyDataObj.getProperty('Visible'):
             self.view.render()
 
+    def _onRevolutionShown(self):
+        if self.showRevolutionCallback:
+            self.showRevolutionCallback()
+        if self.colorizeCallback and self.polyDataObj.getPropertyEnumValue('Color By') == 'rgb':
+            self.colorizeCallback()
+
 
     def setPointSize(self, pointSize):
         for scanLine in self.scanLines:
@@ -396,6 +447,43 @@ class MultiSenseSource(TimerCallback):
 
         self.showRevolution(currentRevolution)
 
+    def updateRollingWindow(self, maxScanLines=200):
+        '''
+        Appends the scan lines received since the last update to the rolling
+        window.  displayedRevolution still follows the revolutions of the
+        reader, and the revolution callbacks are called when it advances, so
+        code waiting for a new sweep works in both display modes.
+        '''
+        currentRevolution = self.reader.GetCurrentRevolution() - 1
+        currentScanLine = self.reader.GetCurrentScanLine() - 1
+        firstScanLine = max(self.lastBufferedScanLine + 1, currentScanLine - maxScanLines + 1)
+        if currentScanLine < firstScanLine:
+            return
+
+        buf = self.rollingBuffer
+        arrayNames = buf.getArrayNames()
+
+        for scanLineId in xrange(firstScanLine, currentScanLine + 1):
+            utime = self.reader.GetScanTimeForScanLine(scanLineId)
+            if utime < 0:
+                continue
+            self.reader.GetDataForScanLine(scanLineId, self.scanLinePolyData)
+            buf.addScanLine(self.scanLinePolyData, utime)
+
+        self.lastBufferedScanLine = currentScanLine
+        buf.update()
+
+        if currentRevolution != self.displayedRevolution:
+            self.displayedRevolution = currentRevolution
+            self._onRevolutionShown()
+
+        if buf.getArrayNames() != arrayNames:
+            self.polyDataObj._updateColorByProperty()
+            self.polyDataObj._updateColorBy()
+
+        if self.polyDataObj.getProperty('Visible'):
+            self.view.render()
+
     def getSpindleAxis(self):
         return self.getAxis('MULTISENSE_SCAN', [1.0, 0.0, 0.0])
 
@@ -409,7 +497,10 @@ class MultiSenseSource(TimerCallback):
         return t
 
     def tick(self):
-        self.updateRevolution()
+        if self.rollingBuffer:
+            self.updateRollingWindow()
+        else:
+            self.updateRevolution()
         self.updateScanLines()
 
 
@@ -700,6 +791,100 @@ class SpindleMonitor(object):
         return self.spindleSpinRateAverager.getAverage()
 
 
+class MapFetchThread(threading.Thread):
+    '''
+    Calls fetchFunction(viewId, mapId) on a worker thread for requested maps
+    and holds the results until they are taken by the GUI thread.  Only the
+    newest requested map id of each view is fetched.  A pending request is
+    replaced when a newer map id is requested for its view, and the result
+    of a fetch that finishes after a newer request is discarded.  A failed
+    fetch is forgotten, so the map is requested again on the next update.
+
+    The wrapped vtk calls made by fetchFunction hold the GIL, so the fetch
+    does not run in parallel with python code on the GUI thread.  What the
+    thread buys is that the GUI thread does not wait for the fetch: the
+    event loop keeps rendering and handling events that do not enter
+    python while the fetch runs.  fetchTime records the time spent in
+    fetchFunction, which is time the GUI thread no longer spends.
+    '''
+
+    def __init__(self, fetchFunction):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.fetchFunction = fetchFunction
+        self.condition = threading.Condition()
+        self.requests = OrderedDict()
+        self.requestedMapIds = {}
+        self.results = {}
+        self.fetching = False
+        self.stopped = False
+        self.fetches = 0
+        self.fetchTime = 0.0
+        self.maxFetchTime = 0.0
+
+    def request(self, viewId, mapId):
+        with self.condition:
+            if self.requestedMapIds.get(viewId) == mapId:
+                return
+            self.requestedMapIds[viewId] = mapId
+            self.requests.pop(viewId, None)
+            self.requests[viewId] = mapId
+            self.results.pop(viewId, None)
+            self.condition.notify()
+
+    def takeResults(self):
+        '''
+        Returns a dict of view id to (mapId, result) for the fetches that
+        finished since the last call.
+        '''
+        with self.condition:
+            results, self.results = self.results, {}
+        return results
+
+    def getStatistics(self):
+        with self.condition:
+            return dict(fetches=self.fetches,
+                        fetchTime=self.fetchTime,
+                        maxFetchTime=self.maxFetchTime)
+
+    def stop(self):
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+
+    def run(self):
+
+        while True:
+
+            with self.condition:
+                while not self.requests and not self.stopped:
+                    self.condition.wait()
+                if self.stopped:
+                    return
+                viewId, mapId = self.requests.popitem(last=False)
+                self.fetching = True
+
+            startTime = time.time()
+            try:
+                result = self.fetchFunction(viewId, mapId)
+            except Exception as e:
+                print 'failed to fetch map %d for view %d: %s' % (mapId, viewId, e)
+                with self.condition:
+                    self.fetching = False
+                    if self.requestedMapIds.get(viewId) == mapId:
+                        del self.requestedMapIds[viewId]
+                continue
+
+            elapsed = time.time() - startTime
+            with self.condition:
+                self.fetching = False
+                self.fetches += 1
+                self.fetchTime += elapsed
+                self.maxFetchTime = max(self.maxFetchTime, elapsed)
+                if self.requestedMapIds.get(viewId) == mapId:
+                    self.results[viewId] = (mapId, result)
+
+
 class MapServerSource(TimerCallback):
 
     def __init__(self, view, callbackFunc=None):
@@ -713,6 +898,11 @@ class MapServerSource(TimerCallback):
         self.callbackFunc = callbackFunc
         self.colorizeCallback = None
         self.useMeshes = True
+        self.useFetchThread = True
+        self.fetchThread = None
+        self.showTime = 0.0
+        self.maxShowTime = 0.0
+        self.depthMapCache = None
 
     def getNameForViewId(self, viewId):
 
@@ -722,7 +912,7 @@ class MapServerSource(TimerCallback):
 
         return 'Map View ' + str(viewId)
 
-    def updatePolyData(self, viewId, polyData):
+    def updatePolyData(self, viewId, polyData, lodPyramid=None):
 
         obj = self.polyDataObjects.get(viewId)
         if obj not in om.getObjects():
@@ -736,6 +926,7 @@ class MapServerSource(TimerCallback):
             if obj._isPointCloud():
                 obj.setProperty('Color', [1, 1, 1])
                 obj.setProperty('Alpha', 0.5)
+                obj.setProperty('Level of Detail', True)
             else:
                 obj.setProperty('Color', [0, 0.68, 1])
 
@@ -758,12 +949,12 @@ class MapServerSource(TimerCallback):
             self.folder = folder
             self.polyDataObjects[viewId] = obj
         else:
-            obj.setPolyData(polyData)
+            obj.setPolyData(polyData, lodPyramid)
 
         if self.colorizeCallback:
             self.colorizeCallback(obj)
 
-    def showMap(self, viewId, mapId):
+    def fetchMap(self, viewId, mapId):
         polyData = vtk.vtkPolyData()
 
         if self.useMeshes:
@@ -771,39 +962,87 @@ class MapServerSource(TimerCallback):
         else:
             self.reader.GetDataForMapId(viewId, mapId, polyData)
 
-        self.updatePolyData(viewId, polyData)
+        return polyData
+
+    def fetchMapForDisplay(self, viewId, mapId):
+        '''
+        Fetches the map on the fetch thread, along with the voxel pyramid used
+        to display it if it is a point cloud.  This moves the DeepCopy out of
+        vtkMapServerSource and the voxel sampling off the GUI thread; the
+        numpy sorting in the sampling releases the GIL, the DeepCopy does
+        not.  Updating the displayed item and coloring it stay on the GUI
+        thread, see showMap.
+        '''
+        polyData = self.fetchMap(viewId, mapId)
+        isPointCloud = polyData.GetNumberOfPoints() and polyData.GetNumberOfCells() == polyData.GetNumberOfVerts()
+        lodPyramid = pointcloudlod.VoxelPyramid(polyData) if isPointCloud else None
+        return polyData, lodPyramid
+
+    def showMap(self, viewId, mapId, polyData=None, lodPyramid=None):
+
+        startTime = time.time()
+
+        if polyData is None:
+            polyData = self.fetchMap(viewId, mapId)
+
+        self.updatePolyData(viewId, polyData, lodPyramid)
         self.displayedMapIds[viewId] = mapId
 
         if self.callbackFunc:
             self.callbackFunc()
 
-    def getSceneHeightData(self):
-        return self.getDepthMapData(lcmmaps.data_request_t.HEIGHT_MAP_SCENE)
+        elapsed = time.time() - startTime
+        self.showTime += elapsed
+        self.maxShowTime = max(self.maxShowTime, elapsed)
 
-    def getDepthMapData(self, viewId):
+    def getFetchStatistics(self):
+        '''
+        Returns the time in seconds spent showing maps on the GUI thread and,
+        when the fetch thread is used, the time spent fetching them on it.
+        '''
+        stats = dict(showTime=self.showTime, maxShowTime=self.maxShowTime)
+        if self.fetchThread:
+            stats.update(self.fetchThread.getStatistics())
+        return stats
 
-        mapId = self.reader.GetCurrentMapId(viewId)
-        if mapId < 0:
-            return None, None
+    def getSceneHeightData(self):
+        return self.getDepthMapData(lcmmaps.data_request_t.HEIGHT_MAP_SCENE)
 
-        depthImage = vtk.vtkImageData()
-        transform = vtk.vtkTransform()
-        self.reader.GetDataForMapId(viewId, mapId, depthImage, transform)
+    def getDepthMap(self, viewId):
+        '''
+        Returns the current DepthMap of the view, or None if the view has no
+        map yet.  The depth map is cached until the view's map id changes.
+        '''
+        if self.depthMapCache is None:
+            self.depthMapCache = DepthMapCache(self.reader)
+        return self.depthMapCache.getDepthMap(viewId)
 
-        dims = depthImage.GetDimensions()
-        d = vnp.getNumpyFromVtk(depthImage, 'ImageScalars')
-        d = d.reshape(dims[1], dims[0])
-        t = np.array([[transform.GetMatrix().GetElement(r, c) for c in xrange(4)] for r in xrange(4)])
+    def getSceneHeightMap(self):
+        return self.getDepthMap(lcmmaps.data_request_t.HEIGHT_MAP_SCENE)
 
-        return d, t
+    def getDepthMapData(self, viewId):
+        depthMap = self.getDepthMap(viewId)
+        if depthMap is None:
+            return None, None
+        return depthMap.image, depthMap.transform
 
     def start(self):
         if self.reader is None:
             self.reader = drc.vtkMapServerSource()
             self.reader.Start()
 
+        if self.useFetchThread and self.fetchThread is None:
+            self.fetchThread = MapFetchThread(self.fetchMapForDisplay)
+            self.fetchThread.start()
+
         TimerCallback.start(self)
 
+    def stop(self):
+        TimerCallback.stop(self)
+        if self.fetchThread:
+            self.fetchThread.stop()
+            self.fetchThread = None
+
     def updateMap(self):
         if (self.folder):
             self.reader.SetDistanceRange(self.folder.getProperty('Min Range'), self.folder.getProperty('Max Range'))
@@ -815,7 +1054,14 @@ class MapServerSource(TimerCallback):
         for viewId in viewIds:
             mapId = self.reader.GetCurrentMapId(viewId)
             if viewId not in self.displayedMapIds or mapId != self.displayedMapIds[viewId]:
-                self.showMap(viewId, mapId)
+                if self.fetchThread:
+                    self.fetchThread.request(viewId, mapId)
+                else:
+                    self.showMap(viewId, mapId)
+
+        if self.fetchThread:
+            for viewId, (mapId, (polyData, lodPyramid)) in self.fetchThread.takeResults().iteritems():
+                self.showMap(viewId, mapId, polyData, lodPyramid)
 
     def tick(self):
         self.updateMap()
@@ -851,6 +1097,7 @@ def init(view):
         mapServerSource = MapServerSource(view, callbackFunc=view.render)
         mapsServerContainer = om.ObjectModelItem('Map Server', icon=om.Icons.Robot)
         mapsServerContainer.source = mapServerSource
+        mapsServerContainer.connectRemovedFromObjectModel(lambda objectModel, obj: mapServerSource.stop())
         om.addToObjectModel(mapsServerContainer, parentObj=sensorsFolder)
         mapServerSource.start()
     else:
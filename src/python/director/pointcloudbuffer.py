@@ -0,0 +1,143 @@
+'''
+A rolling window point cloud assembled from lidar scan lines.
+
+The points and point data arrays are stored in preallocated ring buffers
+that are wrapped once as the arrays of a vtkPolyData.  Appending a scan
+line writes into the buffers in place, and the points of the current
+window are selected by the vertex cells, which are views of a fixed id
+array, so updating the window does not reallocate the cloud.
+'''
+
+import director.vtkAll as vtk
+import director.vtkNumpy as vnp
+from vtk.util import numpy_support
+from collections import deque
+import numpy as np
+
+
+class RollingPointBuffer(object):
+
+    def __init__(self, capacity, windowDuration):
+        '''
+        capacity is the maximum number of points in the window and
+        windowDuration is the length of the window in seconds.  When the
+        buffer is full the oldest scan lines are dropped even if they are
+        still inside the window.
+        '''
+        self.capacity = int(capacity)
+        self.windowDuration = windowDuration
+        self.arrays = {}
+
+        # scan lines in the window as (utime, first point, number of points),
+        # where the first point counts all points ever appended
+        self.lines = deque()
+        self.head = 0
+        self.tail = 0
+
+        # point ids for a window starting anywhere in the ring, so that the
+        # cells of the window are always a contiguous slice
+        self.pointIds = np.arange(2*self.capacity, dtype=numpy_support.ID_TYPE_CODE) % self.capacity
+        self.cellOffsets = np.arange(self.capacity + 1, dtype=numpy_support.ID_TYPE_CODE)
+
+        self.points = np.zeros((self.capacity, 3), dtype=np.float32)
+        self.polyData = vtk.vtkPolyData()
+        self.polyData.SetPoints(vnp.getVtkPointsFromNumpy(self.points))
+        self._updateCells()
+
+    def getNumberOfPoints(self):
+        return self.head - self.tail
+
+    def getNumberOfScanLines(self):
+        return len(self.lines)
+
+    def getTimeRange(self):
+        if not self.lines:
+            return None
+        return self.lines[0][0], self.lines[-1][0]
+
+    def getArrayNames(self):
+        return sorted(self.arrays.keys())
+
+    def clear(self):
+        self.lines.clear()
+        self.tail = self.head
+        self._updateCells()
+
+    def setWindowDuration(self, windowDuration):
+        self.windowDuration = windowDuration
+        if self.lines:
+            self._dropOldLines(self.lines[-1][0])
+            self._updateCells()
+
+    def _addArray(self, name, values):
+        buf = np.zeros((self.capacity,) + values.shape[1:], dtype=values.dtype)
+        vnp.addNumpyToVtk(self.polyData, buf, name)
+        self.arrays[name] = buf
+        return buf
+
+    def _write(self, buf, values):
+        start = self.head % self.capacity
+        count = min(len(values), self.capacity - start)
+        buf[start:start+count] = values[:count]
+        buf[:len(values)-count] = values[count:]
+
+    def addScanLine(self, polyData, utime):
+        '''
+        Appends the points and point data arrays of a scan line.  Arrays not
+        seen before are added to the buffer.  Call update() after appending
+        one or more scan lines to update the window polyData.
+        '''
+        numberOfPoints = polyData.GetNumberOfPoints()
+        if not numberOfPoints:
+            return
+
+        skip = max(numberOfPoints - self.capacity, 0)
+        self._write(self.points, vnp.getNumpyFromVtk(polyData, 'Points')[skip:])
+
+        pointData = polyData.GetPointData()
+        for i in xrange(pointData.GetNumberOfArrays()):
+            name = pointData.GetArrayName(i)
+            if not name:
+                continue
+            values = numpy_support.vtk_to_numpy(pointData.GetArray(i))[skip:]
+            buf = self.arrays.get(name)
+            if buf is None or buf.shape[1:] != values.shape[1:]:
+                buf = self._addArray(name, values)
+            self._write(buf, values)
+
+        self.lines.append((utime, self.head, numberOfPoints - skip))
+        self.head += numberOfPoints - skip
+        self._dropOldLines(utime)
+
+    def _dropOldLines(self, utime):
+        minUtime = utime - self.windowDuration*1e6
+        while self.lines and (self.lines[0][1] < self.head - self.capacity or self.lines[0][0] < minUtime):
+            self.lines.popleft()
+        self.tail = self.lines[0][1] if self.lines else self.head
+
+    def _updateCells(self):
+        start = self.tail % self.capacity
+        count = self.getNumberOfPoints()
+        self.polyData.SetVerts(vnp.getVtkCellArrayFromNumpy(self.pointIds[start:start+count], self.cellOffsets[:count+1]))
+
+    def update(self):
+        '''
+        Marks the buffers as modified and updates the vertex cells to the
+        points of the current window.
+        '''
+        self.polyData.GetPoints().Modified()
+        pointData = self.polyData.GetPointData()
+        for name in self.arrays:
+            pointData.GetArray(name).Modified()
+        self._updateCells()
+        self.polyData.Modified()
+
+    def getWindowPolyData(self):
+        '''
+        Returns a compact copy of the points in the window, oldest first, for
+        use by code that reads all points of a polyData such as segmentation.
+        '''
+        start = self.tail % self.capacity
+        ids = self.pointIds[start:start+self.getNumberOfPoints()]
+        pointData = dict((name, buf[ids]) for name, buf in self.arrays.iteritems())
+        return vnp.numpyToPolyData(self.points[ids], pointData=pointData, copy=False)
@@ -0,0 +1,111 @@
+'''
+Level of detail for large point clouds.
+
+A VoxelPyramid samples a point cloud at increasing voxel sizes, keeping one
+point per occupied voxel.  Level 0 is the full cloud and each further
+level is sampled from the previous one with twice the voxel size.  The
+polyData of a level is extracted when it is first requested, and extracted
+again after the point data of the full cloud changes.  A level is chosen
+for rendering from the camera distance and a point budget.
+'''
+
+import director.vtkNumpy as vnp
+from director import filterUtils
+import numpy as np
+
+
+def getVoxelSampleIds(points, pointIds, voxelSize):
+    '''
+    Returns the sorted subset of pointIds that keeps the first point in each
+    voxel of the given size.
+    '''
+    coords = np.floor(points[pointIds] / voxelSize).astype(np.int64)
+    coords -= coords.min(axis=0)
+    dims = coords.max(axis=0) + 1
+    keys = (coords[:,0]*dims[1] + coords[:,1])*dims[2] + coords[:,2]
+    firstIndices = np.unique(keys, return_index=True)[1]
+    return pointIds[np.sort(firstIndices)]
+
+
+def getPointDataMTime(polyData):
+    '''
+    Returns the newest modification time of the point data of polyData and
+    of its arrays.
+    '''
+    pointData = polyData.GetPointData()
+    arrays = [pointData.GetArray(i) for i in xrange(pointData.GetNumberOfArrays())]
+    return max([pointData.GetMTime()] + [array.GetMTime() for array in arrays if array is not None])
+
+
+class VoxelPyramid(object):
+
+    def __init__(self, polyData, minimumNumberOfPoints=20000, maximumNumberOfLevels=12):
+
+        self.polyData = polyData
+        self.voxelSizes = [0.0]
+        self.pointIds = [None]
+        self.numberOfPoints = [polyData.GetNumberOfPoints()]
+        self.levelPolyData = {0: polyData}
+        self.pointDataMTime = getPointDataMTime(polyData)
+
+        points = vnp.getNumpyFromVtk(polyData, 'Points')
+        pointIds = np.flatnonzero(np.isfinite(points).all(axis=1))
+        if len(pointIds) <= minimumNumberOfPoints:
+            return
+
+        extent = np.ptp(points[pointIds], axis=0).max()
+        if not extent:
+            return
+
+        # start with a voxel size that keeps about one point per voxel on a
+        # surface spanning the extent of the cloud
+        voxelSize = extent / np.sqrt(len(pointIds))
+
+        while len(self.voxelSizes) < maximumNumberOfLevels and len(pointIds) > minimumNumberOfPoints and voxelSize < extent:
+            sampleIds = getVoxelSampleIds(points, pointIds, voxelSize)
+
+            # skip voxel sizes that barely reduce the cloud
+            if len(sampleIds) < 0.75*len(pointIds):
+                pointIds = sampleIds
+                self.voxelSizes.append(voxelSize)
+                self.pointIds.append(pointIds)
+                self.numberOfPoints.append(len(pointIds))
+
+            voxelSize *= 2.0
+
+    def getNumberOfLevels(self):
+        return len(self.voxelSizes)
+
+    def getLevelPolyData(self, level):
+
+        # levels are copies, so drop them when arrays of the full cloud are
+        # added, removed or modified
+        pointDataMTime = getPointDataMTime(self.polyData)
+        if pointDataMTime != self.pointDataMTime:
+            self.levelPolyData = {0: self.polyData}
+            self.pointDataMTime = pointDataMTime
+
+        polyData = self.levelPolyData.get(level)
+        if polyData is None:
+            polyData = filterUtils.extractPoints(self.polyData, self.pointIds[level])
+            self.levelPolyData[level] = polyData
+        return polyData
+
+    def selectLevel(self, cameraDistance, pixelSize, pointBudget):
+        '''
+        Returns the finest level that fits in pointBudget, or a coarser level
+        if its voxels are smaller than a pixel at cameraDistance.  pixelSize
+        is the size of a pixel at unit distance from the camera.
+        '''
+        budgetLevel = self.getNumberOfLevels() - 1
+        for level, numberOfPoints in enumerate(self.numberOfPoints):
+            if numberOfPoints <= pointBudget:
+                budgetLevel = level
+                break
+
+        distanceLevel = 0
+        for level, voxelSize in enumerate(self.voxelSizes):
+            if voxelSize <= cameraDistance*pixelSize:
+                distanceLevel = level
+
+        return max(budgetLevel, distanceLevel)
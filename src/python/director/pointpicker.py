@@ -277,6 +277,9 @@ class ImagePointPicker(object):
         if self.hoverPos is not None:
             points.append(self.hoverPos)
 
+        # picked points are image pixels, draw them where the pixels are shown
+        points = [self.imageView.getImagePixelViewPoint(p) for p in points]
+
         # draw points
         radius = 5
         scale = (2*self.view.camera().GetParallelScale())/(self.view.renderer().GetSize()[1])
@@ -305,7 +308,7 @@ class ImagePointPicker(object):
     def updateCursor(self, displayPoint):
 
         center = self.displayPointToImagePoint(displayPoint, restrictToImageDimensions=False)
-        center = np.array(center)
+        center = np.array(self.imageView.getImagePixelViewPoint(center))
 
         d = DebugData()
         d.addLine(center + [0, -3000, 0], center + [0, 3000, 0])
@@ -20,6 +20,7 @@ from director.filterUtils import *
 from director.fieldcontainer import FieldContainer
 from director.segmentationroutines import *
 from director import cameraview
+from director import spatialindex
 
 from thirdparty import qhull_2d
 from thirdparty import min_bounding_rect
@@ -442,30 +443,38 @@ def cropToBox(polyData, transform, dimensions):
     '''
     dimensions is length 3 describing box dimensions
     '''
-    origin = np.array(transform.GetPosition())
     axes = transformUtils.getAxesFromTransform(transform)
-
-    for axis, length in zip(axes, dimensions):
-        cropAxis = np.array(axis)*(length/2.0)
-        polyData = cropToLineSegment(polyData, origin - cropAxis, origin + cropAxis)
-
-    return polyData
+    bounds = [[-length*np.linalg.norm(axis)/2.0, length*np.linalg.norm(axis)/2.0] for axis, length in zip(axes, dimensions)]
+    return cropToBounds(polyData, transform, bounds)
 
 def cropToBounds(polyData, transform, bounds):
     '''
     bounds is a 2x3 containing the min/max values along the transform axes to use for cropping
     '''
     origin = np.array(transform.GetPosition())
-    axes = transformUtils.getAxesFromTransform(transform)
+    axes = [np.array(axis)/np.linalg.norm(axis) for axis in transformUtils.getAxesFromTransform(transform)]
+
+    index = spatialindex.getSpatialIndex(polyData)
+    if index is not None:
+        polyData = extractPoints(polyData, index.queryOrientedBox(origin, axes, bounds))
+        axis, bound = axes[-1], bounds[-1]
+        return labelPointDistanceAlongAxis(polyData, axis, origin=origin + axis*bound[0], resultArrayName='dist_along_line')
 
     for axis, bound in zip(axes, bounds):
-        axis = np.array(axis)/np.linalg.norm(axis)
         polyData = cropToLineSegment(polyData, origin + axis*bound[0], origin + axis*bound[1])
 
     return polyData
 
 
 def cropToSphere(polyData, origin, radius):
+
+    index = spatialindex.getSpatialIndex(polyData)
+    if index is not None:
+        pointIds, dists = index.queryRadius(origin, radius)
+        polyData = extractPoints(polyData, pointIds)
+        vtkNumpy.addNumpyToVtk(polyData, dists, 'distance_to_point')
+        return polyData
+
     polyData = labelDistanceToPoint(polyData, origin)
     return thresholdPoints(polyData, 'distance_to_point', [0, radius])
 
@@ -581,7 +590,7 @@ def getCurrentScanBundle(useVoxelGrid=False):
 
 def getCurrentRevolutionData(useVoxelGrid=False):
     from director import perception
-    revPolyData = perception._multisenseItem.model.revPolyData
+    revPolyData = perception._multisenseItem.model.getPointCloud()
     if not revPolyData or not revPolyData.GetNumberOfPoints():
         return getCurrentScanBundle()
 
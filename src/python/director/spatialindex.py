@@ -0,0 +1,154 @@
+'''
+A voxel hash spatial index for point clouds stored in vtkPolyData.
+
+Building the index sorts the points by voxel, after which box and radius
+queries only visit the points in the voxels that overlap the query region
+instead of the whole cloud.  Indexes are cached per vtkPoints data array,
+so a polyData and its shallow copies share one index, and a cached index
+is rebuilt when the array is modified.
+'''
+
+import director.vtkNumpy as vnp
+from collections import OrderedDict
+import numpy as np
+
+
+class VoxelHashIndex(object):
+
+    def __init__(self, points, voxelSize):
+        '''
+        points is an Nx3 numpy array.  Points with non finite coordinates are
+        not indexed and are never returned by queries.
+        '''
+        self.points = points
+        self.voxelSize = float(voxelSize)
+
+        pointIds = np.flatnonzero(np.isfinite(points).all(axis=1))
+        coords = np.floor(points[pointIds] / self.voxelSize).astype(np.int64)
+
+        if len(coords):
+            self.minCoord = coords.min(axis=0)
+            self.dims = coords.max(axis=0) - self.minCoord + 1
+        else:
+            self.minCoord = np.zeros(3, dtype=np.int64)
+            self.dims = np.ones(3, dtype=np.int64)
+
+        keys = self._getKeys(coords - self.minCoord)
+        order = np.argsort(keys, kind='mergesort')
+        self.pointIds = pointIds[order]
+
+        self.voxelKeys, self.voxelStarts, self.voxelCounts = np.unique(keys[order], return_index=True, return_counts=True)
+        self.voxelCoords = np.column_stack(np.unravel_index(self.voxelKeys, tuple(self.dims))) if len(self.voxelKeys) else np.zeros((0, 3), dtype=np.int64)
+
+    def _getKeys(self, coords):
+        return (coords[:,0]*self.dims[1] + coords[:,1])*self.dims[2] + coords[:,2]
+
+    def getNumberOfVoxels(self):
+        return len(self.voxelKeys)
+
+    def queryBounds(self, lower, upper):
+        '''
+        Returns the sorted ids of the points in the voxels that overlap the
+        axis aligned box [lower, upper].  This is a superset of the points
+        inside the box, callers apply their exact test to the result.
+        '''
+        lo = np.floor(np.asarray(lower, dtype=float) / self.voxelSize).astype(np.int64) - self.minCoord
+        hi = np.floor(np.asarray(upper, dtype=float) / self.voxelSize).astype(np.int64) - self.minCoord
+        lo = np.maximum(lo, 0)
+        hi = np.minimum(hi, self.dims - 1)
+
+        if (hi < lo).any():
+            return np.zeros(0, dtype=np.int64)
+
+        numQueryVoxels = np.prod(hi - lo + 1)
+
+        if numQueryVoxels < self.getNumberOfVoxels():
+            grid = np.mgrid[lo[0]:hi[0]+1, lo[1]:hi[1]+1, lo[2]:hi[2]+1].reshape(3, -1).T
+            keys = self._getKeys(grid)
+            voxels = np.minimum(np.searchsorted(self.voxelKeys, keys), len(self.voxelKeys) - 1)
+            voxels = voxels[self.voxelKeys[voxels] == keys]
+        else:
+            inside = ((self.voxelCoords >= lo) & (self.voxelCoords <= hi)).all(axis=1)
+            voxels = np.flatnonzero(inside)
+
+        starts = self.voxelStarts[voxels]
+        counts = self.voxelCounts[voxels]
+        total = counts.sum()
+        if not total:
+            return np.zeros(0, dtype=np.int64)
+
+        # expand the (start, count) ranges of the voxels into point positions
+        positions = np.repeat(starts - (np.cumsum(counts) - counts), counts) + np.arange(total)
+        return np.sort(self.pointIds[positions])
+
+    def queryRadius(self, center, radius):
+        '''
+        Returns the sorted ids of the points within radius of center and the
+        distances of those points to center.
+        '''
+        center = np.asarray(center, dtype=float)
+        pointIds = self.queryBounds(center - radius, center + radius)
+        dists = np.sqrt(np.sum((self.points[pointIds] - center)**2, axis=1))
+        inside = dists <= radius
+        return pointIds[inside], dists[inside]
+
+    def queryOrientedBox(self, origin, axes, bounds):
+        '''
+        Returns the sorted ids of the points inside an oriented box.  axes are
+        three unit vectors and bounds is a 3x2 list of the min and max
+        distances from origin along each axis.
+        '''
+        origin = np.asarray(origin, dtype=float)
+        axes = np.asarray(axes, dtype=float)
+        bounds = np.asarray(bounds, dtype=float)
+
+        corners = np.array([origin + np.dot([bounds[0][i], bounds[1][j], bounds[2][k]], axes)
+                            for i in (0, 1) for j in (0, 1) for k in (0, 1)])
+        pointIds = self.queryBounds(corners.min(axis=0), corners.max(axis=0))
+
+        dists = np.dot(self.points[pointIds] - origin, axes.T)
+        inside = ((dists >= bounds[:,0]) & (dists <= bounds[:,1])).all(axis=1)
+        return pointIds[inside]
+
+
+_indexCache = OrderedDict()
+
+maxCacheSize = 4
+defaultVoxelSize = 0.1
+minimumNumberOfPoints = 50000
+
+
+def getSpatialIndex(polyData, voxelSize=None):
+    '''
+    Returns the cached VoxelHashIndex of the points of polyData, building it
+    if needed.  Returns None if the polyData has fewer than
+    minimumNumberOfPoints points, for those a linear pass is cheaper.
+
+    The cache is keyed by the vtkPoints data array and its modification time.
+    Code that writes to the points through a numpy view must call Modified()
+    on the array, otherwise a stale index is returned.
+    '''
+    points = polyData.GetPoints()
+    if not points or points.GetNumberOfPoints() < minimumNumberOfPoints:
+        return None
+
+    voxelSize = voxelSize or defaultVoxelSize
+    pointsArray = points.GetData()
+    key = (pointsArray.__this__, voxelSize)
+    mtime = pointsArray.GetMTime()
+
+    entry = _indexCache.pop(key, None)
+    if entry is None or entry[1] != mtime or len(entry[2].points) != points.GetNumberOfPoints():
+        # the cache entry holds a reference to the array so that its address
+        # can't be reused by another array while the entry exists
+        entry = (pointsArray, mtime, VoxelHashIndex(vnp.getNumpyFromVtk(polyData, 'Points'), voxelSize))
+
+    _indexCache[key] = entry
+    while len(_indexCache) > maxCacheSize:
+        _indexCache.popitem(last=False)
+
+    return entry[2]
+
+
+def clearCache():
+    _indexCache.clear()
@@ -58,6 +58,7 @@ from director import framevisualization
 from director import lcmloggerwidget
 from director import lcmgl
 from director import lcmoctomap
+from director import lcmsubscriberpanel
 from director import lcmcollections
 from director import atlasdriver
 from director import atlasdriverpanel
@@ -762,6 +763,8 @@ camerabookmarks.init(view)
 cameraControlPanel = cameracontrolpanel.CameraControlPanel(view)
 app.addWidgetToDock(cameraControlPanel.widget, action=None).hide()
 
+lcmSubscriberPanel = lcmsubscriberpanel.init()
+
 
 def getLinkFrame(linkName, model=None):
     model = model or robotStateModel
@@ -5,7 +5,7 @@ import re
 import time
 import warnings
 import numpy as np
-from collections import namedtuple
+from collections import namedtuple, OrderedDict
 
 from director import objectmodel as om
 from director import applogic as app
@@ -19,6 +19,8 @@ from director import vtkAll as vtk
 from director import vtkNumpy as vnp
 from director import visualization as vis
 from director import packagepath
+from director import treeviewerbinary
+from director.timercallback import TimerCallback
 from director.shallowCopy import shallowCopy
 
 import robotlocomotion as lcmrl
@@ -118,7 +120,7 @@ class Geometry(object):
     @staticmethod
     def createPointcloud(params):
         polyData = vnp.numpyToPolyData(np.asarray(params["points"]),
-                                       createVertexCells=True)
+                                       createVertexCells=True, copy=False)
         if "channels" in params:
             Geometry.addColorChannels(polyData, params["channels"])
         return [polyData]
@@ -136,7 +138,7 @@ class Geometry(object):
         y = ranges * np.sin(angles)
         z = np.zeros(x.shape)
         points = np.vstack((x, y, z)).T
-        polyData = vnp.numpyToPolyData(points, createVertexCells=True)
+        polyData = vnp.numpyToPolyData(points, createVertexCells=True, copy=False)
         if "channels" in params:
             Geometry.addColorChannels(polyData, params["channels"])
         return [polyData]
@@ -210,17 +212,10 @@ class Geometry(object):
         if pts.size > 0:
             pd.GetPoints().SetData(vnp.getVtkFromNumpy(pts.copy()))
 
-            cells = vtk.vtkCellArray()
-            tri = vtk.vtkTriangle()
-            setId = tri.GetPointIds().SetId  # bind the method for convenience
-            for face in faces:
-                assert len(face) == 3, "Non-triangular faces are not supported."
-                setId(0, face[0])
-                setId(1, face[1])
-                setId(2, face[2])
-                cells.InsertNextCell(tri)
-
-            pd.SetPolys(cells)
+            faces = np.asarray(faces)
+            if faces.size > 0:
+                assert faces.ndim == 2 and faces.shape[1] == 3, "Non-triangular faces are not supported."
+                pd.SetPolys(vnp.getVtkCellArrayFromNumpyCells(faces))
         return pd
 
     @staticmethod
@@ -403,6 +398,33 @@ def findPathToAncestor(fromItem, toItem):
     return path
 
 
+class PathNode(object):
+    '''
+    A node in the trie of paths maintained by TreeViewer.  Each node holds
+    the folder item for its path, its child nodes by name, the geometry
+    item in the folder, and the world transform of the folder, which is
+    the parent node's world transform concatenated with the folder's own
+    transform so that ancestor transforms are shared by all descendants.
+    '''
+    __slots__ = ["name", "item", "parent", "children", "geometryItem", "worldTransform"]
+
+    def __init__(self, name, item, parent=None):
+        self.name = name
+        self.item = item
+        self.parent = parent
+        self.children = {}
+        self.geometryItem = None
+        self.worldTransform = None
+
+    def getPath(self):
+        path = []
+        node = self
+        while node.parent is not None:
+            path.append(node.name)
+            node = node.parent
+        return list(reversed(path))
+
+
 class TreeViewer(object):
     name = "Remote Tree Viewer"
 
@@ -410,9 +432,19 @@ class TreeViewer(object):
 
         self.subscriber = None
         self.view = view
-        self.itemToPathCache = {}
-        self.pathToItemCache = {}
+        self.rootNode = None
+        self.itemToNode = {}
         self.client_id_regex = re.compile(r'\<(.*)\>')
+
+        # settransform commands are queued and applied at most once per
+        # display frame, keeping only the latest transform for each path
+        self.batchTransforms = True
+        self.frameRate = 60.0
+        self.pendingTransforms = OrderedDict()
+        self.flushTimer = TimerCallback(callback=self.flushPendingTransforms)
+        self.flushScheduled = False
+        self.resetStatistics()
+
         self.enable()
         self.sendStatusMessage(
             0, ViewerResponse(ViewerStatus.OK, {"ready": True}))
@@ -467,21 +499,26 @@ class TreeViewer(object):
             channel = "DIRECTOR_TREE_VIEWER_RESPONSE"
         lcmUtils.publish(channel, msg)
 
+    supportedFormats = {
+        "treeviewer_json": ["1.0"],
+        treeviewerbinary.FORMAT_NAME: ["1.0"],
+    }
+
     def decodeCommsMsg(self, msg):
-        if msg.format == "treeviewer_json":
-            if msg.format_version_major == 1 and msg.format_version_minor == 0:
-                data = json.loads(msg.data.decode())
-                return data, ViewerResponse(ViewerStatus.OK, {})
-            else:
-                return None, ViewerResponse(ViewerStatus.ERROR_UNKNOWN_FORMAT_VERSION,
-                                            {"supported_formats": {
-                                                 "treeviewer_json": ["1.0"]
-                                            }})
-        else:
+        if msg.format not in self.supportedFormats:
             return None, ViewerResponse(ViewerStatus.ERROR_UNKNOWN_FORMAT,
-                                        {"supported_formats": {
-                                             "treeviewer_json": ["1.0"]
-                                        }})
+                                        {"supported_formats": self.supportedFormats})
+
+        version = "{:d}.{:d}".format(msg.format_version_major, msg.format_version_minor)
+        if version not in self.supportedFormats[msg.format]:
+            return None, ViewerResponse(ViewerStatus.ERROR_UNKNOWN_FORMAT_VERSION,
+                                        {"supported_formats": self.supportedFormats})
+
+        if msg.format == treeviewerbinary.FORMAT_NAME:
+            data = treeviewerbinary.decode(msg.data)
+        else:
+            data = json.loads(msg.data.decode())
+        return data, ViewerResponse(ViewerStatus.OK, {})
 
     def onViewerRequest(self, msg, channel="DIRECTOR_TREE_VIEWER_REQUEST"):
         match = self.client_id_regex.search(channel)
@@ -525,7 +562,8 @@ class TreeViewer(object):
             "set_transforms": list(setTransforms),
             "missing_paths": list(missingPaths)
         }
-        self.view.render()
+        self.statistics["requests"] += 1
+        self.scheduleFlush()
         # print "result:", result
         if not missingPaths:
             return ViewerResponse(ViewerStatus.OK, result)
@@ -550,21 +588,17 @@ class TreeViewer(object):
                 break
 
     def setGeometry(self, path, geometry):
-        folder = self.getPathFolder(path)
-        ancestors = findPathToAncestor(folder, self.getRootFolder())
-        geomTransform = vtk.vtkTransform()
-        for item in reversed(ancestors):
-            if not hasattr(item, "transform"):
-                item.transform = vtk.vtkTransform()
-                item.transform.PostMultiply()
-            geomTransform.Concatenate(item.transform)
+        node = self.getPathNode(path)
+        folder = node.item
+        geomTransform = self.getWorldTransform(node)
 
         geometryName = folder.getProperty("Name")
-        item = folder.findChild(geometryName)
-        if item is None:
+        item = node.geometryItem
+        if item is None or item.parent() is not folder:
             item = geometry.createPolyDataItem(name=geometryName)
             item.addToView(self.view)
             om.addToObjectModel(item, parentObj=folder)
+            node.geometryItem = item
         else:
             item.setPolyData(geometry.polyData)
             geometry.updatePolyDataItemProperties(item)
@@ -574,14 +608,82 @@ class TreeViewer(object):
 
         return path
 
+    def getWorldTransform(self, node):
+        if node.worldTransform is None:
+            folder = node.item
+            if not hasattr(folder, "transform"):
+                folder.transform = vtk.vtkTransform()
+                folder.transform.PostMultiply()
+            worldTransform = vtk.vtkTransform()
+            if node.parent is not None:
+                worldTransform.Concatenate(self.getWorldTransform(node.parent))
+            worldTransform.Concatenate(folder.transform)
+            node.worldTransform = worldTransform
+        return node.worldTransform
+
     def getPathForItem(self, item):
+        node = self.itemToNode.get(item)
+        if node is not None:
+            return node.getPath()
         return [x.getProperty("Name") for x in reversed(findPathToAncestor(
             item, self.getRootFolder())[:-1])]
 
     def handleSetTransform(self, command):
+        self.statistics["transforms_received"] += 1
+        if self.batchTransforms:
+            return self._queueTransform(command["path"], command["transform"])
+        self.statistics["transforms_applied"] += 1
         return self._setTransform(command["path"],
                                   transformFromDict(command["transform"]))
 
+    def _queueTransform(self, path, transformData):
+        folder = self.getPathFolder(path)
+        key = tuple(path)
+        if key in self.pendingTransforms:
+            self.statistics["transforms_coalesced"] += 1
+        self.pendingTransforms[key] = transformData
+        return path, len(folder.children()) == 0
+
+    def _dropPendingTransforms(self, path):
+        path = tuple(path)
+        for pendingPath in self.pendingTransforms.keys():
+            if pendingPath[:len(path)] == path:
+                del self.pendingTransforms[pendingPath]
+                self.statistics["transforms_dropped"] += 1
+
+    def scheduleFlush(self):
+        if not self.flushScheduled:
+            self.flushScheduled = True
+            self.flushTimer.singleShot(1.0 / self.frameRate)
+
+    def flushPendingTransforms(self):
+        '''
+        Applies the queued transforms and renders the view.
+        '''
+        self.flushScheduled = False
+        pendingTransforms, self.pendingTransforms = self.pendingTransforms, OrderedDict()
+        for path, transformData in pendingTransforms.iteritems():
+            self._setTransform(path, transformFromDict(transformData))
+        self.statistics["transforms_applied"] += len(pendingTransforms)
+        self.statistics["renders"] += 1
+        self.view.render()
+
+    def resetStatistics(self):
+        self.statistics = dict(requests=0,
+                               renders=0,
+                               transforms_received=0,
+                               transforms_applied=0,
+                               transforms_coalesced=0,
+                               transforms_dropped=0)
+
+    def getStatistics(self):
+        '''
+        Returns counters for the requests handled, renders and transforms
+        received, applied, coalesced with a later transform for the same
+        path, and dropped because their path was deleted.
+        '''
+        return dict(self.statistics)
+
     def _setTransform(self, path, transform):
         folder = self.getPathFolder(path)
         if not hasattr(folder, "transform"):
@@ -592,42 +694,73 @@ class TreeViewer(object):
 
     def handleDeletePath(self, command):
         path = command["path"]
-        item = self.getPathFolder(path)
-        if item is not None:
-            om.removeFromObjectModel(item)
+        self._dropPendingTransforms(path)
+        node = self.findPathNode(path)
+        if node is not None:
+            om.removeFromObjectModel(node.item)
         return path
 
-    def getRootFolder(self):
-        path = tuple()
-        if path in self.pathToItemCache:
-            return self.pathToItemCache[path]
-        else:
+    def getRootNode(self):
+        if self.rootNode is None:
             folder = om.getOrCreateContainer(
                 self.name.lower(),
                 parentObj=om.findObjectByName('scene'))
-            self.pathToItemCache[path] = folder
-            self.itemToPathCache[folder] = path
-            folder.connectRemovedFromObjectModel(self.onItemRemoved)
-            return folder
+            self.rootNode = self._addNode(PathNode(None, folder))
+        return self.rootNode
+
+    def getRootFolder(self):
+        return self.getRootNode().item
+
+    def _addNode(self, node):
+        self.itemToNode[node.item] = node
+        node.item.connectRemovedFromObjectModel(self.onItemRemoved)
+        return node
 
     def onItemRemoved(self, objModel, item):
-        if item in self.itemToPathCache:
-            path = self.itemToPathCache[item]
-            del self.itemToPathCache[item]
-            if path in self.pathToItemCache:
-                del self.pathToItemCache[path]
+        node = self.itemToNode.pop(item, None)
+        if node is None:
+            return
+        if node.parent is None:
+            self.rootNode = None
+        elif node.parent.children.get(node.name) is node:
+            del node.parent.children[node.name]
+
+    def findPathNode(self, path):
+        '''
+        Returns the trie node for the path, or None if the path does not exist.
+        '''
+        node = self.getRootNode()
+        for element in path:
+            node = self._getChildNode(node, element, create=False)
+            if node is None:
+                return None
+        return node
+
+    def getPathNode(self, path):
+        '''
+        Returns the trie node for the path, creating folders for any missing
+        path elements.
+        '''
+        node = self.getRootNode()
+        for element in path:
+            node = self._getChildNode(node, element, create=True)
+        return node
+
+    def _getChildNode(self, node, element, create):
+        child = node.children.get(element)
+        if child is None:
+            # the folder may exist without a node, for example under a root
+            # folder left by an earlier viewer, so the trie is seeded from
+            # the object model
+            if create:
+                folder = om.getOrCreateContainer(element, parentObj=node.item)
+            else:
+                folder = node.item.findChild(element)
+                if folder is None:
+                    return None
+            child = self._addNode(PathNode(element, folder, parent=node))
+            node.children[element] = child
+        return child
 
     def getPathFolder(self, path):
-        path = tuple(path)
-        if path in self.pathToItemCache:
-            # print "hit for path:", path
-            return self.pathToItemCache[path]
-        else:
-            # print "miss for path:", path
-            folder = self.getRootFolder()
-            for element in path:
-                folder = om.getOrCreateContainer(element, parentObj=folder)
-                folder.connectRemovedFromObjectModel(self.onItemRemoved)
-            self.pathToItemCache[path] = folder
-            self.itemToPathCache[folder] = path
-            return folder
+        return self.getPathNode(path).item
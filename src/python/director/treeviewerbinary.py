@@ -0,0 +1,112 @@
+"""
+Encoding for the treeviewer_binary format of the remote tree viewer.
+
+A treeviewer_binary payload carries the same commands as treeviewer_json,
+but numpy arrays in the commands are packed as raw little-endian data
+instead of nested JSON lists.  The payload layout is:
+
+    uint32 (little-endian)  length of the JSON header in bytes
+    JSON header             {"data": <commands>, "arrays": [<array specs>]}
+    padding                 to a multiple of 8 bytes
+    array data              each array starting at a multiple of 8 bytes
+
+In the commands, each array is replaced by {"__ndarray__": <index>}, and
+its array spec gives the numpy dtype string, shape and the byte offset of
+the array data relative to the start of the array data section.
+"""
+from __future__ import absolute_import, division, print_function
+
+import json
+import struct
+import numpy as np
+
+
+FORMAT_NAME = "treeviewer_binary"
+FORMAT_VERSION = (1, 0)
+
+ARRAY_KEY = "__ndarray__"
+HEADER_LENGTH = struct.Struct("<I")
+ALIGNMENT = 8
+
+
+def _align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def _replace_arrays(obj, arrays):
+    if isinstance(obj, np.ndarray):
+        if obj.dtype.hasobject:
+            return _replace_arrays(obj.tolist(), arrays)
+        arrays.append(np.ascontiguousarray(obj, dtype=obj.dtype.newbyteorder("<")))
+        return {ARRAY_KEY: len(arrays) - 1}
+    elif isinstance(obj, dict):
+        return {key: _replace_arrays(value, arrays) for (key, value) in obj.items()}
+    elif isinstance(obj, (list, tuple)):
+        return [_replace_arrays(value, arrays) for value in obj]
+    else:
+        return obj
+
+
+def _restore_arrays(obj, arrays):
+    if isinstance(obj, dict):
+        if len(obj) == 1 and ARRAY_KEY in obj:
+            return arrays[obj[ARRAY_KEY]]
+        return {key: _restore_arrays(value, arrays) for (key, value) in obj.items()}
+    elif isinstance(obj, list):
+        return [_restore_arrays(value, arrays) for value in obj]
+    else:
+        return obj
+
+
+def encode(data):
+    """
+    Encode a dictionary of viewer commands, which may contain numpy arrays,
+    and return the payload as a bytearray.
+    """
+    arrays = []
+    commands = _replace_arrays(data, arrays)
+
+    specs = []
+    offset = 0
+    for array in arrays:
+        offset = _align(offset)
+        specs.append({"dtype": array.dtype.str,
+                      "shape": list(array.shape),
+                      "offset": offset})
+        offset += array.nbytes
+
+    header = json.dumps({"data": commands, "arrays": specs}).encode("utf-8")
+    data_start = _align(HEADER_LENGTH.size + len(header))
+
+    payload = bytearray(data_start + offset)
+    HEADER_LENGTH.pack_into(payload, 0, len(header))
+    payload[HEADER_LENGTH.size:HEADER_LENGTH.size + len(header)] = header
+
+    payload_bytes = np.frombuffer(payload, dtype=np.uint8)
+    for array, spec in zip(arrays, specs):
+        start = data_start + spec["offset"]
+        payload_bytes[start:start + array.nbytes] = array.reshape(-1).view(np.uint8)
+
+    return payload
+
+
+def decode(payload):
+    """
+    Decode a treeviewer_binary payload.  The returned arrays are views of
+    the payload buffer, no array data is copied.
+    """
+    header_length = HEADER_LENGTH.unpack_from(payload, 0)[0]
+    header_end = HEADER_LENGTH.size + header_length
+    header = json.loads(bytes(payload[HEADER_LENGTH.size:header_end]).decode("utf-8"))
+    data_start = _align(header_end)
+
+    arrays = []
+    for spec in header["arrays"]:
+        dtype = np.dtype(str(spec["dtype"]))
+        shape = tuple(spec["shape"])
+        array = np.frombuffer(payload, dtype=dtype,
+                              count=int(np.prod(shape)),
+                              offset=data_start + spec["offset"])
+        arrays.append(array.reshape(shape))
+
+    return _restore_arrays(header["data"], arrays)
@@ -10,6 +10,7 @@ import numpy as np
 from lcm import LCM
 from robotlocomotion import viewer2_comms_t
 from director.thirdparty import transformations
+from director import treeviewerbinary
 
 
 class ClientIDFactory(object):
@@ -25,17 +26,42 @@ class ClientIDFactory(object):
 CLIENT_ID_FACTORY = ClientIDFactory()
 
 
-def to_lcm(data):
+JSON_FORMAT = "treeviewer_json"
+BINARY_FORMAT = treeviewerbinary.FORMAT_NAME
+
+
+def to_json(obj):
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    raise TypeError("{} is not JSON serializable".format(obj))
+
+
+def to_lcm(data, format=JSON_FORMAT):
     msg = viewer2_comms_t()
     msg.utime = data["utime"]
-    msg.format = "treeviewer_json"
+    msg.format = format
     msg.format_version_major = 1
     msg.format_version_minor = 0
-    msg.data = bytearray(json.dumps(data), encoding='utf-8')
+    if format == BINARY_FORMAT:
+        msg.data = treeviewerbinary.encode(data)
+    else:
+        msg.data = bytearray(json.dumps(data, default=to_json), encoding='utf-8')
     msg.num_bytes = len(msg.data)
     return msg
 
 
+def choose_format(supported_formats):
+    """
+    Choose the preferred format from the supported_formats field of a
+    viewer response.
+    """
+    for format in [BINARY_FORMAT, JSON_FORMAT]:
+        if "1.0" in supported_formats.get(format, []):
+            return format
+    raise ValueError(
+        "No supported format in viewer response: {}".format(supported_formats))
+
+
 def serialize_transform(tform):
     return {
         "translation": list(transformations.translation_from_matrix(tform)),
@@ -134,8 +160,22 @@ class PointCloud(BaseGeometry):
     def serialize(self):
         return {
             "type": "pointcloud",
-            "points": [list(p) for p in self.points],
-            "channels": {name: [list(c) for c in values] for (name, values) in self.channels.iteritems()}
+            "points": np.asarray(self.points),
+            "channels": {name: np.asarray(values) for (name, values) in self.channels.iteritems()}
+        }
+
+
+class TriangularMesh(BaseGeometry):
+    __slots__ = ["vertices", "faces"]
+    def __init__(self, vertices, faces):
+        self.vertices = vertices
+        self.faces = faces
+
+    def serialize(self):
+        return {
+            "type": "mesh_data",
+            "vertices": np.asarray(self.vertices),
+            "faces": np.asarray(self.faces)
         }
 
 
@@ -279,10 +319,11 @@ class Visualizer(object):
 
 
 class CoreVisualizer(object):
-    def __init__(self, lcm=None):
+    def __init__(self, lcm=None, format=BINARY_FORMAT):
         if lcm is None:
             lcm = LCM()
         self.lcm = lcm
+        self.format = format
         self.client_id = CLIENT_ID_FACTORY.new_client_id()
         self.tree = LazyTree()
         self.queue = CommandQueue()
@@ -318,6 +359,18 @@ class CoreVisualizer(object):
             for path in self.tree.descendants():
                 self.queue.setgeometry.add(path)
                 self.queue.settransform.add(path)
+        elif data["status"] in (-1, -2) and "supported_formats" in data:
+            # The viewer does not support our format, so fall back to one
+            # that it does support and send the whole tree again.
+            format = choose_format(data["supported_formats"])
+            if format == self.format:
+                raise ValueError(
+                    "Unhandled response from viewer: {}".format(msg.data.decode()))
+            self.format = format
+            for path in self.tree.descendants():
+                self.queue.setgeometry.add(path)
+                self.queue.settransform.add(path)
+            self._maybe_publish()
         else:
             raise ValueError(
                 "Unhandled response from viewer: {}".format(msg.data.decode()))
@@ -363,7 +416,7 @@ class CoreVisualizer(object):
     def publish(self):
         if not self.queue.isempty():
             data = self.serialize_queue()
-            msg = to_lcm(data)
+            msg = to_lcm(data, self.format)
             self.lcm.publish(self._request_channel(), msg.encode())
             self.queue.empty()
 
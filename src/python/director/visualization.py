@@ -4,6 +4,7 @@ from shallowCopy import shallowCopy
 import director.vtkAll as vtk
 from director import filterUtils
 from director import transformUtils
+from director import pointcloudlod
 from director import callbacks
 from director import frameupdater
 from director.fieldcontainer import FieldContainer
@@ -39,6 +40,9 @@ class PolyDataItem(om.ObjectModelItem):
         self.shadowActor = None
         self.scalarBarWidget = None
         self.extraViewRenderers = {}
+        self.lodPyramid = None
+        self.lodFullResolution = False
+        self.lodObservers = {}
 
         self.rangeMap = dict(PolyDataItem.defaultScalarRangeMap)
 
@@ -58,6 +62,10 @@ class PolyDataItem(om.ObjectModelItem):
         self.addProperty('Color', [1.0, 1.0, 1.0])
         self.addProperty('Show Scalar Bar', False)
 
+        self.addProperty('Level of Detail', False, attributes=om.PropertyAttributes(hidden=True))
+        self.addProperty('Point Budget', 1000000,
+                         attributes=om.PropertyAttributes(decimals=0, minimum=10000, maximum=100000000, singleStep=100000, hidden=True))
+
         self._updateSurfaceProperty()
         self._updateColorByProperty()
 
@@ -71,14 +79,18 @@ class PolyDataItem(om.ObjectModelItem):
     def hasDataSet(self, dataSet):
         return dataSet == self.polyData
 
-    def setPolyData(self, polyData):
-
+    def setPolyData(self, polyData, lodPyramid=None):
+        '''
+        lodPyramid is an optional pointcloudlod.VoxelPyramid of polyData that
+        is used instead of building one when level of detail is enabled.
+        '''
         self.polyData = polyData
         self.mapper.SetInputData(polyData)
 
         self._updateSurfaceProperty()
         self._updateColorByProperty()
         self._updateColorBy(retainColorMap=True)
+        self._updateLevelOfDetail(lodPyramid)
 
         if self.getProperty('Visible'):
             self._renderAllViews()
@@ -138,6 +150,8 @@ class PolyDataItem(om.ObjectModelItem):
         view.renderer().AddActor(self.actor)
         if self.shadowActor:
             view.renderer().AddActor(self.shadowActor)
+        if self.lodPyramid:
+            self.lodObservers[view] = view.renderer().AddObserver('StartEvent', self._onStartRender)
         view.render()
 
     def _onPropertyChanged(self, propertySet, propertyName):
@@ -180,6 +194,9 @@ class PolyDataItem(om.ObjectModelItem):
         elif propertyName == 'Show Scalar Bar':
             self._updateScalarBar()
 
+        elif propertyName == 'Level of Detail':
+            self._updateLevelOfDetail()
+
         self._renderAllViews()
 
     def setScalarRange(self, rangeMin, rangeMax):
@@ -198,6 +215,86 @@ class PolyDataItem(om.ObjectModelItem):
         enablePointSize = enableSurfaceMode or not enableLineWidth
         self.properties.setPropertyAttribute('Point Size', 'hidden', not enablePointSize)
 
+        isPointCloud = bool(self._isPointCloud())
+        self.properties.setPropertyAttribute('Level of Detail', 'hidden', not isPointCloud)
+        self.properties.setPropertyAttribute('Point Budget', 'hidden', not isPointCloud)
+
+    def _updateLevelOfDetail(self, lodPyramid=None):
+        '''
+        Rebuilds the voxel pyramid of the polyData when level of detail is
+        enabled, unless a pyramid of the polyData is given.  The level given
+        to the mapper is chosen before each render.
+        '''
+        enabled = self.getProperty('Level of Detail') and self._isPointCloud()
+        if not enabled:
+            self.lodPyramid = None
+        elif lodPyramid is not None and lodPyramid.polyData is self.polyData:
+            self.lodPyramid = lodPyramid
+        else:
+            self.lodPyramid = pointcloudlod.VoxelPyramid(self.polyData)
+
+        for view in self.views:
+            if enabled and view not in self.lodObservers:
+                self.lodObservers[view] = view.renderer().AddObserver('StartEvent', self._onStartRender)
+            elif not enabled and view in self.lodObservers:
+                view.renderer().RemoveObserver(self.lodObservers.pop(view))
+
+        if not enabled:
+            self.mapper.SetInputData(self.polyData)
+
+    def _getCameraDistance(self, camera):
+        '''
+        Returns the distance from the camera to the bounding box of the
+        polyData placed in the world by the actor's transform.
+        '''
+        bounds = np.array(self.polyData.GetBounds()).reshape(3, 2)
+        corners = np.array(list(itertools.product(*bounds)))
+        matrix = self.actor.GetMatrix()
+        matrix = np.array([[matrix.GetElement(i, j) for j in xrange(4)] for i in xrange(3)])
+        corners = np.dot(corners, matrix[:,:3].T) + matrix[:,3]
+
+        position = np.array(camera.GetPosition())
+        nearest = np.clip(position, corners.min(axis=0), corners.max(axis=0))
+        return np.linalg.norm(position - nearest)
+
+    def _onStartRender(self, renderer, event):
+
+        if not self.lodPyramid or self.lodFullResolution:
+            return
+
+        camera = renderer.GetActiveCamera()
+        height = max(renderer.GetSize()[1], 1)
+        pixelSize = np.radians(camera.GetViewAngle()) / height
+
+        level = self.lodPyramid.selectLevel(self._getCameraDistance(camera), pixelSize, self.getProperty('Point Budget'))
+        self._setMapperInput(self.lodPyramid.getLevelPolyData(level))
+
+    def _setMapperInput(self, polyData):
+
+        # the levels are copies of the full resolution polyData that have its
+        # arrays but not its active scalars.  An array missing from a level
+        # should not happen, the pyramid extracts levels again when arrays
+        # change, but the full cloud is drawn rather than the wrong colors.
+        if polyData is not self.polyData:
+            scalars = self.polyData.GetPointData().GetScalars()
+            scalarsName = scalars.GetName() if scalars else None
+            if scalarsName and polyData.GetPointData().GetArray(scalarsName) is None:
+                polyData = self.polyData
+            else:
+                polyData.GetPointData().SetActiveScalars(scalarsName)
+
+        if self.mapper.GetInput() is not polyData:
+            self.mapper.SetInputData(polyData)
+
+    def setFullResolution(self, fullResolution):
+        '''
+        Gives the mapper the full resolution polyData while fullResolution is
+        True, for example while picking, regardless of level of detail.
+        '''
+        self.lodFullResolution = fullResolution
+        if fullResolution:
+            self._setMapperInput(self.polyData)
+
     def _updateColorBy(self, retainColorMap=False):
 
         arrayName = self.getPropertyEnumValue('Color By')
@@ -328,6 +425,8 @@ class PolyDataItem(om.ObjectModelItem):
         view.renderer().RemoveActor(self.actor)
         if self.shadowActor:
             view.renderer().RemoveActor(self.shadowActor)
+        if view in self.lodObservers:
+            view.renderer().RemoveObserver(self.lodObservers.pop(view))
         for renderer in self.extraViewRenderers.get(view, []):
             renderer.RemoveActor(self.actor)
         view.render()
@@ -1150,7 +1249,16 @@ def pickPoint(displayPoint, view, obj=None, pickType='points', tolerance=0.01):
             picker.AddPickList(obj.actor)
         picker.PickFromListOn()
 
-    picker.Pick(displayPoint[0], displayPoint[1], 0, view.renderer())
+    # pick from the full resolution data of items drawn at a lower level of detail
+    lodItems = [o for o in om.getObjects() if isinstance(o, PolyDataItem) and o.lodPyramid]
+    for item in lodItems:
+        item.setFullResolution(True)
+    try:
+        picker.Pick(displayPoint[0], displayPoint[1], 0, view.renderer())
+    finally:
+        for item in lodItems:
+            item.setFullResolution(False)
+
     pickedProp = picker.GetViewProp()
     pickedPoint = np.array(picker.GetPickPosition())
     pickedDataset = pickedProp.GetMapper().GetInput() if isinstance(pickedProp, vtk.vtkActor) else None
@@ -4,7 +4,16 @@ from vtk.util import numpy_support
 import numpy as np
 
 
-def numpyToPolyData(pts, pointData=None, createVertexCells=True):
+def numpyToPolyData(pts, pointData=None, createVertexCells=True, copy=True):
+    '''
+    Returns a vtkPolyData with the given points and point data arrays.  By
+    default the arrays are copied.  With copy=False, C-contiguous float32 or
+    float64 arrays are wrapped without copying, so they must not be modified
+    afterwards, and the vertex cells are built directly from an index array.
+    The wrapped arrays are kept alive by the vtk arrays that reference them.
+    '''
+    if not copy:
+        return _numpyToPolyDataNoCopy(pts, pointData, createVertexCells)
 
     pd = vtk.vtkPolyData()
     pd.SetPoints(getVtkPointsFromNumpy(pts.copy()))
@@ -22,6 +31,34 @@ def numpyToPolyData(pts, pointData=None, createVertexCells=True):
     return pd
 
 
+def _numpyToPolyDataNoCopy(pts, pointData, createVertexCells):
+
+    pts = np.asarray(pts)
+    if pts.dtype not in (np.float32, np.float64):
+        pts = pts.astype(np.float64)
+    pts = np.ascontiguousarray(pts)
+
+    pd = vtk.vtkPolyData()
+    pd.SetPoints(getVtkPointsFromNumpy(pts))
+
+    if pointData is not None:
+        for key, value in pointData.iteritems():
+            addNumpyToVtk(pd, np.ascontiguousarray(value), key)
+
+    if createVertexCells:
+        pd.SetVerts(getVtkVertexCellsFromNumpy(len(pts)))
+
+    return pd
+
+
+def getVtkVertexCellsFromNumpy(numberOfPoints):
+    '''
+    Returns a vtkCellArray with one vertex cell for each point.
+    '''
+    pointIds = np.arange(numberOfPoints, dtype=numpy_support.ID_TYPE_CODE)
+    return getVtkCellArrayFromNumpy(pointIds, np.arange(numberOfPoints + 1, dtype=numpy_support.ID_TYPE_CODE))
+
+
 def numpyToImageData(img, flip=True, vtktype=vtk.VTK_UNSIGNED_CHAR):
     if flip:
         img = np.flipud(img)
@@ -53,6 +90,45 @@ def getNumpyFromVtk(dataObj, arrayName='Points', arrayType='points'):
     return numpy_support.vtk_to_numpy(vtkArray)
 
 
+def getVtkCellArrayFromNumpy(connectivity, offsets):
+    '''
+    Returns a vtkCellArray built in bulk from numpy arrays.  The point ids
+    of cell i are connectivity[offsets[i]:offsets[i+1]], so offsets has one
+    more element than the number of cells.
+    '''
+    connectivity = np.ascontiguousarray(connectivity, dtype=numpy_support.ID_TYPE_CODE)
+    offsets = np.ascontiguousarray(offsets, dtype=numpy_support.ID_TYPE_CODE)
+    numCells = len(offsets) - 1
+
+    cells = vtk.vtkCellArray()
+
+    if hasattr(cells, 'SetData'):
+        cells.SetData(getVtkFromNumpy(offsets, vtk.VTK_ID_TYPE), getVtkFromNumpy(connectivity, vtk.VTK_ID_TYPE))
+        return cells
+
+    # legacy layout: each cell is stored as its point count followed by its point ids
+    cellSizes = np.diff(offsets)
+    sizeIndices = offsets[:-1] + np.arange(numCells)
+    legacyCells = np.empty(len(connectivity) + numCells, dtype=numpy_support.ID_TYPE_CODE)
+    isPointId = np.ones(len(legacyCells), dtype=bool)
+    isPointId[sizeIndices] = False
+    legacyCells[sizeIndices] = cellSizes
+    legacyCells[isPointId] = connectivity
+
+    cells.SetCells(numCells, getVtkFromNumpy(legacyCells, vtk.VTK_ID_TYPE))
+    return cells
+
+
+def getVtkCellArrayFromNumpyCells(cells):
+    '''
+    Returns a vtkCellArray from an array of shape (numCells, numPointsPerCell),
+    for example an array of triangle point ids with shape (N, 3).
+    '''
+    cells = np.asarray(cells)
+    numCells, cellSize = cells.shape if cells.size else (0, 0)
+    return getVtkCellArrayFromNumpy(cells.reshape(-1), np.arange(numCells + 1) * cellSize)
+
+
 def getVtkPointsFromNumpy(numpyArray):
 
     points = vtk.vtkPoints()
@@ -64,14 +140,14 @@ def getVtkPolyDataFromNumpyPoints(points):
     return numpyToPolyData(points)
 
 
-def getVtkFromNumpy(numpyArray):
+def getVtkFromNumpy(numpyArray, arrayType=None):
 
     def MakeCallback(numpyArray):
         def Closure(caller, event):
             closureArray = numpyArray
         return Closure
 
-    vtkArray = numpy_support.numpy_to_vtk(numpyArray)
+    vtkArray = numpy_support.numpy_to_vtk(numpyArray, array_type=arrayType)
     vtkArray.AddObserver('DeleteEvent', MakeCallback(numpyArray))
     return vtkArray
 
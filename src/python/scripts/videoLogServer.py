@@ -8,9 +8,13 @@ import glob
 import json
 import re
 import select
+import mmap
 import numpy as np
+from collections import OrderedDict
 
 from director import lcmspy as spy
+from director import lcmlogindex
+import drc as lcmdrc
 
 
 VIDEO_LCM_URL = 'udpm://239.255.76.50:7650?ttl=1'
@@ -26,22 +30,91 @@ class FieldData(object):
         return 'FieldData(%s)' % ', '.join(['%s=%r' % (k,v) for k, v in self.__dict__.iteritems()])
 
 
-def getRecentUtimes(utimeMap, seconds):
+frameDtype = np.dtype([('utime', '<i8'), ('filepos', '<i8'), ('log', '<i4')])
 
-    utimes = np.array(utimeMap.keys())
-    if not len(utimes):
+
+def getRecentFrames(frames, seconds):
+
+    if not len(frames):
         return None
 
-    utimes.sort()
+    utimes = frames['utime']
     endTime = utimes[-1]
     startTime = max(0, endTime - seconds*1e6)
     startIndex = utimes.searchsorted(startTime)
-    utimes = utimes[startIndex:]
+    frames = frames[startIndex:]
 
-    if not len(utimes):
+    if not len(frames):
         return None
 
-    return utimes
+    return frames
+
+
+class FrameCatalog(object):
+    '''
+    An append-only catalog of the video frames found in the log files.  Each
+    frame is stored as (utime, filepos, log) in a numpy buffer that grows by
+    doubling.  Frames are appended in log order, so they are sorted by utime
+    and time queries are binary searches.  The arrays returned by getFrames
+    are views that remain valid while the catalog is being appended to, so
+    readers on other threads can hold on to them without copying.
+    '''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.filenames = []
+        self.frames = np.zeros(1024, dtype=frameDtype)
+        self.start = 0
+        self.size = 0
+
+    def addLog(self, filename):
+        with self.lock:
+            self.filenames.append(filename)
+            return len(self.filenames) - 1
+
+    def getFilename(self, logId):
+        return self.filenames[logId]
+
+    def append(self, logId, utimes, filePositions):
+
+        numFrames = len(utimes)
+        if not numFrames:
+            return
+
+        with self.lock:
+            newSize = self.size + numFrames
+            if newSize > len(self.frames):
+                # copy to a new buffer, dropping cropped frames
+                numKept = self.size - self.start
+                capacity = len(self.frames)
+                while capacity < numKept + numFrames:
+                    capacity *= 2
+                frames = np.zeros(capacity, dtype=frameDtype)
+                frames[:numKept] = self.frames[self.start:self.size]
+                self.frames, self.start, self.size = frames, 0, numKept
+                newSize = self.size + numFrames
+
+            newFrames = self.frames[self.size:newSize]
+            newFrames['utime'] = utimes
+            newFrames['filepos'] = filePositions
+            newFrames['log'] = logId
+            self.size = newSize
+
+    def getFrames(self):
+        with self.lock:
+            return self.frames[self.start:self.size]
+
+    def crop(self, timeWindow):
+        '''
+        Drops the frames older than timeWindow seconds before the last frame.
+        '''
+        with self.lock:
+            frames = getRecentFrames(self.frames[self.start:self.size], timeWindow)
+            if frames is not None:
+                self.start = self.size - len(frames)
+
+    def __len__(self):
+        return self.size - self.start
 
 
 class LCMPoller(object):
@@ -56,44 +129,171 @@ class LCMPoller(object):
             self.lc.handle()
 
 
-class LogLookup(object):
+class FrameCache(object):
+    '''
+    A least recently used cache of decoded frames, bounded by the total size
+    of the frames' event data.  The cache is shared by the threads that serve
+    frames and by the read ahead thread.
+    '''
+
+    def __init__(self, maxBytes=512*1024*1024):
+        self.maxBytes = maxBytes
+        self.lock = threading.Lock()
+        self.frames = OrderedDict()
+        self.numBytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, countStatistics=True):
+        with self.lock:
+            entry = self.frames.pop(key, None)
+            if entry is not None:
+                self.frames[key] = entry
+            if countStatistics:
+                if entry is None:
+                    self.misses += 1
+                else:
+                    self.hits += 1
+            return entry[0] if entry is not None else None
+
+    def add(self, key, value, size):
+        with self.lock:
+            if key in self.frames:
+                return
+            self.frames[key] = (value, size)
+            self.numBytes += size
+            while self.numBytes > self.maxBytes and len(self.frames) > 1:
+                _, (_, evictedSize) = self.frames.popitem(last=False)
+                self.numBytes -= evictedSize
 
-    def __init__(self):
-        self.utimeMap = None
+    def getStatistics(self):
+        with self.lock:
+            requests = self.hits + self.misses
+            return dict(hits=self.hits, misses=self.misses,
+                        hitRate=self.hits/float(requests) if requests else 0.0,
+                        frames=len(self.frames), bytes=self.numBytes)
+
+
+class LogLookup(object):
+    '''
+    Reads video frames from the log files.  The log files are memory mapped
+    and a frame's event is read directly at its cataloged file position.
+    '''
+
+    def __init__(self, frameCatalog, frameCache=None):
+        self.frameCatalog = frameCatalog
+        self.frameCache = frameCache
         self.logs = {}
 
-    def setUtimeMap(self, utimeMap):
-        self.utimeMap = utimeMap
+    def getLogMap(self, filename, minimumSize):
+        logMap = self.logs.get(filename)
+        if logMap is None or len(logMap) < minimumSize:
+            # the log may have grown since it was mapped
+            if logMap is not None:
+                logMap.close()
+            with open(filename, 'rb') as f:
+                logMap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self.logs[filename] = logMap
+        return logMap
 
-    def getImage(self, utime):
-        filename, filepos = self.utimeMap[utime]
+    def readEventData(self, filename, filepos):
 
-        log = self.logs.get(filename)
-        if log is None:
-            log = lcm.EventLog(filename, 'r')
-            self.logs[filename] = log
+        headerEnd = filepos + lcmlogindex.EVENT_HEADER.size
+        logMap = self.getLogMap(filename, headerEnd)
 
-        log.seek(filepos)
-        event = log.read_next_event()
-        msg = spy.decodeMessage(event.data)
+        sync, eventNumber, timestamp, channelLength, dataLength = lcmlogindex.EVENT_HEADER.unpack_from(logMap, filepos)
+        assert sync == lcmlogindex.EVENT_SYNC_WORD
+
+        dataStart = headerEnd + channelLength
+        logMap = self.getLogMap(filename, dataStart + dataLength)
+        return logMap[dataStart:dataStart + dataLength]
+
+    def getImage(self, frame, countStatistics=True):
+
+        key = (int(frame['log']), int(frame['filepos']))
+        if self.frameCache:
+            cached = self.frameCache.get(key, countStatistics)
+            if cached is not None:
+                return cached
+
+        filename = self.frameCatalog.getFilename(frame['log'])
+        data = self.readEventData(filename, int(frame['filepos']))
+        msg = spy.decodeMessage(data)
 
         if hasattr(msg, 'images'):
             msg = msg.images[0]
+
+        if self.frameCache:
+            self.frameCache.add(key, (msg, filename), len(data))
         return msg, filename
 
     def closeLogs(self):
-        for log in self.logs.values():
-            log.close()
+        for logMap in self.logs.values():
+            logMap.close()
         self.logs = {}
 
 
+class ReadAheadThread(object):
+    '''
+    Decodes the frames that follow the last served frame, in the direction
+    of travel, into the frame cache.  A new position replaces any read ahead
+    that is still in progress.
+    '''
+
+    def __init__(self, frameCatalog, frameCache, numFrames=30):
+        self.numFrames = numFrames
+        self.logLookup = LogLookup(frameCatalog, frameCache)
+        self.condition = threading.Condition()
+        self.request = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.mainLoop)
+        self.thread.daemon = True
+        self.shouldStop = False
+        self.thread.start()
+
+    def stop(self):
+        self.shouldStop = True
+        with self.condition:
+            self.condition.notify()
+        self.thread.join()
+        self.logLookup.closeLogs()
+
+    def setPosition(self, frames, index, direction):
+        with self.condition:
+            self.request = (frames, index, 1 if direction >= 0 else -1)
+            self.condition.notify()
+
+    def mainLoop(self):
+
+        while not self.shouldStop:
+
+            with self.condition:
+                while self.request is None and not self.shouldStop:
+                    self.condition.wait(0.5)
+                request, self.request = self.request, None
+
+            if request is None:
+                continue
+
+            frames, index, direction = request
+
+            for i in xrange(1, self.numFrames + 1):
+                readIndex = index + direction*i
+                if not 0 <= readIndex < len(frames) or self.request is not None or self.shouldStop:
+                    break
+                self.logLookup.getImage(frames[readIndex], countStatistics=False)
+
+
 class PlayThread(object):
 
-    def __init__(self, utimes, logLookup, speed):
+    def __init__(self, frames, logLookup, readAheadThread, speed):
         self.fps = 60
         self.shouldStop = False
-        self.utimes = utimes
+        self.frames = frames
+        self.utimes = frames['utime']
         self.logLookup = logLookup
+        self.readAheadThread = readAheadThread
         self.speed = speed
         self.lc = lcm.LCM(VIDEO_LCM_URL)
 
@@ -120,7 +320,8 @@ class PlayThread(object):
                 break
 
             utimeRequest = self.utimes[utimeIndex]
-            image, filename = self.logLookup.getImage(utimeRequest)
+            image, filename = self.logLookup.getImage(self.frames[utimeIndex])
+            self.readAheadThread.setPosition(self.frames, utimeIndex, direction=1)
 
             print 'elapsed:  %.2f    index: %d    play jitter:  %.3f' % (elapsedUtime*1e-6, utimeIndex, (utimeRequest - (self.utimes[0] + elapsedUtime)  )*1e-6)
 
@@ -131,18 +332,23 @@ class PlayThread(object):
 
 class ServerThread(object):
 
-    def __init__(self, sharedUtimeMap):
+    def __init__(self, frameCatalog):
 
-        self.sharedUtimeMap = sharedUtimeMap
+        self.frameCatalog = frameCatalog
+        self.frames = None
         self.utimes = None
         self.playbackThread = None
         self.syncThread = None
         self.timeWindow = 60
-        self.logLookup = LogLookup()
+        self.lastFrameIndex = None
+        self.frameCache = FrameCache()
+        self.readAheadThread = ReadAheadThread(frameCatalog, self.frameCache)
+        self.logLookup = LogLookup(frameCatalog, self.frameCache)
         self.lc = lcm.LCM(VIDEO_LCM_URL)
         self.lc.subscribe('VIDEO_PLAYBACK_CONTROL', self.onControlMessage)
 
     def start(self):
+        self.readAheadThread.start()
         self.thread = threading.Thread(target=self.mainLoop)
         self.thread.daemon = True
         self.shouldStop = False
@@ -151,11 +357,12 @@ class ServerThread(object):
     def stop(self):
         self.shouldStop = True
         self.thread.join()
+        self.readAheadThread.stop()
 
     def getUtimeIndex(self, data):
 
         assert 0.0 <= data.value <= 1.0
-        return (len(self.utimes)-1)*data.value
+        return int((len(self.utimes)-1)*data.value)
 
 
     def onFrameRequest(self, data):
@@ -164,19 +371,24 @@ class ServerThread(object):
 
         if self.utimes is None:
 
-            self.logLookup.setUtimeMap(dict(self.sharedUtimeMap))
-            self.utimes = getRecentUtimes(self.logLookup.utimeMap, seconds=self.timeWindow)
+            self.frames = getRecentFrames(self.frameCatalog.getFrames(), seconds=self.timeWindow)
 
-            if self.utimes is None:
+            if self.frames is None:
                 print 'no utimes cataloged'
                 return
 
-            print 'starting review with utimes %d %d' % (self.utimes[0], self.utimes[1])
+            self.utimes = self.frames['utime']
+            print 'starting review with utimes %d %d' % (self.utimes[0], self.utimes[-1])
 
 
         utimeIndex = self.getUtimeIndex(data)
         utimeRequest = self.utimes[utimeIndex]
-        image, filename = self.logLookup.getImage(utimeRequest)
+        image, filename = self.logLookup.getImage(self.frames[utimeIndex])
+
+        # read ahead in the direction the operator is scrubbing
+        direction = utimeIndex - self.lastFrameIndex if self.lastFrameIndex is not None else -1
+        self.readAheadThread.setPosition(self.frames, utimeIndex, direction)
+        self.lastFrameIndex = utimeIndex
 
         print 'location: %.2f  index: %d  utime: %d   timeDelta:  %.3f    file: %s' % (data.value, utimeIndex, utimeRequest, (self.utimes[-1] - self.utimes[utimeIndex])*1e-6, os.path.basename(filename))
 
@@ -185,7 +397,9 @@ class ServerThread(object):
 
     def onResume(self, data):
         self.stopPlaybackThread()
+        self.frames = None
         self.utimes = None
+        self.lastFrameIndex = None
         self.logLookup.closeLogs()
         return
 
@@ -199,8 +413,8 @@ class ServerThread(object):
             return
 
         startIndex = self.getUtimeIndex(data)
-        playbackUtimes = self.utimes[startIndex:]
-        self.playbackThread = PlayThread(playbackUtimes, self.logLookup, speed=data.speed)
+        playbackFrames = self.frames[startIndex:]
+        self.playbackThread = PlayThread(playbackFrames, self.logLookup, self.readAheadThread, speed=data.speed)
         self.playbackThread.start()
 
 
@@ -215,7 +429,7 @@ class ServerThread(object):
 
 
     def onLogSync(self):
-        self.syncThread = LogSyncThread(self.sharedUtimeMap)
+        self.syncThread = LogSyncThread(self.frameCatalog, self.frameCache, self.readAheadThread)
         self.syncThread.start()
 
 
@@ -248,13 +462,19 @@ class ServerThread(object):
 
 class LogSyncThread(object):
 
-    def __init__(self, sharedUtimeMap):
+    def __init__(self, frameCatalog, frameCache, readAheadThread):
 
-        self.sharedUtimeMap = sharedUtimeMap
+        self.frameCatalog = frameCatalog
+        self.frames = None
         self.utimes = None
-        self.logLookup = LogLookup()
+        self.lastFrameIndex = None
+        self.frameCache = frameCache
+        self.readAheadThread = readAheadThread
+        self.logLookup = LogLookup(frameCatalog, frameCache)
         self.lastPublishTime = time.time()
         self.publishFrequency = 1/60.0
+        self.lastStatusTime = time.time()
+        self.statusPeriod = 1.0
         self.lcListen = lcm.LCM()
         self.lc = lcm.LCM(VIDEO_LCM_URL)
         self.sub = self.lcListen.subscribe('EST_ROBOT_STATE', self.onControlMessage)
@@ -282,13 +502,12 @@ class LogSyncThread(object):
 
     def onFrameRequest(self, utimeRequest):
 
-        if self.logLookup.utimeMap is None:
+        if self.frames is None:
 
-            self.logLookup.setUtimeMap(dict(self.sharedUtimeMap))
-            assert len(self.logLookup.utimeMap)
+            self.frames = self.frameCatalog.getFrames()
+            assert len(self.frames)
 
-            self.utimes = np.array(self.logLookup.utimeMap.keys())
-            self.utimes.sort()
+            self.utimes = self.frames['utime']
 
 
         requestIndex = self.utimes.searchsorted(utimeRequest)
@@ -299,13 +518,28 @@ class LogSyncThread(object):
         utimeFrame =  self.utimes[requestIndex]
 
 
-        image, filename = self.logLookup.getImage(utimeFrame)
+        image, filename = self.logLookup.getImage(self.frames[requestIndex])
+
+        direction = requestIndex - self.lastFrameIndex if self.lastFrameIndex is not None else 1
+        self.readAheadThread.setPosition(self.frames, requestIndex, direction)
+        self.lastFrameIndex = requestIndex
 
-        print 'utime request: %d   utime frame:  %d   delta:  %f   file: %s' % (utimeRequest, utimeFrame,  (utimeFrame-utimeRequest)*1e-6, os.path.basename(filename))
+        stats = self.frameCache.getStatistics()
+        print 'utime request: %d   utime frame:  %d   delta:  %f   cache hit rate: %.2f   file: %s' % (utimeRequest, utimeFrame,  (utimeFrame-utimeRequest)*1e-6, stats['hitRate'], os.path.basename(filename))
 
         self.lc.publish('VIDEO_PLAYBACK_IMAGE', image.encode())
         self.updateLastPublishTime()
 
+        if time.time() - self.lastStatusTime > self.statusPeriod:
+            self.publishStatus(utimeRequest, utimeFrame, stats)
+
+
+    def publishStatus(self, utimeRequest, utimeFrame, stats):
+        msg = lcmdrc.behavior_command_t()
+        msg.command = json.dumps(dict(command='log-sync-status', utimeRequest=int(utimeRequest), utimeFrame=int(utimeFrame), frameCache=stats))
+        self.lc.publish('VIDEO_PLAYBACK_STATUS', msg.encode())
+        self.lastStatusTime = time.time()
+
 
     def onControlMessage(self, channel, msgBytes):
 
@@ -331,7 +565,8 @@ class CatalogThread(object):
         self.pruneEnabled = True
         self.maxNumberOfFiles = 30
         self.cropTimeWindow = 60*30
-        self.utimeMap = {}
+        self.saveInterval = 10.0
+        self.frameCatalog = FrameCatalog()
         self.catalog = {}
 
 
@@ -358,59 +593,53 @@ class CatalogThread(object):
         if self.pruneEnabled:
             logFiles = self.pruneLogFiles(logFiles, self.maxNumberOfFiles)
 
+        for filename in set(self.catalog.keys()).difference(logFiles):
+            del self.catalog[filename]
+
         for logFile in logFiles:
-            self.updateLogInfo(logFile)
+            self.updateLogInfo(logFile, isLastLog=(logFile == logFiles[-1]))
 
 
-    def updateLogInfo(self, filename):
+    def updateLogInfo(self, filename, isLastLog=False):
+        '''
+        Indexes the events appended to the log file since the last update
+        and adds its new video frames to the frame catalog.  The log index is
+        saved next to the log file, so on restart only events appended since
+        the last save are scanned.  The index of the log that is being
+        written is saved every saveInterval seconds.
+        '''
 
         fieldData = self.catalog.get(filename)
 
         if not fieldData:
             print 'discovered new file:', filename
-            fieldData = FieldData(filename=filename, fileSize=0, lastFilePos=0, channelTypes={})
+            fieldData = FieldData(filename=filename, logIndex=lcmlogindex.LcmLogIndex(filename), logId=self.frameCatalog.addLog(filename),
+                                  numEvents=0, lastSaveTime=time.time(), saved=True)
             self.catalog[filename] = fieldData
-            self.cropUtimeMap(self.utimeMap, self.cropTimeWindow)
-
-
-        log = lcm.EventLog(filename, 'r')
-        fileSize = log.size()
+            self.frameCatalog.crop(self.cropTimeWindow)
+            fieldData.logIndex.load()
 
-        # if the log file is the same size as the last time it was inspected
-        # then there is no more work to do, return.
-        if fileSize == fieldData.fileSize:
-            return
-
-        fieldData.fileSize = fileSize
-
-        # seek to the last processed event, if one exists, then read past it
-        if fieldData.lastFilePos > 0:
-            log.seek(fieldData.lastFilePos)
-            event = log.read_next_event()
-
-
-        while True:
-
-            filepos = log.tell()
-            event = log.read_next_event()
-            if not event:
-                break
-
-            fieldData.lastFilePos = filepos
-            timestamp = event.timestamp
-            channel = event.channel
+        logIndex = fieldData.logIndex
 
-            if channel == self.videoChannel:
-                self.utimeMap[timestamp] = (filename, filepos)
+        # if the log file has not grown since the last time it was
+        # inspected then there is no new work to do.
+        if os.path.getsize(filename) > logIndex.scannedOffset:
+            if logIndex.update(save=False):
+                fieldData.saved = False
 
+        if len(logIndex.events) > fieldData.numEvents:
+            newEvents = logIndex.events[fieldData.numEvents:]
+            fieldData.numEvents = len(logIndex.events)
 
-            # maintain a catalog of channelName->messageType
-            #if channel not in fieldData.channelTypes:
-            #    messageClass = spy.getMessageClass(event.data)
-            #    fieldData.channelTypes[channel] = messageClass
+            channelId = logIndex.channelIds.get(self.videoChannel)
+            if channelId is not None:
+                newEvents = newEvents[newEvents['channel'] == channelId]
+                self.frameCatalog.append(fieldData.logId, newEvents['timestamp'], newEvents['filepos'])
 
-
-        log.close()
+        if not fieldData.saved and (not isLastLog or time.time() - fieldData.lastSaveTime > self.saveInterval):
+            logIndex.save()
+            fieldData.saved = True
+            fieldData.lastSaveTime = time.time()
 
 
     @staticmethod
@@ -428,6 +657,10 @@ class CatalogThread(object):
             return [atoi(c) for c in re.split('(\d+)', text)]
 
         filenames = glob.glob(dirName + '/lcmlog-*')
+
+        # skip the index files that are saved next to the logs
+        indexFilenames = set(indexFilename for filename in filenames for indexFilename in lcmlogindex.getIndexFilenames(filename))
+        filenames = [filename for filename in filenames if filename not in indexFilenames]
         return sorted(filenames, key=splitKeys)
 
 
@@ -440,24 +673,13 @@ class CatalogThread(object):
             filename = logFiles.pop(0)
             print 'deleting:', filename
             os.remove(filename)
+            for indexFilename in lcmlogindex.getIndexFilenames(filename):
+                if os.path.isfile(indexFilename):
+                    os.remove(indexFilename)
 
         return logFiles
 
 
-    @staticmethod
-    def cropUtimeMap(utimeMap, timeWindow):
-
-        if not len(utimeMap):
-            return
-
-        utimes = getRecentUtimes(utimeMap, timeWindow)
-        cropTime = utimes[0]
-
-        for utime in utimeMap.keys():
-            if utime < cropTime:
-                del utimeMap[utime]
-
-
 def main():
 
     try:
@@ -472,7 +694,7 @@ def main():
     catalogThread.start()
 
 
-    serverThread = ServerThread(catalogThread.utimeMap)
+    serverThread = ServerThread(catalogThread.frameCatalog)
     serverThread.start()
 
     try:
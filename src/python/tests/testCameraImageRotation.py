@@ -0,0 +1,78 @@
+from director import consoleapp
+from director import cameraview
+from director import pointpicker
+import director.vtkAll as vtk
+import numpy as np
+
+
+class RotatedImageManager(object):
+    '''
+    Provides a single image that is displayed rotated by 180 degrees,
+    without an image queue.
+    '''
+
+    def __init__(self, width, height):
+        self.image = vtk.vtkImageData()
+        self.image.SetDimensions(width, height, 1)
+        self.image.AllocateScalars(vtk.VTK_UNSIGNED_CHAR, 3)
+
+    def addImage(self, imageName):
+        pass
+
+    def hasImage(self, imageName):
+        return True
+
+    def getImage(self, imageName):
+        return self.image
+
+    def getImageRotation180(self, imageName):
+        return True
+
+    def updateImage(self, imageName):
+        return 1
+
+
+def worldToDisplay(view, point):
+    displayPoint = [0.0, 0.0, 0.0]
+    vtk.vtkInteractorObserver.ComputeWorldToDisplay(view.renderer(), point[0], point[1], point[2], displayPoint)
+    return displayPoint[:2]
+
+
+def getCenter(polyData):
+    bounds = np.array(polyData.GetBounds()).reshape(3, 2)
+    return bounds.mean(axis=1)
+
+
+app = consoleapp.ConsoleApp()
+view = app.createView(useGrid=False)
+view.show()
+
+imageView = cameraview.CameraImageView(RotatedImageManager(640, 480), 'CAMERA', view=view)
+imageView.updateView()
+view.forceRender()
+
+# a pixel is drawn at the opposite corner of the rotated image, and picking
+# where it is drawn returns the pixel
+imagePixel = [100.0, 50.0, 0.0]
+viewPoint = imageView.getImagePixelViewPoint(imagePixel)
+assert np.allclose(viewPoint, [539.0, 429.0, 0.0])
+
+displayPoint = worldToDisplay(view, viewPoint)
+assert np.allclose(imageView.getImagePixel(displayPoint), imagePixel, atol=1.0)
+assert np.allclose(imageView.getImagePixelViewPoint(imageView.getImagePixel(displayPoint)), viewPoint, atol=1.0)
+
+# the picker reports the pixel but draws the pick and the cursor where the
+# mouse is
+picked = []
+picker = pointpicker.ImagePointPicker(imageView, callback=lambda p: picked.append(p))
+picker.onMouseMove(displayPoint)
+assert np.allclose(getCenter(picker.annotationObj.polyData)[:2], viewPoint[:2], atol=1.0)
+
+picker.updateCursor(displayPoint)
+assert np.allclose(getCenter(picker.cursorObj.polyData)[:2], viewPoint[:2], atol=1.0)
+
+picker.onMousePress(displayPoint)
+assert len(picked) == 1
+assert np.allclose(picked[0][:2], imagePixel[:2], atol=1.0)
+
+app.start()
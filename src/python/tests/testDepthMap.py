@@ -0,0 +1,84 @@
+from director.depthimageprovider import DepthMap, DepthMapCache
+from director import vtkNumpy as vnp
+from director import vtkAll as vtk
+from director import transformUtils
+import numpy as np
+
+
+class FakeMapSource(object):
+
+    def __init__(self, heights, transform):
+        self.heights = heights
+        self.transform = transform
+        self.mapId = 0
+        self.numberOfReads = 0
+
+    def GetCurrentMapId(self, viewId):
+        return self.mapId
+
+    def GetDataForMapId(self, viewId, mapId, imageData, transform):
+        self.numberOfReads += 1
+        height, width = self.heights.shape
+        imageData.SetDimensions(width, height, 1)
+        imageData.AllocateScalars(vtk.VTK_FLOAT, 1)
+        vnp.getNumpyFromVtk(imageData, 'ImageScalars')[:] = self.heights.reshape(-1)
+        transform.SetMatrix(transformUtils.getTransformFromNumpy(self.transform).GetMatrix())
+
+
+def getHeightMapTransform(resolution, origin):
+    '''
+    local to image transform of a height map with square pixels
+    '''
+    t = np.eye(4)
+    t[0,0] = t[1,1] = 1.0 / resolution
+    t[:2,3] = -np.array(origin[:2]) / resolution
+    return t
+
+
+def testPoints():
+
+    heights = np.random.rand(20, 30).astype(np.float32)
+    heights[3, 4] = np.inf
+    transform = getHeightMapTransform(0.05, [1.0, -2.0])
+
+    depthMap = DepthMap(0, 0, heights, transform)
+    points = depthMap.getPoints()
+    assert points.shape == (20, 30, 3)
+    assert depthMap.getPoints() is points
+
+    row, col = 7, 12
+    assert np.allclose(points[row, col], [1.0 + col*0.05, -2.0 + row*0.05, heights[row, col]])
+    assert np.isnan(points[3, 4]).all()
+
+    # the points map back to the image
+    homogeneous = np.dot(np.append(points[row, col], 1.0), transform.T)
+    assert np.allclose(homogeneous[:3], [col, row, heights[row, col]])
+
+
+def testCache():
+
+    heights = np.random.rand(20, 30).astype(np.float32)
+    source = FakeMapSource(heights, getHeightMapTransform(0.1, [0.0, 0.0]))
+    cache = DepthMapCache(source)
+
+    depthMap = cache.getDepthMap(1)
+    assert np.array_equal(depthMap.image, heights)
+    assert np.allclose(depthMap.transform, source.transform)
+
+    # repeated queries for the same map id reuse the cached map
+    assert cache.getDepthMap(1) is depthMap
+    d, t = cache.getDepthMapData(1)
+    assert d is depthMap.image
+    assert source.numberOfReads == 1
+
+    source.mapId = 1
+    assert cache.getDepthMap(1) is not depthMap
+    assert source.numberOfReads == 2
+
+    source.mapId = -1
+    assert cache.getDepthMap(1) is None
+    assert cache.getDepthMapData(1) == (None, None)
+
+
+testPoints()
+testCache()
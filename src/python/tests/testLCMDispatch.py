@@ -0,0 +1,180 @@
+from director import lcmUtils
+
+
+class CountingMessage(object):
+
+    decodeCount = 0
+
+    def __init__(self, data):
+        self.data = data
+
+    @classmethod
+    def decode(cls, data):
+        cls.decodeCount += 1
+        if data == 'bad':
+            raise ValueError('bad message')
+        return cls(data)
+
+
+class OtherMessage(CountingMessage):
+    decodeCount = 0
+
+
+class MessageData(object):
+    '''
+    Stands in for the QByteArray emitted by ddLCMSubscriber.
+    '''
+    def __init__(self, data):
+        self._data = data
+
+    def data(self):
+        return self._data
+
+
+class HistoricalLoader(object):
+
+    def __init__(self):
+        self.decodeCount = 0
+
+    def decode(self, typeName, data):
+        self.decodeCount += 1
+        return CountingMessage('historical ' + data)
+
+
+def testFanOut():
+
+    received = []
+    subs = [lcmUtils.addSubscriber('TEST_DISPATCH', CountingMessage, lambda msg, i=i: received.append((i, msg))) for i in xrange(5)]
+    channelSub = lcmUtils.addSubscriber('TEST_DISPATCH', OtherMessage, lambda msg, channel: received.append((channel, msg)), callbackNeedsChannel=True)
+
+    # one native subscription for the channel
+    dispatcher = subs[0].dispatcher
+    assert all(sub.dispatcher is dispatcher for sub in subs + [channelSub])
+
+    dispatcher.onMessage(MessageData('hello'), 'TEST_DISPATCH')
+
+    # decoded once per message class and shared between the callbacks
+    assert CountingMessage.decodeCount == 1
+    assert OtherMessage.decodeCount == 1
+    assert [i for i, msg in received] == range(5) + ['TEST_DISPATCH']
+    assert len(set(id(msg) for i, msg in received[:5])) == 1
+
+    # disabled and removed subscriptions are skipped
+    del received[:]
+    subs[1].setCallbackEnabled(False)
+    lcmUtils.removeSubscriber(subs[2])
+    dispatcher.onMessage(MessageData('hello'), 'TEST_DISPATCH')
+    assert [i for i, msg in received] == [0, 3, 4, 'TEST_DISPATCH']
+
+    # moving a subscription to the notify all dispatcher of the channel
+    subs[3].setNotifyAllMessagesEnabled(True)
+    assert subs[3].notifyAllMessagesIsEnabled()
+    assert subs[3].dispatcher is not dispatcher
+
+    for sub in subs + [channelSub]:
+        lcmUtils.removeSubscriber(sub)
+    assert not lcmUtils.ChannelDispatcher._dispatchers
+
+
+def testHistoricalLoader():
+
+    CountingMessage.decodeCount = 0
+    loader = HistoricalLoader()
+    received = []
+    subs = [lcmUtils.addSubscriber('TEST_HISTORICAL', CountingMessage, received.append, historicalLoader=loader) for i in xrange(3)]
+    plainSub = lcmUtils.addSubscriber('TEST_HISTORICAL', CountingMessage, received.append)
+
+    subs[0].dispatcher.onMessage(MessageData('bad'), 'TEST_HISTORICAL')
+
+    # the historical loader is tried once, the subscription without one gets nothing
+    assert CountingMessage.decodeCount == 1
+    assert loader.decodeCount == 1
+    assert [msg.data for msg in received] == ['historical bad']*3
+
+    for sub in subs + [plainSub]:
+        lcmUtils.removeSubscriber(sub)
+
+
+def testSpeedLimit():
+
+    received = []
+    sub = lcmUtils.addSubscriber('TEST_SPEED_LIMIT', CountingMessage, received.append)
+    sub.setSpeedLimit(1.0)
+
+    for i in xrange(10):
+        sub.dispatcher.onMessage(MessageData(str(i)), 'TEST_SPEED_LIMIT')
+
+    assert [msg.data for msg in received] == ['0']
+    lcmUtils.removeSubscriber(sub)
+
+
+class DroppingSubscriber(object):
+    '''
+    Stands in for the ddLCMSubscriber of a dispatcher and reports a number of
+    messages dropped by the lcm thread.
+    '''
+    def __init__(self, droppedMessageCount):
+        self.droppedMessageCount = droppedMessageCount
+
+    def takeMessageReceiveTime(self):
+        return 0.0
+
+    def getDroppedMessageCount(self):
+        return self.droppedMessageCount
+
+
+def testStatistics():
+
+    received = []
+    sub = lcmUtils.addSubscriber('TEST_STATISTICS', CountingMessage, received.append)
+    dispatcher = sub.dispatcher
+    subscriber = dispatcher.subscriber
+
+    # the messages dropped by the lcm thread are counted when the next
+    # message is delivered
+    dispatcher.subscriber = DroppingSubscriber(0)
+    dispatcher.onMessage(MessageData('0'), 'TEST_STATISTICS')
+    dispatcher.subscriber.droppedMessageCount = 8
+    dispatcher.onMessage(MessageData('9'), 'TEST_STATISTICS')
+
+    stats = sub.statistics
+    assert stats.messages == 2
+    assert stats.droppedMessages == 8
+    assert stats.queueDelay.count == stats.callbackTime.count == 2
+
+    sub.setSpeedLimit(1.0)
+    dispatcher.onMessage(MessageData('10'), 'TEST_STATISTICS')
+    dispatcher.onMessage(MessageData('11'), 'TEST_STATISTICS')
+    assert stats.messages == 3
+    assert stats.throttledMessages == 1
+
+    summaries = [summary for summary in lcmUtils.getSubscriberStatistics() if summary['channel'] == 'TEST_STATISTICS']
+    assert len(summaries) == 1
+    assert summaries[0]['messageType'] == 'CountingMessage'
+    assert summaries[0]['messages'] == 3
+
+    lcmUtils.resetSubscriberStatistics()
+    assert stats.messages == stats.droppedMessages == stats.throttledMessages == 0
+
+    dispatcher.subscriber = subscriber
+    lcmUtils.removeSubscriber(sub)
+
+
+def testDurationHistogram():
+
+    histogram = lcmUtils.DurationHistogram()
+    for milliseconds in [0.05]*90 + [3.0]*9 + [2000.0]:
+        histogram.add(milliseconds*1e-3)
+
+    assert histogram.count == 100
+    assert histogram.getPercentile(50) == 0.1
+    assert histogram.getPercentile(95) == 5.0
+    assert abs(histogram.getPercentile(100) - 2000.0) < 1e-6
+    assert abs(histogram.maximum - 2000.0) < 1e-6
+
+
+testFanOut()
+testHistoricalLoader()
+testSpeedLimit()
+testStatistics()
+testDurationHistogram()
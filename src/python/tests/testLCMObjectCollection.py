@@ -0,0 +1,127 @@
+from director import lcmobjectcollection
+from director.thirdparty import numpyjsoncoder
+import numpy as np
+
+
+class MessageBus(object):
+    '''
+    Delivers the messages published by the collections to all connected
+    collections, including the sender, in the order they were published.
+    '''
+
+    def __init__(self):
+        self.collections = []
+        self.queue = []
+        self.published = []
+
+    def publish(self, channel, msg):
+        self.queue.append(msg)
+        self.published.append(numpyjsoncoder.decode(msg.value))
+
+    def deliver(self):
+        while self.queue:
+            msg = self.queue.pop(0)
+            for collection in list(self.collections):
+                collection._onCommandMessage(msg)
+
+    def takeCommands(self):
+        self.deliver()
+        commands = [data['command'] for data in self.published]
+        del self.published[:]
+        return commands
+
+
+def newCollection(bus):
+    collection = lcmobjectcollection.LCMObjectCollection('TEST_OBJECT_COLLECTION')
+    bus.collections.append(collection)
+    return collection
+
+
+def assertSynchronized(*collections):
+    for collection in collections[1:]:
+        assert collection.collection.keys() == collections[0].collection.keys()
+        for descriptionId in collection.collection:
+            assert collection.getVersion(descriptionId) == collections[0].getVersion(descriptionId)
+            assert collection.encodedValues[descriptionId] == collections[0].encodedValues[descriptionId]
+
+
+def testSynchronization():
+
+    bus = MessageBus()
+    lcmobjectcollection.lcmUtils.publish = bus.publish
+
+    a = newCollection(bus)
+    b = newCollection(bus)
+
+    desc = dict(uuid='box', Name='box', pose=[[0.0, 0.0, 0.0], [1.0, 0.0, 0.0, 0.0]], Dimensions=np.array([1.0, 2.0, 3.0]))
+    a.updateDescription(desc)
+    assert bus.takeCommands() == ['update']
+    assertSynchronized(a, b)
+    assert a.getVersion('box') == (1, a.collectionId)
+
+    # an edit sends only the changed values
+    desc = dict(desc, pose=[[1.0, 0.0, 0.0], [1.0, 0.0, 0.0, 0.0]])
+    a.updateDescription(desc)
+    deltas = [data for data in bus.published if data['command'] == 'update_delta']
+    assert bus.takeCommands() == ['update_delta']
+    assert deltas[0]['changes'].keys() == ['pose']
+    assertSynchronized(a, b)
+    assert b.getDescription('box')['pose'][0] == [1.0, 0.0, 0.0]
+
+    # an update without changes is not published
+    a.updateDescription(dict(desc))
+    assert bus.takeCommands() == []
+
+    # edits by another peer continue the version counter
+    b.updateDescription(dict(b.getDescription('box'), Name='crate'))
+    assert bus.takeCommands() == ['update_delta']
+    assertSynchronized(a, b)
+    assert a.getVersion('box') == (3, b.collectionId)
+
+    # a late joiner receives the descriptions once from each peer, and a
+    # second request transfers nothing
+    c = newCollection(bus)
+    c.sendEchoRequest()
+    assert bus.takeCommands() == ['echo_request', 'echo_response', 'echo_response']
+    assertSynchronized(a, b, c)
+    c.sendEchoRequest()
+    assert bus.takeCommands() == ['echo_request']
+
+    # a peer that missed an update requests the description when the next
+    # delta does not apply to its version
+    bus.collections.remove(c)
+    a.updateDescription(dict(a.getDescription('box'), Name='box 2'))
+    bus.deliver()
+    bus.collections.append(c)
+    a.updateDescription(dict(a.getDescription('box'), Name='box 3'))
+    assert bus.takeCommands() == ['update_delta', 'update_delta', 'echo_request', 'echo_response', 'echo_response']
+    assertSynchronized(a, b, c)
+    assert c.getDescription('box')['Name'] == 'box 3'
+
+    # removed values are removed by the delta
+    desc = dict(a.getDescription('box'))
+    del desc['Dimensions']
+    a.updateDescription(desc)
+    bus.deliver()
+    assert 'Dimensions' not in b.getDescription('box')
+    assertSynchronized(a, b, c)
+
+    a.removeDescription('box')
+    bus.deliver()
+    assert not b.collection and not c.collection and b.getVersion('box') is None
+
+
+def testSentCommandsBounded():
+
+    bus = MessageBus()
+    lcmobjectcollection.lcmUtils.publish = bus.publish
+
+    collection = lcmobjectcollection.LCMObjectCollection('TEST_OBJECT_COLLECTION')
+    collection.maxSentCommands = 10
+    for i in xrange(100):
+        collection.updateDescription(dict(uuid='box', value=i))
+    assert len(collection.sentCommands) == 10
+
+
+testSynchronization()
+testSentCommandsBounded()
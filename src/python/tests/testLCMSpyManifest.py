@@ -0,0 +1,132 @@
+import os
+import sys
+import shutil
+import binascii
+import tempfile
+import threading
+
+from director import lcmspy
+
+
+typeTemplate = '''
+class %(name)s(object):
+
+    @staticmethod
+    def _get_packed_fingerprint():
+        return %(fingerprint)r
+
+    @staticmethod
+    def decode(data):
+        return %(name)s()
+'''
+
+
+def writeTypesPackage(searchDir, packageName, types, initCode=''):
+    packageDir = os.path.join(searchDir, packageName)
+    os.makedirs(packageDir)
+    with open(os.path.join(packageDir, '__init__.py'), 'w') as f:
+        f.write('"""LCM package __init__.py file\n')
+        f.write('This file automatically generated by lcm-gen.\n"""\n\n')
+        f.write(initCode)
+        for name in types:
+            f.write('from %s import %s\n' % (name, name))
+    for name, fingerprint in types.iteritems():
+        with open(os.path.join(packageDir, name + '.py'), 'w') as f:
+            f.write(typeTemplate % dict(name=name, fingerprint=fingerprint))
+
+
+def resetSpy():
+    lcmspy.messageTypes.clear()
+    lcmspy.messageTypeToModule.clear()
+    lcmspy.messageManifest.clear()
+    lcmspy.loadedModules.clear()
+
+
+def testManifest():
+
+    tempDir = tempfile.mkdtemp()
+    sys.path.append(tempDir)
+    try:
+        fooFingerprint = 'spyfoo01'
+        writeTypesPackage(tempDir, 'spytest_foo', {'foo_t': fooFingerprint})
+        writeTypesPackage(tempDir, 'spytest_bar', {'bar_t': 'spybar01', 'baz_t': 'spybaz01'})
+        manifestFile = os.path.join(tempDir, 'manifest.json')
+
+        # the first run imports the packages to build the manifest
+        lcmspy.findLCMModulesInSysPath(filename=manifestFile)
+        assert os.path.isfile(manifestFile)
+        assert lcmspy.getMessageClass(fooFingerprint + 'data').__name__ == 'foo_t'
+
+        # later runs import a package only when one of its types is seen
+        for name in ['spytest_foo', 'spytest_bar']:
+            del sys.modules[name]
+        resetSpy()
+
+        lcmspy.findLCMModulesInSysPath(filename=manifestFile)
+        assert 'spytest_foo' not in sys.modules
+        assert 'spytest_bar' not in sys.modules
+
+        msgType = lcmspy.getMessageClass(fooFingerprint + 'data')
+        assert msgType.__name__ == 'foo_t'
+        assert lcmspy.getMessageTypeFullName(msgType) == 'spytest_foo.foo_t'
+        assert 'spytest_foo' in sys.modules
+        assert 'spytest_bar' not in sys.modules
+        assert lcmspy.getMessageClass('unknown0data') is None
+
+        # a new package changes the directory mtime and is added to the manifest
+        writeTypesPackage(tempDir, 'spytest_qux', {'qux_t': 'spyqux01'})
+        os.utime(tempDir, (0, 0))
+        resetSpy()
+        lcmspy.findLCMModulesInSysPath(filename=manifestFile)
+        assert lcmspy.getMessageClass('spyqux01data').__name__ == 'qux_t'
+
+        # a type regenerated in place changes only the mtime of its module,
+        # the new fingerprint is found by rescanning when it is first seen
+        with open(os.path.join(tempDir, 'spytest_foo', 'foo_t.py'), 'w') as f:
+            f.write(typeTemplate % dict(name='foo_t', fingerprint='spyfoo02'))
+        os.utime(os.path.join(tempDir, 'spytest_foo', 'foo_t.py'), (1e9, 1e9))
+        assert lcmspy.getMessageClass('spyfoo02data').__name__ == 'foo_t'
+        assert lcmspy.getMessageClass(fooFingerprint + 'data') is None
+
+        # and the updated manifest is used by later runs
+        resetSpy()
+        lcmspy.findLCMModulesInSysPath(filename=manifestFile)
+        assert binascii.unhexlify(lcmspy.loadManifest(manifestFile)['searchDirs'][tempDir]['packages']['spytest_foo']['types'].keys()[0]) == 'spyfoo02'
+        assert lcmspy.getMessageClass('spyfoo02data').__name__ == 'foo_t'
+
+    finally:
+        sys.path.remove(tempDir)
+        shutil.rmtree(tempDir)
+
+
+def testConcurrentImport():
+
+    tempDir = tempfile.mkdtemp()
+    sys.path.append(tempDir)
+    try:
+        # a package that is slow to import, so that other threads look up
+        # its type while it is being imported
+        writeTypesPackage(tempDir, 'spytest_slow', {'slow_t': 'spyslow1'}, initCode='import time\ntime.sleep(0.2)\n')
+        manifestFile = os.path.join(tempDir, 'manifest.json')
+        lcmspy.findLCMModulesInSysPath(filename=manifestFile)
+        del sys.modules['spytest_slow']
+        resetSpy()
+        lcmspy.findLCMModulesInSysPath(filename=manifestFile)
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(lcmspy.getMessageClass('spyslow1data'))) for i in xrange(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(results) == 8
+        assert all(cls is not None and cls.__name__ == 'slow_t' for cls in results)
+
+    finally:
+        sys.path.remove(tempDir)
+        shutil.rmtree(tempDir)
+
+
+testManifest()
+testConcurrentImport()
@@ -0,0 +1,68 @@
+import os
+import shutil
+import tempfile
+import lcm
+
+from director import lcmspy
+
+
+def isClose(a, b, tolerance=1e-6):
+    return abs(a - b) <= tolerance*max(abs(a), abs(b), 1.0)
+
+
+def testCollector():
+
+    collector = lcmspy.LCMStatisticsCollector(windowDuration=2.0)
+
+    for i in xrange(1000):
+        t = i*0.01
+        collector.onMessage('ROBOT_STATE', 'x'*1000, t)
+        if i % 10 == 0:
+            # 10 hz, alternating 40 and 60 ms late
+            collector.onMessage('CAMERA', 'x'*100000, t + (0.04 if i % 20 else 0.06))
+
+    assert collector.getChannels() == ['CAMERA', 'ROBOT_STATE']
+
+    stats = collector.getStatistics('ROBOT_STATE')
+    assert stats['messages'] == 1000
+    assert stats['bytes'] == 1000*1000
+    assert isClose(stats['rate'], 100.0, 0.01)
+    assert isClose(stats['byteRate'], 100000.0, 0.01)
+    assert isClose(stats['meanInterval'], 0.01)
+    assert stats['jitter'] < 1e-6
+    assert stats['sizeHistogram'][(1000).bit_length()] == 1000
+    assert stats['intervalHistogram'][(10000).bit_length()] == 999
+
+    stats = collector.getStatistics('CAMERA')
+    assert stats['messages'] == 100
+    assert isClose(stats['meanInterval'], 0.1, 1e-3)
+    assert isClose(stats['jitter'], 0.02, 0.05)
+
+    # the window slides with the query time
+    stats = collector.getStatistics('ROBOT_STATE', now=20.0)
+    assert stats['windowMessages'] == 0
+    assert stats['rate'] == 0.0
+
+
+def testLogFileDescription():
+
+    tempDir = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(tempDir, 'lcmlog-test')
+        log = lcm.EventLog(filename, 'w')
+        for i in xrange(500):
+            log.write_event(int(i*1e6/50), 'STATUS', 'status')
+        log.close()
+
+        lcmspy.lcmStatistics.reset()
+        lcmspy.printLogFileDescription(filename)
+        stats = lcmspy.lcmStatistics.getStatistics('STATUS')
+        assert stats['messages'] == 500
+        assert isClose(stats['rate'], 50.0, 0.01)
+
+    finally:
+        shutil.rmtree(tempDir)
+
+
+testCollector()
+testLogFileDescription()
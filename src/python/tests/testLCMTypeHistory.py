@@ -0,0 +1,102 @@
+import os
+import shutil
+import tempfile
+import subprocess
+
+from director import lcmtypehistory
+
+
+pointRevisions = [
+    'package ddtest;\nstruct point_t\n{\n  double x;\n  double y;\n}\n',
+    'package ddtest;\nstruct point_t\n{\n  double x;\n  double y;\n  double z;\n}\n',
+    'package ddtest;\nstruct point_t\n{\n  double x;\n  double y;\n  double z;\n  double w;\n}\n',
+    ]
+
+
+def commitRevisions(repoDir, revisions):
+    typesDir = os.path.join(repoDir, 'lcmtypes')
+    git = ['git', '-C', repoDir, '-c', 'user.name=test', '-c', 'user.email=test@example.com']
+    if not os.path.exists(typesDir):
+        os.makedirs(typesDir)
+        subprocess.check_call(git + ['init', '-q'])
+    for i, revision in enumerate(revisions):
+        open(os.path.join(typesDir, 'ddtest_point_t.lcm'), 'w').write(revision)
+        subprocess.check_call(git + ['add', 'lcmtypes'])
+        subprocess.check_call(git + ['commit', '-q', '-m', 'revision %d' % i])
+
+
+def noSubprocess(*args, **kwargs):
+    raise AssertionError('subprocess called: %r' % (args,))
+
+
+def testPrebuild():
+
+    tempDir = tempfile.mkdtemp()
+    try:
+        repoDir = os.path.join(tempDir, 'repo')
+        cacheDir = os.path.join(tempDir, 'cache')
+        commitRevisions(repoDir, pointRevisions[:2])
+
+        loader = lcmtypehistory.HistoricalLCMLoader('ddtest', 'lcmtypes', repoDir, cacheDir)
+        assert loader.prebuild(['point_t']) == {'point_t': 2}
+
+        oldestSha = loader.getSHAsForType('point_t')[-1]
+        msg = loader.getTypeAtSHA('point_t', oldestSha)()
+        msg.x, msg.y = 1.0, 2.0
+        data = msg.encode()
+
+        # a new loader decodes from the saved index and builds without
+        # running git or lcm-gen
+        checkCall, checkOutput = subprocess.check_call, subprocess.check_output
+        subprocess.check_call = subprocess.check_output = noSubprocess
+        try:
+            loader = lcmtypehistory.HistoricalLCMLoader('ddtest', 'lcmtypes', repoDir, cacheDir)
+            decoded = loader.decode('point_t', data)
+            assert (decoded.x, decoded.y) == (1.0, 2.0)
+            assert not hasattr(decoded, 'z')
+
+        finally:
+            subprocess.check_call, subprocess.check_output = checkCall, checkOutput
+
+        # an unknown fingerprint of a prebuilt type fails without running
+        # git or lcm-gen
+        subprocess.check_call = subprocess.check_output = noSubprocess
+        try:
+            try:
+                loader.decode('point_t', 'unknownfingerprint')
+            except ValueError:
+                pass
+            else:
+                assert False
+        finally:
+            subprocess.check_call, subprocess.check_output = checkCall, checkOutput
+
+        # a revision committed after the prebuild is not decoded until the
+        # type is prebuilt again
+        commitRevisions(repoDir, pointRevisions[2:])
+        newestSha = loader.getSHAsForType('point_t')[0]
+        newLoader = lcmtypehistory.HistoricalLCMLoader('ddtest', 'lcmtypes', repoDir, os.path.join(tempDir, 'othercache'))
+        msg = newLoader.getTypeAtSHA('point_t', newestSha)()
+        msg.x, msg.y, msg.z, msg.w = 1.0, 2.0, 3.0, 4.0
+        data = msg.encode()
+
+        loader = lcmtypehistory.HistoricalLCMLoader('ddtest', 'lcmtypes', repoDir, cacheDir)
+        assert not loader.isPrebuiltCurrent('point_t')
+        try:
+            loader.decode('point_t', data)
+        except ValueError:
+            pass
+        else:
+            assert False
+
+        assert loader.prebuild(['point_t']) == {'point_t': 3}
+        assert loader.isPrebuiltCurrent('point_t')
+        decoded = loader.decode('point_t', data)
+        assert (decoded.x, decoded.y, decoded.z, decoded.w) == (1.0, 2.0, 3.0, 4.0)
+        assert loader.loadIndex()['prebuilt']['point_t'] == newestSha
+
+    finally:
+        shutil.rmtree(tempDir)
+
+
+testPrebuild()
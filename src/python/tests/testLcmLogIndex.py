@@ -0,0 +1,77 @@
+import os
+import shutil
+import tempfile
+import lcm
+import numpy as np
+
+from director import lcmlogindex
+from director.lcmlogplayer import LcmLogPlayer
+
+
+def writeEvents(filename, channels, startTime, numEvents, mode='w'):
+    log = lcm.EventLog(filename, mode)
+    for i in xrange(numEvents):
+        channel = channels[i % len(channels)]
+        log.write_event(startTime + i*1000, channel, channel + str(i))
+    log.close()
+
+
+def readEvents(filename):
+    log = lcm.EventLog(filename, 'r')
+    events = []
+    while True:
+        filepos = log.tell()
+        event = log.read_next_event()
+        if not event:
+            break
+        events.append((event.timestamp, filepos, event.channel))
+    log.close()
+    return events
+
+
+def checkIndex(index, filename):
+    events = readEvents(filename)
+    assert index.getNumberOfEvents() == len(events)
+    assert np.array_equal(index.timestamps, [e[0] for e in events])
+    assert np.array_equal(index.filePositions, [e[1] for e in events])
+    assert [index.channels[i] for i in index.channelIndex] == [e[2] for e in events]
+
+
+def testLogIndex():
+
+    tempDir = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(tempDir, 'lcmlog-test')
+        writeEvents(filename, ['FOO', 'BAR', 'BAZ'], 1000000, 100)
+
+        index = lcmlogindex.loadLogIndex(filename)
+        assert not index.loadedFromCache
+        checkIndex(index, filename)
+
+        # second open uses the sidecar index
+        index = lcmlogindex.loadLogIndex(filename)
+        assert index.loadedFromCache
+        assert isinstance(index.events, np.memmap)
+        checkIndex(index, filename)
+
+        # appended events are indexed incrementally
+        writeEvents(filename, ['FOO', 'QUX'], 2000000, 50, mode='a')
+        index = lcmlogindex.loadLogIndex(filename)
+        assert index.loadedFromCache
+        assert index.channels == ['FOO', 'BAR', 'BAZ', 'QUX']
+        checkIndex(index, filename)
+
+        # the player reads timestamps and file positions from the index
+        player = LcmLogPlayer()
+        player.readLog(filename)
+        assert player.logIndex.loadedFromCache
+        assert player.timestamps[0] == 0
+        assert player.findEventIndex(1e6) == 100
+        player.resetPlayPosition(1.0)
+        assert player.log.read_next_event().timestamp == 2000000
+
+    finally:
+        shutil.rmtree(tempDir)
+
+
+testLogIndex()
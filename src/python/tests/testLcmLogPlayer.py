@@ -0,0 +1,175 @@
+import os
+import time
+import shutil
+import tempfile
+import lcm
+import numpy as np
+
+from director.lcmlogplayer import LcmLogPlayer
+
+
+class PublishRecorder(object):
+
+    def __init__(self):
+        self.messages = []
+
+    def publish(self, channel, data):
+        self.messages.append((channel, data))
+
+    def getChannels(self):
+        return set(channel for channel, data in self.messages)
+
+    def getCount(self, channel):
+        return len([c for c, data in self.messages if c == channel])
+
+
+def writeLog(filename):
+    '''
+    Writes 10 seconds of ROBOT_STATE at 100 hz and CAMERA at 30 hz.
+    '''
+    log = lcm.EventLog(filename, 'w')
+    events = [(int(i*1e6/100), 'ROBOT_STATE') for i in xrange(1000)]
+    events += [(int(i*1e6/30), 'CAMERA') for i in xrange(300)]
+    for utime, channel in sorted(events):
+        log.write_event(utime, channel, channel)
+    log.close()
+
+
+def playAll(player):
+    player.resetPlayPosition(0.0)
+    player.advanceTime(player.getEndTime() + 1.0)
+
+
+def testChannelFilter(filename):
+
+    recorder = PublishRecorder()
+    player = LcmLogPlayer(recorder)
+    player.readLog(filename)
+
+    playAll(player)
+    assert recorder.getCount('ROBOT_STATE') == 1000
+    assert recorder.getCount('CAMERA') == 300
+
+    del recorder.messages[:]
+    player.setChannelFilter(exclude=['CAM.*'])
+    playAll(player)
+    assert recorder.getChannels() == set(['ROBOT_STATE'])
+    assert recorder.getCount('ROBOT_STATE') == 1000
+
+    del recorder.messages[:]
+    player.setChannelFilter(include=['CAMERA', 'ROBOT'])
+    playAll(player)
+    assert recorder.getChannels() == set(['CAMERA'])
+
+    del recorder.messages[:]
+    player.setChannelFilter()
+    player.setChannelMaxRate('ROBOT_STATE', 10.0)
+    playAll(player)
+    assert recorder.getCount('ROBOT_STATE') == 100
+    assert recorder.getCount('CAMERA') == 300
+
+    del recorder.messages[:]
+    player.setChannelMaxRate('ROBOT_STATE', None)
+    playAll(player)
+    assert recorder.getCount('ROBOT_STATE') == 1000
+
+
+def waitForPrefetch(player, numEvents, timeout=5.0):
+    startTime = time.time()
+    while player.getPrefetchStatistics()['bufferedEvents'] < numEvents:
+        assert time.time() - startTime < timeout
+        time.sleep(0.01)
+
+
+def testPrefetch(filename):
+
+    recorder = PublishRecorder()
+    player = LcmLogPlayer(recorder)
+    player.readLog(filename)
+    player.setPrefetchEnabled(True, prefetchTime=20.0)
+
+    player.resetPlayPosition(0.0)
+    waitForPrefetch(player, 1300)
+    player.advanceTime(player.getEndTime() + 1.0)
+    assert recorder.getCount('ROBOT_STATE') == 1000
+    assert recorder.getCount('CAMERA') == 300
+    assert player.getPrefetchStatistics()['underruns'] == 0
+
+    # seeking flushes the buffer and refills from the new position
+    del recorder.messages[:]
+    player.setChannelFilter(exclude=['CAMERA'])
+    player.resetPlayPosition(5.0)
+    waitForPrefetch(player, 500)
+    player.advanceTime(player.getEndTime() + 1.0)
+    assert recorder.getChannels() == set(['ROBOT_STATE'])
+    assert recorder.getCount('ROBOT_STATE') == 500
+
+    player.setPrefetchEnabled(False)
+
+
+def testPrefetchSkipToTime(filename):
+
+    recorder = PublishRecorder()
+    player = LcmLogPlayer(recorder)
+    player.readLog(filename)
+    player.setPrefetchEnabled(True)
+
+    # scrubbing reads the events at each position and seeks the reader
+    # once per position
+    for playTime in (1.0, 7.5, 3.0):
+        del recorder.messages[:]
+        generation = player.readerThread.generation
+        player.skipToTime(playTime, playLength=0.1)
+        assert recorder.getCount('ROBOT_STATE') == 11
+        assert recorder.getCount('CAMERA') in (3, 4)
+        assert player.readerThread.generation == generation + 1
+
+    player.setPrefetchEnabled(False)
+
+
+def testPrefetchUnderrun(filename):
+
+    recorder = PublishRecorder()
+    player = LcmLogPlayer(recorder)
+    player.readLog(filename)
+    player.setPrefetchEnabled(True)
+    reader = player.readerThread
+
+    # holding the condition keeps the reader from reading, so playback
+    # waits for it instead of reading the event itself
+    with reader.condition:
+        player.resetPlayPosition(0.0)
+        generation = reader.generation
+        player.advanceTime(1.0)
+        assert not recorder.messages
+        assert player.getPrefetchStatistics()['underruns'] == 1
+
+    # later ticks continue from the same event without restarting the reader
+    startTime = time.time()
+    while player.nextEventIndex < len(player.timestamps):
+        assert time.time() - startTime < 5.0
+        player.advanceTime(player.getEndTime() + 1.0)
+        time.sleep(0.001)
+    assert recorder.getCount('ROBOT_STATE') == 1000
+    assert recorder.getCount('CAMERA') == 300
+    assert reader.generation == generation
+
+    player.setPrefetchEnabled(False)
+
+
+def main():
+
+    tempDir = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(tempDir, 'lcmlog-test')
+        writeLog(filename)
+        testChannelFilter(filename)
+        testPrefetch(filename)
+        testPrefetchSkipToTime(filename)
+        testPrefetchUnderrun(filename)
+    finally:
+        shutil.rmtree(tempDir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+import os
+import time
+import shutil
+import tempfile
+import lcm
+
+from director import lcmlogindex
+from director import lcmlogsurvey
+
+
+def writeLog(filename, duration, channels):
+    '''
+    Writes events for the given duration in seconds.  channels is a list of
+    (channel, rate, fingerprint, dataSize).
+    '''
+    events = []
+    for channel, rate, fingerprint, dataSize in channels:
+        numEvents = int(duration*rate)
+        data = fingerprint + 'x'*(dataSize - len(fingerprint))
+        events += [(int(i*1e6/rate), channel, data) for i in xrange(numEvents)]
+
+    log = lcm.EventLog(filename, 'w')
+    for utime, channel, data in sorted(events):
+        log.write_event(utime, channel, data)
+    log.close()
+
+
+def testSurvey():
+
+    tempDir = tempfile.mkdtemp()
+    try:
+        filenames = [os.path.join(tempDir, 'lcmlog-%d' % i) for i in xrange(3)]
+        for i, filename in enumerate(filenames):
+            writeLog(filename, 10 + i, [('ROBOT_STATE', 100, 'robot_st', 500),
+                                        ('CAMERA', 10, 'image_t_', 20000)])
+
+        summaryFile = os.path.join(tempDir, 'summary.json')
+        logs = lcmlogsurvey.surveyLogs(filenames, summaryFile, processes=2)
+        assert sorted(logs.keys()) == filenames
+
+        for i, filename in enumerate(filenames):
+            summary = logs[filename]
+            duration = 10 + i
+            assert summary['numEvents'] == duration*110
+            robotState = summary['channels']['ROBOT_STATE']
+            assert robotState['count'] == duration*100
+            assert robotState['bytes'] == duration*100*500
+            assert abs(robotState['rate'] - 100.0) < 1e-6
+            assert robotState['fingerprints'] == ['robot_st'.encode('hex')]
+            assert summary['channels']['CAMERA']['bytes'] == duration*10*20000
+
+        # unchanged logs are read from the summary file, modified logs are rescanned
+        time.sleep(0.01)
+        writeLog(filenames[0], 5, [('STATUS', 50, 'status_t', 100)])
+        logs = lcmlogsurvey.surveyLogs(filenames, summaryFile, processes=2)
+        assert logs[filenames[0]]['channels'].keys() == ['STATUS']
+        assert logs[filenames[1]]['numEvents'] == 11*110
+
+        lcmlogsurvey.printSurvey(logs, typeNames=False)
+
+        # index sidecars are only written on request
+        assert not [f for f in os.listdir(tempDir) if '.ddidx' in f]
+        logs = lcmlogsurvey.surveyLogs(filenames[:1], processes=1, writeIndex=True)
+        assert lcmlogindex.LcmLogIndex(filenames[0]).load().loadedFromCache
+
+        # missing logs are reported and skipped
+        missingFile = os.path.join(tempDir, 'lcmlog-missing')
+        logs = lcmlogsurvey.surveyLogs(filenames + [missingFile], summaryFile, processes=2)
+        assert sorted(logs.keys()) == filenames
+
+        os.remove(filenames[1])
+        logs = lcmlogsurvey.surveyLogs(filenames, summaryFile, processes=2)
+        assert sorted(logs.keys()) == [filenames[0], filenames[2]]
+
+    finally:
+        shutil.rmtree(tempDir)
+
+
+testSurvey()
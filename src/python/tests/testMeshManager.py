@@ -0,0 +1,197 @@
+import shutil
+import tempfile
+import numpy as np
+
+from director.consoleapp import ConsoleApp
+from director import geometryencoder
+from director import meshmanager
+from director.debugVis import DebugData
+
+
+def getTestPolyData():
+    d = DebugData()
+    d.addSphere((0,0,0), radius=0.5, resolution=48)
+    d.addArrow((0,0,0), (0,0,1))
+    return d.getPolyData()
+
+
+def newMeshManager(cacheDirectory):
+    manager = meshmanager.MeshManager()
+    manager.cacheDirectory = cacheDirectory
+    manager.chunkSize = 1024
+    return manager
+
+
+def getChunkMessages(manager, contentHash):
+    data = manager.meshData[contentHash]
+    chunks = geometryencoder.splitChunks(data, manager.chunkSize)
+    return [dict(contentHash=contentHash, index=i, numChunks=len(chunks), size=len(data), data=chunk)
+            for i, chunk in enumerate(chunks)]
+
+
+def testEncoding():
+
+    encoded = geometryencoder.encodePolyData(getTestPolyData())
+    compressed = geometryencoder.compressData(encoded)
+    assert len(compressed) < len(encoded)
+    assert np.array_equal(geometryencoder.decompressData(compressed), encoded)
+
+    chunks = geometryencoder.splitChunks(compressed, 100)
+    assembler = geometryencoder.ChunkAssembler(len(chunks), len(compressed))
+    for i in reversed(range(1, len(chunks))):
+        assembler.addChunk(i, chunks[i])
+    assert assembler.getMissingChunks() == [0]
+    assembler.addChunk(0, chunks[0])
+    assert assembler.isComplete()
+    assert np.array_equal(assembler.getData(), compressed)
+
+
+def testTransfer():
+
+    sourceDir = tempfile.mkdtemp()
+    peerDir = tempfile.mkdtemp()
+    try:
+        source = newMeshManager(sourceDir)
+        polyData = getTestPolyData()
+        meshId = source.add(polyData)
+        desc = source.collection.getDescription(meshId)
+        assert 'data' not in desc
+        assert desc['numChunks'] > 2
+
+        # a peer receives the description, then all but one chunk
+        peer = newMeshManager(peerDir)
+        peer.collection.updateDescription(desc, publish=False)
+        assert peer.get(meshId) is None
+
+        messages = getChunkMessages(source, desc['contentHash'])
+        for message in messages[:-2] + messages[-1:]:
+            peer.handleChunk(message)
+        assert peer.getMissingChunks(desc['contentHash']) == [desc['numChunks'] - 2]
+
+        # resuming sends only the missing chunk
+        peer.handleChunk(messages[-2])
+        assert peer.get(meshId).GetNumberOfPoints() == polyData.GetNumberOfPoints()
+        assert not peer.pendingTransfers
+
+        # a second mesh with the same content reuses the decoded mesh
+        secondDesc = dict(desc, uuid='second-mesh')
+        peer.collection.updateDescription(secondDesc, publish=False)
+        assert peer.get('second-mesh') is peer.get(meshId)
+
+        # a new peer loads the mesh from the cache directory, no transfer needed
+        cachedPeer = newMeshManager(peerDir)
+        cachedPeer.collection.updateDescription(desc, publish=False)
+        assert cachedPeer.get(meshId).GetNumberOfPoints() == polyData.GetNumberOfPoints()
+        assert not cachedPeer.pendingTransfers
+
+        for manager in (source, peer, cachedPeer):
+            manager.close()
+
+    finally:
+        shutil.rmtree(sourceDir)
+        shutil.rmtree(peerDir)
+
+
+def recordChunks(manager):
+    sent = []
+    manager._publishChunks = lambda contentHash, chunkIndices: sent.extend(chunkIndices)
+    return sent
+
+
+def testChunkRequests():
+
+    sourceDir = tempfile.mkdtemp()
+    peerDir = tempfile.mkdtemp()
+    try:
+        source = newMeshManager(sourceDir)
+        meshId = source.add(getTestPolyData())
+        desc = source.collection.getDescription(meshId)
+        assert desc['senderId'] == source.senderId
+        contentHash = desc['contentHash']
+
+        peer = newMeshManager(peerDir)
+        for message in getChunkMessages(source, contentHash):
+            peer.handleChunk(message)
+        peer.answerBackoff = 0.0
+
+        sourceSent = recordChunks(source)
+        peerSent = recordChunks(peer)
+
+        # the original sender answers at once, the peer waits and then skips
+        # the chunks that the sender already sent
+        request = dict(contentHash=contentHash, chunks=[0, 1, 2], sourceId=source.senderId)
+        source.handleChunkRequest(request)
+        peer.handleChunkRequest(request)
+        assert sourceSent == [0, 1, 2]
+        assert peer.pendingAnswers
+
+        for message in getChunkMessages(source, contentHash)[:2]:
+            peer._onChunkSent(contentHash, message['index'])
+        peer._onAnswerTimer()
+        assert peerSent == [2]
+        assert not peer.pendingAnswers
+
+        # without the original sender the peer answers after the backoff
+        del peerSent[:]
+        peer.handleChunkRequest(dict(request, sourceId='gone'))
+        peer._onAnswerTimer()
+        assert peerSent == [0, 1, 2]
+
+        source.close()
+        peer.close()
+
+    finally:
+        shutil.rmtree(sourceDir)
+        shutil.rmtree(peerDir)
+
+
+def testPublishOnRequest():
+
+    sourceDir = tempfile.mkdtemp()
+    peerDir = tempfile.mkdtemp()
+    try:
+        source = newMeshManager(sourceDir)
+        sourceSent = recordChunks(source)
+        polyData = getTestPolyData()
+        meshId = source.add(polyData)
+        desc = source.collection.getDescription(meshId)
+
+        # publishing sends the description only
+        assert sourceSent == []
+
+        # a peer without the mesh requests all chunks when the description
+        # arrives, and is notified when the mesh is ready
+        peer = newMeshManager(peerDir)
+        requests = []
+        peer._publishDataMessage = lambda commandName, **commandArgs: requests.append((commandName, commandArgs['chunks']))
+        added = []
+        peer.connectMeshAdded(added.append)
+
+        peer.collection.updateDescription(desc, publish=False)
+        assert requests == [('request', range(desc['numChunks']))]
+        assert peer.isPending(meshId)
+
+        for message in getChunkMessages(source, desc['contentHash']):
+            peer.handleChunk(message)
+        assert added == [meshId]
+        assert not peer.isPending(meshId)
+
+        # peers running the older mesh manager read the mesh from the description
+        source.includeInlineData = True
+        inlineDesc = source.collection.getDescription(source.add(polyData))
+        assert geometryencoder.decodePolyData(inlineDesc['data']).GetNumberOfPoints() == polyData.GetNumberOfPoints()
+        assert sourceSent == []
+
+        source.close()
+        peer.close()
+
+    finally:
+        shutil.rmtree(sourceDir)
+        shutil.rmtree(peerDir)
+
+
+app = ConsoleApp()
+testEncoding()
+testTransfer()
+testChunkRequests()
+testPublishOnRequest()
@@ -0,0 +1,68 @@
+from director.pointcloudbuffer import RollingPointBuffer
+from director import vtkNumpy as vnp
+import numpy as np
+
+
+def makeScanLine(lineId, numPoints=100):
+    pts = np.zeros((numPoints, 3))
+    pts[:,0] = lineId
+    pts[:,1] = np.arange(numPoints)
+    intensity = np.ones(numPoints, dtype=np.float32)*lineId
+    return vnp.numpyToPolyData(pts, pointData={'intensity': intensity})
+
+
+def getWindowLineIds(buf):
+    return np.unique(vnp.getNumpyFromVtk(buf.getWindowPolyData(), 'Points')[:,0]).astype(int).tolist()
+
+
+def testTimeWindow():
+
+    buf = RollingPointBuffer(capacity=10000, windowDuration=1.0)
+    pointsArray = buf.polyData.GetPoints().GetData()
+
+    for lineId in xrange(30):
+        buf.addScanLine(makeScanLine(lineId), utime=lineId*1e5)
+    buf.update()
+
+    # lines older than one second before the last line are dropped
+    assert buf.getNumberOfScanLines() == 11
+    assert buf.polyData.GetNumberOfVerts() == buf.getNumberOfPoints() == 1100
+    assert getWindowLineIds(buf) == range(19, 30)
+    assert buf.getArrayNames() == ['intensity']
+
+    # the buffers are updated in place
+    assert buf.polyData.GetPoints().GetData() is pointsArray
+    assert buf.polyData.GetNumberOfPoints() == buf.capacity
+
+    buf.setWindowDuration(0.5)
+    assert getWindowLineIds(buf) == range(24, 30)
+
+
+def testCapacity():
+
+    buf = RollingPointBuffer(capacity=1050, windowDuration=100.0)
+
+    for lineId in xrange(37):
+        buf.addScanLine(makeScanLine(lineId), utime=lineId*1e5)
+    buf.update()
+
+    # the window wraps around the end of the ring and holds whole scan lines
+    assert buf.getNumberOfPoints() == 1000
+    assert getWindowLineIds(buf) == range(27, 37)
+
+    window = buf.getWindowPolyData()
+    pts = vnp.getNumpyFromVtk(window, 'Points')
+    intensity = vnp.getNumpyFromVtk(window, 'intensity')
+    assert np.array_equal(pts[:,0], intensity)
+    assert np.array_equal(pts[:100,1], np.arange(100))
+
+    cellIds = [buf.polyData.GetCell(i).GetPointId(0) for i in (0, 999)]
+    assert cellIds == [(27*100) % 1050, (37*100 - 1) % 1050]
+
+    buf.clear()
+    buf.update()
+    assert buf.getNumberOfPoints() == buf.polyData.GetNumberOfVerts() == 0
+
+
+testTimeWindow()
+testCapacity()
@@ -0,0 +1,86 @@
+from director.pointcloudlod import VoxelPyramid
+from director import vtkNumpy as vnp
+import numpy as np
+
+
+def makePointCloud(numPoints=200000):
+    pts = np.random.rand(numPoints, 3) * [10.0, 10.0, 0.1]
+    intensity = np.arange(numPoints, dtype=np.float32)
+    return vnp.numpyToPolyData(pts, pointData={'intensity': intensity})
+
+
+def testPyramid():
+
+    polyData = makePointCloud()
+    pyramid = VoxelPyramid(polyData, minimumNumberOfPoints=1000)
+
+    numLevels = pyramid.getNumberOfLevels()
+    assert numLevels > 2
+    assert pyramid.getLevelPolyData(0) is polyData
+    assert pyramid.numberOfPoints[0] == polyData.GetNumberOfPoints()
+
+    for level in xrange(1, numLevels):
+        assert pyramid.numberOfPoints[level] < pyramid.numberOfPoints[level-1]
+        assert pyramid.voxelSizes[level] > pyramid.voxelSizes[level-1]
+
+        levelPolyData = pyramid.getLevelPolyData(level)
+        assert levelPolyData is pyramid.getLevelPolyData(level)
+        assert levelPolyData.GetNumberOfPoints() == levelPolyData.GetNumberOfVerts() == pyramid.numberOfPoints[level]
+
+        # each level is a subset of the full cloud and keeps its point data
+        intensity = vnp.getNumpyFromVtk(levelPolyData, 'intensity').astype(int)
+        assert np.array_equal(vnp.getNumpyFromVtk(levelPolyData, 'Points'), vnp.getNumpyFromVtk(polyData, 'Points')[intensity])
+
+        # at most one point per voxel
+        coords = np.floor(vnp.getNumpyFromVtk(levelPolyData, 'Points') / pyramid.voxelSizes[level]).astype(int)
+        assert len(np.unique(coords.view([('', coords.dtype)]*3))) == len(coords)
+
+
+def testSelectLevel():
+
+    pyramid = VoxelPyramid(makePointCloud(), minimumNumberOfPoints=1000)
+    pixelSize = np.radians(30.0) / 1000
+
+    # close up with a large budget draws the full cloud
+    assert pyramid.selectLevel(0.0, pixelSize, 1e9) == 0
+
+    # the budget limits the number of points drawn
+    level = pyramid.selectLevel(0.0, pixelSize, 50000)
+    assert pyramid.numberOfPoints[level] <= 50000
+    assert pyramid.numberOfPoints[level-1] > 50000
+
+    # far away, voxels smaller than a pixel are merged
+    farLevel = pyramid.selectLevel(1e5, pixelSize, 1e9)
+    assert farLevel == pyramid.getNumberOfLevels() - 1
+
+
+def testPointDataChanges():
+
+    polyData = makePointCloud()
+    pyramid = VoxelPyramid(polyData, minimumNumberOfPoints=1000)
+    levelPolyData = pyramid.getLevelPolyData(1)
+
+    # an array added to the full cloud is extracted to the levels
+    vnp.addNumpyToVtk(polyData, np.ones(polyData.GetNumberOfPoints(), dtype=np.float32), 'rgb')
+    levelPolyData = pyramid.getLevelPolyData(1)
+    assert levelPolyData.GetPointData().GetArray('rgb') is not None
+    assert levelPolyData is pyramid.getLevelPolyData(1)
+
+    # modified values are extracted again
+    vnp.getNumpyFromVtk(polyData, 'rgb')[:] = 2.0
+    polyData.GetPointData().GetArray('rgb').Modified()
+    levelPolyData = pyramid.getLevelPolyData(1)
+    assert (vnp.getNumpyFromVtk(levelPolyData, 'rgb') == 2.0).all()
+
+
+def testSmallCloud():
+
+    pyramid = VoxelPyramid(makePointCloud(500))
+    assert pyramid.getNumberOfLevels() == 1
+    assert pyramid.selectLevel(100.0, 0.001, 10) == 0
+
+
+testPyramid()
+testSelectLevel()
+testPointDataChanges()
+testSmallCloud()
@@ -0,0 +1,86 @@
+from director import spatialindex
+from director import filterUtils
+from director import vtkNumpy as vnp
+from director.shallowCopy import shallowCopy
+import numpy as np
+import argparse
+import time
+
+
+def getRandomCloud(numPoints):
+    pts = np.random.rand(numPoints, 3) * [10.0, 10.0, 2.0]
+    pts[::1000] = np.nan
+    return pts
+
+
+def testQueries():
+
+    pts = getRandomCloud(200000)
+    polyData = vnp.numpyToPolyData(pts, pointData={'intensity': np.arange(len(pts), dtype=float)})
+    index = spatialindex.getSpatialIndex(polyData)
+    assert index is not None
+    assert spatialindex.getSpatialIndex(shallowCopy(polyData)) is index
+
+    with np.errstate(invalid='ignore'):
+
+        for center, radius in [((5, 5, 1), 0.5), ((0, 0, 0), 1.5), ((5, 5, 1), 20.0), ((50, 50, 50), 1.0)]:
+            pointIds, dists = index.queryRadius(center, radius)
+            expectedDists = np.sqrt(np.sum((pts - center)**2, axis=1))
+            assert np.array_equal(pointIds, np.flatnonzero(expectedDists <= radius))
+            assert np.allclose(dists, expectedDists[pointIds])
+
+        angle = np.radians(30)
+        axes = np.array([[np.cos(angle), np.sin(angle), 0], [-np.sin(angle), np.cos(angle), 0], [0, 0, 1]])
+        origin = np.array([4.0, 6.0, 1.0])
+        bounds = np.array([[-1.0, 2.0], [-0.5, 0.5], [0.0, 0.3]])
+        pointIds = index.queryOrientedBox(origin, axes, bounds)
+        dists = np.dot(pts - origin, axes.T)
+        expected = np.flatnonzero(((dists >= bounds[:,0]) & (dists <= bounds[:,1])).all(axis=1))
+        assert np.array_equal(pointIds, expected)
+
+    # the extracted points keep the point data, like thresholdPoints
+    cropped = filterUtils.extractPoints(polyData, pointIds)
+    assert cropped.GetNumberOfVerts() == len(pointIds)
+    assert np.array_equal(vnp.getNumpyFromVtk(cropped, 'intensity'), pointIds)
+
+    # modifying the points rebuilds the index
+    vnp.getNumpyFromVtk(polyData, 'Points')[:] += 1.0
+    polyData.GetPoints().GetData().Modified()
+    assert spatialindex.getSpatialIndex(polyData) is not index
+
+
+def benchmarkQueries(numPoints=2000000, numQueries=20):
+
+    pts = getRandomCloud(numPoints)
+    polyData = vnp.numpyToPolyData(pts)
+    centers = np.random.rand(numQueries, 3) * [10.0, 10.0, 2.0]
+
+    t = time.time()
+    with np.errstate(invalid='ignore'):
+        for center in centers:
+            np.flatnonzero(np.sum((pts - center)**2, axis=1) <= 0.25)
+    linearTime = time.time() - t
+
+    t = time.time()
+    index = spatialindex.getSpatialIndex(polyData)
+    buildTime = time.time() - t
+
+    t = time.time()
+    for center in centers:
+        index.queryRadius(center, 0.5)
+    indexTime = time.time() - t
+
+    print '%d points, %d radius queries:  linear %.3f s  index build %.3f s  indexed %.3f s' % (numPoints, numQueries, linearTime, buildTime, indexTime)
+
+
+def getArgs():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--benchmark', action='store_true', help='print timings of indexed and linear radius queries')
+    args, unknown = parser.parse_known_args()
+    return args
+
+
+testQueries()
+
+if getArgs().benchmark:
+    benchmarkQueries()
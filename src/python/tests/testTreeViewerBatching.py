@@ -0,0 +1,123 @@
+from director import consoleapp
+from director import objectmodel as om
+from director.treeviewer import TreeViewer
+import numpy as np
+import time
+
+
+def request(viewer, delete=(), setgeometry=(), settransform=()):
+    return viewer.handleViewerRequest(dict(
+        delete=[dict(path=path) for path in delete],
+        setgeometry=[dict(path=path, geometry=dict(type='box', lengths=[1, 1, 1])) for path in setgeometry],
+        settransform=[dict(path=path, transform=dict(translation=translation)) for path, translation in settransform]))
+
+
+def getGeometryItem(viewer, path):
+    return viewer.getPathFolder(path).findChild(path[-1])
+
+
+def getGeometryPosition(viewer, path):
+    item = getGeometryItem(viewer, path)
+    return np.array(item.actor.GetUserTransform().GetPosition())
+
+
+def waitForFlush(viewer, timeout=1.0):
+    startTime = time.time()
+    while viewer.flushScheduled and time.time() - startTime < timeout:
+        consoleapp.ConsoleApp.processEvents()
+        time.sleep(0.001)
+    assert not viewer.flushScheduled
+
+
+def testCoalescing():
+
+    viewer = TreeViewer(view)
+    viewer.resetStatistics()
+
+    request(viewer, setgeometry=[['a'], ['b']])
+    request(viewer, settransform=[(['a'], [1, 0, 0]), (['b'], [0, 1, 0])])
+    request(viewer, settransform=[(['a'], [2, 0, 0])])
+
+    # transforms wait for the flush, keeping the latest one of each path in
+    # the order their paths were first queued
+    assert viewer.flushScheduled
+    assert viewer.pendingTransforms.keys() == [('a',), ('b',)]
+    assert viewer.pendingTransforms[('a',)]['translation'] == [2, 0, 0]
+    assert np.allclose(getGeometryPosition(viewer, ['a']), [0, 0, 0])
+
+    waitForFlush(viewer)
+
+    assert not viewer.pendingTransforms
+    assert np.allclose(getGeometryPosition(viewer, ['a']), [2, 0, 0])
+    assert np.allclose(getGeometryPosition(viewer, ['b']), [0, 1, 0])
+
+    # one render for the three requests
+    stats = viewer.getStatistics()
+    assert stats['requests'] == 3
+    assert stats['renders'] == 1
+    assert stats['transforms_received'] == 3
+    assert stats['transforms_coalesced'] == 1
+    assert stats['transforms_applied'] == 2
+    assert stats['transforms_dropped'] == 0
+
+    om.removeFromObjectModel(viewer.getRootFolder())
+    viewer.disable()
+
+
+def testOrderingWithSetGeometry():
+
+    viewer = TreeViewer(view)
+    viewer.resetStatistics()
+
+    # setgeometry is applied immediately, before the queued transform of its
+    # path, and the geometry follows the transform when it is flushed
+    request(viewer, settransform=[(['robot'], [1, 0, 0])])
+    request(viewer, setgeometry=[['robot', 'link']])
+    assert getGeometryItem(viewer, ['robot', 'link']) is not None
+    assert np.allclose(getGeometryPosition(viewer, ['robot', 'link']), [0, 0, 0])
+
+    waitForFlush(viewer)
+    assert np.allclose(getGeometryPosition(viewer, ['robot', 'link']), [1, 0, 0])
+
+    # a transform queued for a path that is then deleted is dropped, and the
+    # flush does not create the path again
+    request(viewer, settransform=[(['robot', 'link'], [0, 1, 0]), (['other'], [0, 0, 1])])
+    request(viewer, delete=[['robot']])
+    assert viewer.pendingTransforms.keys() == [('other',)]
+
+    waitForFlush(viewer)
+    assert viewer.getRootFolder().findChild('robot') is None
+
+    stats = viewer.getStatistics()
+    assert stats['transforms_dropped'] == 1
+    assert stats['transforms_applied'] == 2
+    assert stats['renders'] == 2
+
+    om.removeFromObjectModel(viewer.getRootFolder())
+    viewer.disable()
+
+
+def testUnbatched():
+
+    viewer = TreeViewer(view)
+    viewer.batchTransforms = False
+    viewer.resetStatistics()
+
+    request(viewer, setgeometry=[['a']], settransform=[(['a'], [1, 0, 0])])
+    assert not viewer.pendingTransforms
+    assert np.allclose(getGeometryPosition(viewer, ['a']), [1, 0, 0])
+    assert viewer.getStatistics()['transforms_applied'] == 1
+
+    waitForFlush(viewer)
+    om.removeFromObjectModel(viewer.getRootFolder())
+    viewer.disable()
+
+
+app = consoleapp.ConsoleApp()
+view = app.createView()
+
+testCoalescing()
+testOrderingWithSetGeometry()
+testUnbatched()
+
+app.start()
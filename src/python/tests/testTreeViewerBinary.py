@@ -0,0 +1,51 @@
+from director import treeviewerbinary
+import numpy as np
+import json
+
+
+def testRoundTrip():
+
+    points = np.random.rand(1000, 3).astype(np.float32)
+    rgb = np.random.rand(1000, 3)
+    faces = np.random.randint(0, 1000, size=(50, 3))
+
+    data = {
+        "utime": 1486691399249288,
+        "delete": [],
+        "settransform": [],
+        "setgeometry": [
+            {
+                "path": ("perception", "cloud1"),
+                "geometries": [
+                    {"type": "pointcloud", "points": points, "channels": {"rgb": rgb}},
+                    {"type": "mesh_data", "vertices": points[:10].astype('>f8'), "faces": faces},
+                    {"type": "line", "points": [[0, 0, 0], [1, 0, 0]], "empty": np.zeros((0, 3))},
+                ]
+            }
+        ]
+    }
+
+    payload = treeviewerbinary.encode(data)
+    assert len(payload) % 8 == 0
+    decoded = treeviewerbinary.decode(str(payload))
+
+    assert decoded["utime"] == data["utime"]
+    assert decoded["setgeometry"][0]["path"] == ["perception", "cloud1"]
+
+    cloud, mesh, line = decoded["setgeometry"][0]["geometries"]
+    assert cloud["points"].dtype == np.float32
+    assert np.array_equal(cloud["points"], points)
+    assert np.array_equal(cloud["channels"]["rgb"], rgb)
+    assert np.array_equal(mesh["vertices"], points[:10])
+    assert mesh["vertices"].dtype == np.dtype('<f8')
+    assert np.array_equal(mesh["faces"], faces)
+    assert line["points"] == [[0, 0, 0], [1, 0, 0]]
+    assert line["empty"].shape == (0, 3)
+
+    # the binary payload is much smaller than the equivalent json
+    jsonPayload = json.dumps(data, default=lambda x: x.tolist())
+    print 'binary: %d bytes  json: %d bytes' % (len(payload), len(jsonPayload))
+    assert len(payload) < len(jsonPayload)
+
+
+testRoundTrip()
@@ -5,7 +5,7 @@ import subprocess
 import numpy as np
 import lcm
 from director.thirdparty import transformations
-from director.viewerclient import Visualizer, Box, GeometryData, Sphere, PointCloud, PolyLine
+from director.viewerclient import Visualizer, Box, GeometryData, Sphere, PointCloud, PolyLine, TriangularMesh
 
 
 if __name__ == '__main__':
@@ -59,6 +59,10 @@ if __name__ == '__main__':
         np.random.rand(10, 3),
         {"rgb": np.random.rand(10, 3)}))
 
+    vis["mesh"].setgeometry(TriangularMesh(
+        vertices=np.random.rand(10, 3),
+        faces=np.random.randint(0, 10, size=(20, 3))))
+
     vis["polyline"].setgeometry(PolyLine(
         points=np.random.rand(15, 3),
         end_head=True))
@@ -0,0 +1,122 @@
+from director import consoleapp
+from director import objectmodel as om
+from director.treeviewer import TreeViewer
+import numpy as np
+
+
+def request(viewer, delete=(), setgeometry=(), settransform=()):
+    return viewer.handleViewerRequest(dict(
+        delete=[dict(path=path) for path in delete],
+        setgeometry=[dict(path=path, geometry=dict(type='box', lengths=[1, 1, 1])) for path in setgeometry],
+        settransform=[dict(path=path, transform=dict(translation=translation)) for path, translation in settransform]))
+
+
+def getGeometryPosition(viewer, path):
+    item = viewer.findPathNode(path).geometryItem
+    return np.array(item.actor.GetUserTransform().GetPosition())
+
+
+def getChildNames(folder):
+    return [child.getProperty('Name') for child in folder.children()]
+
+
+def testExistingFolders():
+
+    # folders left under the root folder are reused, not duplicated
+    rootFolder = om.getOrCreateContainer(TreeViewer.name.lower(), parentObj=om.findObjectByName('scene'))
+    robotFolder = om.addContainer('robot', parentObj=rootFolder)
+
+    viewer = TreeViewer(view)
+    assert viewer.findPathNode(['robot']).item is robotFolder
+
+    node = viewer.getPathNode(['robot', 'link'])
+    assert node.parent.item is robotFolder
+    assert getChildNames(rootFolder) == ['robot']
+    assert getChildNames(robotFolder) == ['link']
+
+    om.removeFromObjectModel(rootFolder)
+    viewer.disable()
+
+
+def testPathTrie():
+
+    viewer = TreeViewer(view)
+    viewer.batchTransforms = False
+
+    node = viewer.getPathNode(['a', 'b', 'c'])
+    assert node.getPath() == ['a', 'b', 'c']
+    assert viewer.getPathNode(['a', 'b', 'c']) is node
+    assert viewer.findPathNode(['a', 'b', 'c']) is node
+    assert viewer.getPathForItem(node.item) == ['a', 'b', 'c']
+
+    # finding a path does not create it
+    assert viewer.findPathNode(['a', 'x']) is None
+    assert getChildNames(viewer.findPathNode(['a']).item) == ['b']
+
+    om.removeFromObjectModel(viewer.getRootFolder())
+    viewer.disable()
+
+
+def testWorldTransforms():
+
+    viewer = TreeViewer(view)
+    viewer.batchTransforms = False
+
+    request(viewer, setgeometry=[['robot', 'link']],
+            settransform=[(['robot'], [1, 0, 0]), (['robot', 'link'], [0, 2, 0])])
+    assert np.allclose(getGeometryPosition(viewer, ['robot', 'link']), [1, 2, 0])
+
+    # the cached world transform follows changes of an ancestor
+    request(viewer, settransform=[(['robot'], [3, 0, 0])])
+    assert np.allclose(getGeometryPosition(viewer, ['robot', 'link']), [3, 2, 0])
+
+    # geometry added under a transformed folder starts at its world transform
+    request(viewer, setgeometry=[['robot', 'link', 'tool']])
+    assert np.allclose(getGeometryPosition(viewer, ['robot', 'link', 'tool']), [3, 2, 0])
+
+    om.removeFromObjectModel(viewer.getRootFolder())
+    viewer.disable()
+
+
+def testRemoval():
+
+    viewer = TreeViewer(view)
+    viewer.batchTransforms = False
+
+    request(viewer, setgeometry=[['robot', 'link']],
+            settransform=[(['robot'], [1, 0, 0]), (['robot', 'link'], [0, 2, 0])])
+    linkNode = viewer.findPathNode(['robot', 'link'])
+
+    # deleting a path removes the nodes of the path and its descendants
+    request(viewer, delete=[['robot']])
+    assert viewer.findPathNode(['robot']) is None
+    assert linkNode.item not in viewer.itemToNode
+    assert 'robot' not in viewer.getRootNode().children
+
+    # a path added again gets new folders and world transforms
+    request(viewer, setgeometry=[['robot', 'link']])
+    assert viewer.findPathNode(['robot', 'link']) is not linkNode
+    assert np.allclose(getGeometryPosition(viewer, ['robot', 'link']), [0, 0, 0])
+
+    # folders removed from the object model directly are dropped as well
+    om.removeFromObjectModel(viewer.findPathNode(['robot']).item)
+    assert viewer.findPathNode(['robot']) is None
+
+    rootFolder = viewer.getRootFolder()
+    om.removeFromObjectModel(rootFolder)
+    assert viewer.rootNode is None
+    assert viewer.getRootFolder() is not rootFolder
+
+    om.removeFromObjectModel(viewer.getRootFolder())
+    viewer.disable()
+
+
+app = consoleapp.ConsoleApp()
+view = app.createView()
+
+testExistingFolders()
+testPathTrie()
+testWorldTransforms()
+testRemoval()
+
+app.start()
@@ -0,0 +1,216 @@
+import os
+import sys
+import shutil
+import tempfile
+import lcm
+import numpy as np
+
+from director import lcmlogindex
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+import videoLogServer
+
+
+def writeEvents(filename, startTime, numEvents, mode='w'):
+    '''
+    Writes events alternating between the VIDEO and OTHER channels, one
+    millisecond apart.
+    '''
+    log = lcm.EventLog(filename, mode)
+    for i in xrange(numEvents):
+        channel = 'VIDEO' if i % 2 == 0 else 'OTHER'
+        log.write_event(startTime + i*1000, channel, channel + str(i))
+    log.close()
+
+
+def testCatalogGrowth():
+
+    catalog = videoLogServer.FrameCatalog()
+    logId = catalog.addLog('lcmlog-00')
+    initialCapacity = len(catalog.frames)
+
+    utimes = np.arange(3000, dtype=np.int64) * 1000
+    frames = None
+    for start in xrange(0, len(utimes), 500):
+        catalog.append(logId, utimes[start:start+500], utimes[start:start+500] + 7)
+        if frames is None:
+            frames = catalog.getFrames()
+
+    # the buffer doubled to fit the frames
+    assert len(catalog) == 3000
+    assert len(catalog.frames) == initialCapacity*4
+    assert np.array_equal(catalog.getFrames()['utime'], utimes)
+    assert np.array_equal(catalog.getFrames()['filepos'], utimes + 7)
+    assert (catalog.getFrames()['log'] == logId).all()
+
+    # frames taken before the buffer grew are unchanged
+    assert np.array_equal(frames['utime'], utimes[:500])
+
+    # appending nothing is a no-op
+    catalog.append(logId, [], [])
+    assert len(catalog) == 3000
+
+
+def testCatalogCrop():
+
+    catalog = videoLogServer.FrameCatalog()
+    logId = catalog.addLog('lcmlog-00')
+    capacity = len(catalog.frames)
+
+    # one frame per second for 1000 seconds
+    utimes = np.arange(1000, dtype=np.int64) * 1000000
+    catalog.append(logId, utimes, utimes)
+    frames = catalog.getFrames()
+
+    catalog.crop(100)
+    assert len(catalog) == 101
+    assert np.array_equal(catalog.getFrames()['utime'], utimes[-101:])
+    assert np.array_equal(frames['utime'], utimes)
+
+    # cropped frames are dropped when the buffer is copied, so the buffer
+    # only grows for the frames that are kept
+    moreUtimes = utimes[-1] + np.arange(1, capacity - 110, dtype=np.int64) * 1000000
+    catalog.append(logId, moreUtimes, moreUtimes)
+    assert len(catalog.frames) == capacity
+    assert catalog.start == 0
+    assert np.array_equal(catalog.getFrames()['utime'], np.concatenate([utimes[-101:], moreUtimes]))
+
+    # cropping an empty catalog does nothing
+    emptyCatalog = videoLogServer.FrameCatalog()
+    emptyCatalog.crop(10)
+    assert len(emptyCatalog) == 0
+
+
+def testSidecarReuse():
+
+    logDir = tempfile.mkdtemp()
+    try:
+        logFiles = [os.path.join(logDir, 'lcmlog-2014-04-16.%02d' % i) for i in xrange(2)]
+        for i, filename in enumerate(logFiles):
+            writeEvents(filename, i*1000000, 100)
+
+        catalogThread = videoLogServer.CatalogThread(logDir, 'VIDEO')
+        catalogThread.pruneEnabled = False
+        catalogThread.updateCatalog()
+
+        frames = catalogThread.frameCatalog.getFrames()
+        assert len(frames) == 100
+        assert (frames['utime'][1:] > frames['utime'][:-1]).all()
+
+        # the sidecar index files are written next to the logs and are not
+        # cataloged as logs
+        for filename in logFiles:
+            for indexFilename in lcmlogindex.getIndexFilenames(filename):
+                assert os.path.isfile(indexFilename)
+        assert catalogThread.getExistingLogFiles(logDir) == logFiles
+
+        # a restarted catalog loads the saved index instead of scanning
+        catalogThread = videoLogServer.CatalogThread(logDir, 'VIDEO')
+        catalogThread.pruneEnabled = False
+        catalogThread.updateCatalog()
+        for filename in logFiles:
+            assert catalogThread.catalog[filename].logIndex.loadedFromCache
+        assert np.array_equal(catalogThread.frameCatalog.getFrames(), frames)
+
+        # events appended to the last log are cataloged, and its index is
+        # saved once saveInterval has passed
+        writeEvents(logFiles[-1], 2000000, 10, mode='a')
+        catalogThread.updateCatalog()
+        assert len(catalogThread.frameCatalog) == 105
+        assert not catalogThread.catalog[logFiles[-1]].saved
+
+        catalogThread.saveInterval = 0.0
+        catalogThread.updateCatalog()
+        assert catalogThread.catalog[logFiles[-1]].saved
+
+        logIndex = lcmlogindex.LcmLogIndex(logFiles[-1])
+        logIndex.load()
+        assert logIndex.loadedFromCache
+        assert logIndex.getNumberOfEvents() == 110
+
+    finally:
+        shutil.rmtree(logDir)
+
+
+def testPruning():
+
+    logDir = tempfile.mkdtemp()
+    try:
+        logFiles = [os.path.join(logDir, 'lcmlog-2014-04-16.%d' % i) for i in xrange(3, 12, 4)]
+        for i, filename in enumerate(logFiles):
+            writeEvents(filename, i*1000000, 10)
+
+        # logs are ordered by the numbers in their names
+        assert videoLogServer.CatalogThread.getExistingLogFiles(logDir) == logFiles
+
+        catalogThread = videoLogServer.CatalogThread(logDir, 'VIDEO')
+        catalogThread.updateCatalog()
+        assert sorted(catalogThread.catalog.keys()) == sorted(logFiles)
+
+        # the oldest logs are deleted with their sidecar files, and dropped
+        # from the catalog
+        catalogThread.maxNumberOfFiles = 1
+        catalogThread.updateCatalog()
+        assert catalogThread.catalog.keys() == logFiles[-1:]
+        assert sorted(os.listdir(logDir)) == sorted(
+            [os.path.basename(f) for f in [logFiles[-1]] + list(lcmlogindex.getIndexFilenames(logFiles[-1]))])
+
+    finally:
+        shutil.rmtree(logDir)
+
+
+def testFrameCacheEviction():
+
+    cache = videoLogServer.FrameCache(maxBytes=100)
+    for i in xrange(4):
+        cache.add(i, 'frame%d' % i, 30)
+
+    # the least recently added frame is evicted to stay within maxBytes
+    assert cache.get(0) is None
+    assert [cache.get(i) for i in xrange(1, 4)] == ['frame1', 'frame2', 'frame3']
+    assert cache.getStatistics()['bytes'] == 90
+
+    # a get makes a frame the most recently used
+    cache.get(1)
+    cache.add(4, 'frame4', 30)
+    assert cache.get(2, countStatistics=False) is None
+    assert cache.get(1, countStatistics=False) == 'frame1'
+
+    # adding a cached key does not replace it or count its size twice
+    cache.add(4, 'other', 30)
+    assert cache.get(4, countStatistics=False) == 'frame4'
+    assert cache.getStatistics()['bytes'] == 90
+
+    # a frame larger than maxBytes is kept alone
+    cache.add(5, 'large', 500)
+    stats = cache.getStatistics()
+    assert stats['frames'] == 1 and stats['bytes'] == 500
+    assert cache.get(5, countStatistics=False) == 'large'
+
+
+def testFrameCacheStatistics():
+
+    cache = videoLogServer.FrameCache()
+    assert cache.getStatistics()['hitRate'] == 0.0
+
+    cache.add('a', 'frameA', 10)
+    assert cache.get('a') == 'frameA'
+    assert cache.get('a') == 'frameA'
+    assert cache.get('b') is None
+    assert cache.get('a', countStatistics=False) == 'frameA'
+    assert cache.get('b', countStatistics=False) is None
+
+    stats = cache.getStatistics()
+    assert stats['hits'] == 2
+    assert stats['misses'] == 1
+    assert np.isclose(stats['hitRate'], 2/3.0)
+    assert stats['frames'] == 1
+    assert stats['bytes'] == 10
+
+
+testCatalogGrowth()
+testCatalogCrop()
+testSidecarReuse()
+testPruning()
+testFrameCacheEviction()
+testFrameCacheStatistics()
@@ -0,0 +1,137 @@
+from director import vtkNumpy as vnp
+from director import vtkAll as vtk
+import numpy as np
+import argparse
+import time
+
+
+def getCellArrayFromLoop(faces):
+    '''
+    The per-triangle loop previously used by the mesh decoders.
+    '''
+    cells = vtk.vtkCellArray()
+    for face in faces:
+        tri = vtk.vtkTriangle()
+        tri.GetPointIds().SetId(0, face[0])
+        tri.GetPointIds().SetId(1, face[1])
+        tri.GetPointIds().SetId(2, face[2])
+        cells.InsertNextCell(tri)
+    return cells
+
+
+def getCellPointIds(polyData, cellId):
+    ids = vtk.vtkIdList()
+    polyData.GetCellPoints(cellId, ids)
+    return [ids.GetId(i) for i in xrange(ids.GetNumberOfIds())]
+
+
+def makeMesh(numPoints, numTris):
+    pts = np.random.rand(numPoints, 3)
+    faces = np.random.randint(0, numPoints, size=(numTris, 3))
+    return pts, faces
+
+
+def testTriangles():
+
+    pts, faces = makeMesh(100, 200)
+    polyData = vtk.vtkPolyData()
+    polyData.SetPoints(vnp.getVtkPointsFromNumpy(pts))
+    polyData.SetPolys(vnp.getVtkCellArrayFromNumpyCells(faces))
+
+    assert polyData.GetNumberOfCells() == len(faces)
+    for cellId in xrange(len(faces)):
+        assert getCellPointIds(polyData, cellId) == list(faces[cellId])
+
+
+def testMixedCells():
+
+    pts = np.random.rand(10, 3)
+    connectivity = np.array([0, 1, 2, 3, 4, 5, 6, 7, 8, 9])
+    offsets = np.array([0, 3, 7, 10])
+
+    polyData = vtk.vtkPolyData()
+    polyData.SetPoints(vnp.getVtkPointsFromNumpy(pts))
+    polyData.SetPolys(vnp.getVtkCellArrayFromNumpy(connectivity, offsets))
+
+    assert polyData.GetNumberOfCells() == 3
+    assert getCellPointIds(polyData, 0) == [0, 1, 2]
+    assert getCellPointIds(polyData, 1) == [3, 4, 5, 6]
+    assert getCellPointIds(polyData, 2) == [7, 8, 9]
+
+
+def benchmarkTriangles(numTris=500000):
+
+    pts, faces = makeMesh(numTris/2, numTris)
+
+    t = time.time()
+    loopCells = getCellArrayFromLoop(faces)
+    loopTime = time.time() - t
+
+    t = time.time()
+    bulkCells = vnp.getVtkCellArrayFromNumpyCells(faces)
+    bulkTime = time.time() - t
+
+    assert loopCells.GetNumberOfCells() == bulkCells.GetNumberOfCells() == numTris
+
+    print '%d triangles:  loop %.3f s  bulk %.3f s  speedup %.1fx' % (numTris, loopTime, bulkTime, loopTime / max(bulkTime, 1e-6))
+
+
+def testPointCloudNoCopy():
+
+    pts = np.random.rand(1000, 3)
+    intensity = np.random.rand(1000)
+
+    polyData = vnp.numpyToPolyData(pts, pointData={'intensity': intensity}, copy=False)
+    assert polyData.GetNumberOfPoints() == polyData.GetNumberOfVerts() == len(pts)
+    assert getCellPointIds(polyData, 10) == [10]
+
+    # the points are shared with the numpy array, not copied
+    pts[0] = [1.0, 2.0, 3.0]
+    assert np.array_equal(vnp.getNumpyFromVtk(polyData, 'Points')[0], [1.0, 2.0, 3.0])
+    assert np.array_equal(vnp.getNumpyFromVtk(polyData, 'intensity'), intensity)
+
+    # the polydata keeps the wrapped arrays alive
+    del pts, intensity
+    assert vnp.getNumpyFromVtk(polyData, 'Points').shape == (1000, 3)
+
+    # non-contiguous arrays are copied to contiguous arrays
+    pts = np.random.rand(3, 1000).T
+    polyData = vnp.numpyToPolyData(pts, copy=False)
+    assert np.array_equal(vnp.getNumpyFromVtk(polyData, 'Points'), pts)
+
+    copied = vnp.numpyToPolyData(pts)
+    assert copied.GetNumberOfVerts() == polyData.GetNumberOfVerts()
+
+
+def benchmarkPointCloud(numPoints=1000000):
+
+    pts = np.random.rand(numPoints, 3)
+    rgb = np.random.randint(0, 255, size=(numPoints, 3)).astype(np.uint8)
+
+    t = time.time()
+    copied = vnp.numpyToPolyData(pts, pointData={'rgb': rgb})
+    copyTime = time.time() - t
+
+    t = time.time()
+    wrapped = vnp.numpyToPolyData(pts, pointData={'rgb': rgb}, copy=False)
+    noCopyTime = time.time() - t
+
+    assert copied.GetNumberOfVerts() == wrapped.GetNumberOfVerts() == numPoints
+
+    print '%d points:  copy %.3f s  no copy %.3f s  speedup %.1fx' % (numPoints, copyTime, noCopyTime, copyTime / max(noCopyTime, 1e-6))
+
+
+def getArgs():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--benchmark', action='store_true', help='print timings of the bulk conversions')
+    args, unknown = parser.parse_known_args()
+    return args
+
+
+testTriangles()
+testMixedCells()
+testPointCloudNoCopy()
+
+if getArgs().benchmark:
+    benchmarkTriangles()
+    benchmarkPointCloud()
@@ -324,6 +324,19 @@ public:
     }
   }
 
+  vtkIdType GetScanTimeForScanLine(int scanLine)
+  {
+    std::lock_guard<std::mutex> lock(this->Mutex);
+    for (std::deque<ScanLineData>::const_iterator itr = this->ScanLines.begin(); itr != this->ScanLines.end(); ++itr)
+    {
+      if (itr->ScanLineId == scanLine)
+      {
+        return itr->msg.utime;
+      }
+    }
+    return -1;
+  }
+
   void GetScanLinesForRevolution(std::vector<ScanLineData>& scanLines, int revolution)
   {
     std::lock_guard<std::mutex> lock(this->Mutex);
@@ -675,6 +688,12 @@ vtkIdType vtkMultisenseSource::GetCurrentScanTime()
   return this->Internal->Listener->GetCurrentScanTime();
 }
 
+//-----------------------------------------------------------------------------
+vtkIdType vtkMultisenseSource::GetScanTimeForScanLine(int scanLine)
+{
+  return this->Internal->Listener->GetScanTimeForScanLine(scanLine);
+}
+
 //-----------------------------------------------------------------------------
 int vtkMultisenseSource::GetCurrentRevolution()
 {
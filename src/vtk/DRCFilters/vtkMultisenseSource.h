@@ -55,6 +55,9 @@ public:
   void GetDataForScanLine(int scanLine, vtkPolyData* polyData);
   vtkIdType GetCurrentScanTime();
 
+  // Returns the utime of the scan line, or -1 if it is no longer buffered.
+  vtkIdType GetScanTimeForScanLine(int scanLine);
+
   void InitBotConfig(const char* filename);
 
   void GetTransform(const char* fromFrame, const char* toFrame, vtkIdType utime, vtkTransform* transform);